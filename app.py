@@ -2,28 +2,35 @@
 CrypSync - Cryptocurrency Real-Time Price Tracker
 Main Flask application entry point
 """
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response
 from functools import wraps
 import os
+import threading
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
 # Initialize database
-from database import init_database, create_admin_user
+from database import init_database, create_admin_user, get_user_data_version
 init_database()
 create_admin_user()  # Create default admin user
 
 # Import services
 from services.auth_service import AuthService
 from services.price_service import PriceService
+from services.price_refresher import PriceRefresher
+from services.shared_price_store import SharedPriceStore
+from services.price_stream import PriceStream
 from services.alert_service import AlertService
 from services.historical_service import HistoricalService
 from services.visualization_service import VisualizationService
 from services.portfolio_service_db import PortfolioService
 from services.admin_service import AdminService
 from services.system_service import SystemService
+from services.market_service import MarketService
+from services.api_routes import conditional_json, register_market_routes, register_history_routes
+from services.history_backfill import HistoryBackfill
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -37,7 +44,56 @@ historical_service = HistoricalService()
 visualization_service = VisualizationService()
 portfolio_service = PortfolioService()
 admin_service = AdminService()
-system_service = SystemService()
+market_service = MarketService(price_service)
+system_service = SystemService(price_service, market_service)
+
+# Price source: 'inline' polls CoinGecko from the web workers,
+# 'daemon' only reads what `python -m services.price_daemon` ingests
+PRICE_SOURCE = os.getenv('PRICE_SOURCE', 'inline').lower()
+
+# Share quotes, rate-limit budget and refresh lease across worker processes
+if PRICE_SOURCE == 'daemon' or os.getenv('PRICE_SHARED_STORE', 'true').lower() == 'true':
+    price_service.use_shared_store(SharedPriceStore(os.getenv('PRICE_STORE_PATH')))
+if PRICE_SOURCE == 'daemon':
+    price_service.upstream_enabled = False
+
+# Stale-while-revalidate: quotes up to this age are served immediately and refreshed in the background
+price_service.max_stale_age = int(os.getenv('PRICE_MAX_STALE_AGE', 300))
+
+# Warm start: reload the last saved price cache so a fresh worker serves prices from its first request
+PRICE_CACHE_FILE = os.getenv('PRICE_CACHE_FILE', 'price_cache.json')
+if PRICE_CACHE_FILE:
+    price_service.enable_persistence(PRICE_CACHE_FILE)
+
+# Days of market_chart history loaded for a newly tracked coin (0 disables)
+HISTORY_BACKFILL_DAYS = int(os.getenv('HISTORY_BACKFILL_DAYS', 90))
+history_backfill = HistoryBackfill(historical_service, market_service)
+
+# Background price refresher: request threads read its snapshot instead of calling CoinGecko
+def record_price_history(prices):
+    historical_service.store_price_snapshots({crypto_id: quote['price_usd'] for crypto_id, quote in prices.items()})
+
+def get_price_universe():
+    return set(admin_service.get_price_universe()) | alert_service.get_alerted_coins()
+
+price_refresher = PriceRefresher(
+    price_service,
+    universe_provider=get_price_universe,
+    interval=int(os.getenv('PRICE_REFRESH_INTERVAL', 30)),
+    follower_only=PRICE_SOURCE == 'daemon'
+)
+price_refresher.add_listener(record_price_history)
+if os.getenv('PRICE_REFRESHER_ENABLED', 'true').lower() == 'true':
+    price_refresher.start()
+
+# Server-Sent Events: each published snapshot is pushed to /api/prices/stream subscribers
+price_stream = PriceStream(
+    price_service,
+    heartbeat_interval=int(os.getenv('PRICE_STREAM_HEARTBEAT', 15)),
+    # Defaults to half the gunicorn worker's threads (each stream holds one), see services/price_stream.py
+    max_subscribers=int(os.environ['PRICE_STREAM_MAX_SUBSCRIBERS']) if os.getenv('PRICE_STREAM_MAX_SUBSCRIBERS') else None
+)
+system_service.price_stream = price_stream
 
 # Mock notification service for local development
 class MockNotificationService:
@@ -137,8 +193,27 @@ def analyst_dashboard():
 @login_required
 def get_prices():
     crypto_ids = request.args.get('ids', 'bitcoin,ethereum').split(',')
-    result = price_service.get_current_prices(crypto_ids)
-    return jsonify(result)
+    price_version = price_service.get_price_version(crypto_ids)
+    etag = f"prices-{price_version}" if price_version else None
+    return conditional_json(etag, lambda: price_service.get_current_prices(crypto_ids))
+
+@app.route('/api/prices/stream')
+@login_required
+def stream_prices():
+    crypto_ids = request.args.get('ids', 'bitcoin,ethereum').split(',')
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('lastEventId'))
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    
+    if not price_stream.try_subscribe():
+        return jsonify({'success': False, 'error': 'STREAM_FULL', 'message': 'Too many price stream subscribers, poll /api/prices instead'}), 503
+    
+    response = Response(price_stream.stream(crypto_ids, last_event_id), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(price_stream.unsubscribe)
+    return response
+
+# Market data gateway: browser pages read CoinGecko market data through the server-side cache
+register_market_routes(app, market_service)
 
 @app.route('/api/alerts', methods=['GET', 'POST', 'DELETE'])
 @login_required
@@ -164,17 +239,8 @@ def manage_alerts():
         result = alert_service.delete_alert(alert_id, user_id)
         return jsonify(result)
 
-@app.route('/api/historical')
-@login_required
-def get_historical():
-    crypto_id = request.args.get('crypto_id', 'bitcoin')
-    days = int(request.args.get('days', 7))
-    
-    result = historical_service.get_historical_data(crypto_id, days)
-    if result['success']:
-        chart_data = visualization_service.prepare_chart_data(result['data'])
-        return jsonify({'success': True, 'data': chart_data})
-    return jsonify(result)
+# Historical price series and multi-coin comparison
+register_history_routes(app, historical_service, price_service, visualization_service, login_required)
 
 @app.route('/historical')
 @login_required
@@ -214,19 +280,25 @@ def crypto_detail(crypto_id):
 @login_required
 def get_portfolio():
     user_id = session['user_id']
-    result = portfolio_service.get_user_portfolio(user_id)
+    price_version = price_service.get_price_version()
+    etag = f"portfolio-{user_id}-{get_user_data_version(user_id)}-{price_version}" if price_version else None
     
-    if result['success'] and result['portfolio']:
-        # Get current prices for portfolio value calculation
-        crypto_ids = list(result['portfolio'].keys())
-        prices_result = price_service.get_current_prices(crypto_ids)
+    def build():
+        result = portfolio_service.get_user_portfolio(user_id)
         
-        if prices_result['success']:
-            current_prices = {k: v['price_usd'] for k, v in prices_result['data'].items()}
-            value_result = portfolio_service.get_portfolio_value(user_id, current_prices)
-            result['portfolio_value'] = value_result
+        if result['success'] and result['portfolio']:
+            # Get current prices for portfolio value calculation
+            crypto_ids = list(result['portfolio'].keys())
+            prices_result = price_service.get_current_prices(crypto_ids)
+            
+            if prices_result['success']:
+                current_prices = {k: v['price_usd'] for k, v in prices_result['data'].items()}
+                value_result = portfolio_service.get_portfolio_value(user_id, current_prices)
+                result['portfolio_value'] = value_result
+        
+        return result
     
-    return jsonify(result)
+    return conditional_json(etag, build)
 
 @app.route('/api/portfolio/buy', methods=['POST'])
 @login_required
@@ -289,8 +361,8 @@ def sell_crypto():
 def get_transactions():
     user_id = session['user_id']
     limit = int(request.args.get('limit', 50))
-    result = portfolio_service.get_transaction_history(user_id, limit)
-    return jsonify(result)
+    etag = f"transactions-{user_id}-{limit}-{get_user_data_version(user_id)}"
+    return conditional_json(etag, lambda: portfolio_service.get_transaction_history(user_id, limit))
 
 # Portfolio Alert endpoints (Scenario 1)
 @app.route('/api/portfolio/alerts', methods=['GET', 'POST', 'DELETE'])
@@ -360,6 +432,9 @@ def add_coin():
         data['symbol'],
         session['user_id']
     )
+    if result['success'] and HISTORY_BACKFILL_DAYS and price_service.upstream_enabled:
+        # Seed the new coin's charts without holding up the request
+        threading.Thread(target=history_backfill.run, args=([data['coin_id']], HISTORY_BACKFILL_DAYS), daemon=True).start()
     return jsonify(result)
 
 @app.route('/api/admin/coins/remove', methods=['POST'])
@@ -3,7 +3,7 @@ CrypSync - AWS Production Application
 Flask application configured for AWS Elastic Beanstalk deployment
 """
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response
 from functools import wraps
 import os
 from dotenv import load_dotenv
@@ -29,12 +29,17 @@ cloudwatch = boto3.client('cloudwatch', region_name=os.getenv('AWS_REGION', 'us-
 # Import services
 from services.auth_service_aws import AuthServiceAWS
 from services.price_service import PriceService
+from services.price_refresher import PriceRefresher
+from services.shared_price_store import SharedPriceStore
+from services.price_stream import PriceStream
 from services.alert_service_aws import AlertServiceAWS
 from services.historical_service_aws import HistoricalServiceAWS
 from services.visualization_service import VisualizationService
 from services.notification_service import NotificationService
 from services.portfolio_service_aws import PortfolioServiceAWS
 from services.admin_service_aws import AdminServiceAWS
+from services.market_service import MarketService
+from services.api_routes import conditional_json, register_market_routes, register_history_routes
 
 # Initialize Flask app
 application = Flask(__name__)
@@ -54,6 +59,48 @@ visualization_service = VisualizationService()
 notification_service = NotificationService(ses)
 portfolio_service = PortfolioServiceAWS(dynamodb)
 admin_service = AdminServiceAWS(dynamodb)
+market_service = MarketService(price_service)
+
+# Price source: 'inline' polls CoinGecko from the web workers,
+# 'daemon' only reads what `python -m services.price_daemon` ingests
+PRICE_SOURCE = os.getenv('PRICE_SOURCE', 'inline').lower()
+
+# Share quotes, rate-limit budget and refresh lease across worker processes
+if PRICE_SOURCE == 'daemon' or os.getenv('PRICE_SHARED_STORE', 'false').lower() == 'true':
+    price_service.use_shared_store(SharedPriceStore(os.getenv('PRICE_STORE_PATH')))
+if PRICE_SOURCE == 'daemon':
+    price_service.upstream_enabled = False
+
+# Stale-while-revalidate: quotes up to this age are served immediately and refreshed in the background
+price_service.max_stale_age = int(os.getenv('PRICE_MAX_STALE_AGE', 300))
+
+# Warm start: reload the last saved price cache so a fresh worker serves prices from its first request
+PRICE_CACHE_FILE = os.getenv('PRICE_CACHE_FILE', '/tmp/crypsync-price-cache.json')
+if PRICE_CACHE_FILE:
+    price_service.enable_persistence(PRICE_CACHE_FILE)
+
+# Background price refresher: request threads read its snapshot instead of calling CoinGecko
+def record_price_history(prices):
+    historical_service.store_price_snapshots({crypto_id: quote['price_usd'] for crypto_id, quote in prices.items()})
+
+PRICE_UNIVERSE = [c for c in os.getenv('PRICE_UNIVERSE', 'bitcoin,ethereum,cardano,solana,ripple').split(',') if c]
+price_refresher = PriceRefresher(
+    price_service,
+    universe_provider=lambda: PRICE_UNIVERSE,
+    interval=int(os.getenv('PRICE_REFRESH_INTERVAL', 30)),
+    follower_only=PRICE_SOURCE == 'daemon'
+)
+price_refresher.add_listener(record_price_history)
+if os.getenv('PRICE_REFRESHER_ENABLED', 'true').lower() == 'true':
+    price_refresher.start()
+
+# Server-Sent Events: each published snapshot is pushed to /api/prices/stream subscribers
+price_stream = PriceStream(
+    price_service,
+    heartbeat_interval=int(os.getenv('PRICE_STREAM_HEARTBEAT', 15)),
+    # Defaults to half the gunicorn worker's threads (each stream holds one), see services/price_stream.py
+    max_subscribers=int(os.environ['PRICE_STREAM_MAX_SUBSCRIBERS']) if os.getenv('PRICE_STREAM_MAX_SUBSCRIBERS') else None
+)
 
 # Authentication decorator
 def login_required(f):
@@ -141,18 +188,31 @@ def dashboard():
 @login_required
 def get_prices():
     crypto_ids = request.args.get('ids', 'bitcoin,ethereum').split(',')
-    result = price_service.get_current_prices(crypto_ids)
-    
-    # Store prices in historical database
-    if result['success']:
-        for crypto_id, price_data in result['data'].items():
-            historical_service.store_price_snapshot(
-                crypto_id,
-                price_data['price_usd']
-            )
+    price_version = price_service.get_price_version(crypto_ids)
+    etag = f"prices-{price_version}" if price_version else None
     
+    # Historical snapshots are recorded by the price refresher / ingestion daemon
     send_metric('PriceAPICall', 1)
-    return jsonify(result)
+    return conditional_json(etag, lambda: price_service.get_current_prices(crypto_ids))
+
+@application.route('/api/prices/stream')
+@login_required
+def stream_prices():
+    crypto_ids = request.args.get('ids', 'bitcoin,ethereum').split(',')
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('lastEventId'))
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    
+    if not price_stream.try_subscribe():
+        return jsonify({'success': False, 'error': 'STREAM_FULL', 'message': 'Too many price stream subscribers, poll /api/prices instead'}), 503
+    
+    send_metric('PriceStreamSubscribe', 1)
+    response = Response(price_stream.stream(crypto_ids, last_event_id), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(price_stream.unsubscribe)
+    return response
+
+# Market data gateway: browser pages read CoinGecko market data through the server-side cache
+register_market_routes(application, market_service)
 
 @application.route('/api/alerts', methods=['GET', 'POST', 'DELETE'])
 @login_required
@@ -179,85 +239,83 @@ def manage_alerts():
         result = alert_service.delete_alert(alert_id, user_id)
         return jsonify(result)
 
-@application.route('/api/historical')
-@login_required
-def get_historical():
-    crypto_id = request.args.get('crypto_id', 'bitcoin')
-    days = int(request.args.get('days', 7))
-    
-    result = historical_service.get_historical_data(crypto_id, days)
-    if result['success']:
-        chart_data = visualization_service.prepare_chart_data(result['data'])
-        return jsonify({'success': True, 'data': chart_data})
-    return jsonify(result)
+# Historical price series and multi-coin comparison
+register_history_routes(application, historical_service, price_service, visualization_service, login_required)
 
 @application.route('/api/portfolio', methods=['GET'])
 @login_required
 def get_portfolio():
-    try:
-        user_id = session['user_id']
-        result = portfolio_service.get_user_portfolio(user_id)
-        
-        if not result['success']:
-            return jsonify(result)
-        
-        # Get current prices for all holdings
-        holdings = result.get('holdings', [])
-        if holdings:
-            crypto_ids = [h['crypto_id'] for h in holdings]
-            price_result = price_service.get_current_prices(crypto_ids)
+    user_id = session['user_id']
+    price_version = price_service.get_price_version()
+    data_version = portfolio_service.get_data_version(user_id)
+    etag = f"portfolio-{user_id}-{data_version}-{price_version}" if price_version and data_version is not None else None
+    
+    def build():
+        try:
+            result = portfolio_service.get_user_portfolio(user_id)
             
-            if price_result['success']:
-                current_prices = price_result['data']
-                
-                # Calculate portfolio value
-                total_value = 0
-                holdings_with_prices = []
-                
-                for holding in holdings:
-                    crypto_id = holding['crypto_id']
-                    if crypto_id in current_prices:
-                        current_price = current_prices[crypto_id]['price_usd']
-                        current_value = holding['total_amount'] * current_price
-                        profit_loss = current_value - holding['total_invested']
-                        profit_loss_pct = (profit_loss / holding['total_invested'] * 100) if holding['total_invested'] > 0 else 0
-                        
-                        holdings_with_prices.append({
-                            'crypto_id': crypto_id,
-                            'amount': holding['total_amount'],
-                            'avg_price': holding['avg_buy_price'],
-                            'current_price': current_price,
-                            'current_value': current_value,
-                            'total_invested': holding['total_invested'],
-                            'profit_loss': profit_loss,
-                            'profit_loss_pct': profit_loss_pct
-                        })
-                        
-                        total_value += current_value
+            if not result['success']:
+                return result
+            
+            # Get current prices for all holdings
+            holdings = result.get('holdings', [])
+            if holdings:
+                crypto_ids = [h['crypto_id'] for h in holdings]
+                price_result = price_service.get_current_prices(crypto_ids)
                 
-                return jsonify({
-                    'success': True,
-                    'portfolio': {h['crypto_id']: h for h in holdings_with_prices},
-                    'portfolio_value': {
-                        'total_value': total_value,
-                        'holdings': holdings_with_prices
-                    },
-                    'transactions': result.get('transactions', [])
-                })
-        
-        # Empty portfolio
-        return jsonify({
-            'success': True,
-            'portfolio': {},
-            'portfolio_value': {'total_value': 0, 'holdings': []},
-            'transactions': []
-        })
-        
-    except Exception as e:
-        print(f"Portfolio fetch error: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'success': False, 'error': 'PORTFOLIO_ERROR', 'message': str(e)})
+                if price_result['success']:
+                    current_prices = price_result['data']
+                    
+                    # Calculate portfolio value
+                    total_value = 0
+                    holdings_with_prices = []
+                    
+                    for holding in holdings:
+                        crypto_id = holding['crypto_id']
+                        if crypto_id in current_prices:
+                            current_price = current_prices[crypto_id]['price_usd']
+                            current_value = holding['total_amount'] * current_price
+                            profit_loss = current_value - holding['total_invested']
+                            profit_loss_pct = (profit_loss / holding['total_invested'] * 100) if holding['total_invested'] > 0 else 0
+                            
+                            holdings_with_prices.append({
+                                'crypto_id': crypto_id,
+                                'amount': holding['total_amount'],
+                                'avg_price': holding['avg_buy_price'],
+                                'current_price': current_price,
+                                'current_value': current_value,
+                                'total_invested': holding['total_invested'],
+                                'profit_loss': profit_loss,
+                                'profit_loss_pct': profit_loss_pct
+                            })
+                            
+                            total_value += current_value
+                    
+                    return {
+                        'success': True,
+                        'portfolio': {h['crypto_id']: h for h in holdings_with_prices},
+                        'portfolio_value': {
+                            'total_value': total_value,
+                            'holdings': holdings_with_prices
+                        },
+                        'transactions': result.get('transactions', [])
+                    }
+            
+            # Empty portfolio
+            return {
+                'success': True,
+                'portfolio': {},
+                'portfolio_value': {'total_value': 0, 'holdings': []},
+                'transactions': []
+            }
+            
+        except Exception as e:
+            print(f"Portfolio fetch error: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return {'success': False, 'error': 'PORTFOLIO_ERROR', 'message': str(e)}
+    
+    return conditional_json(etag, build)
 
 @application.route('/api/portfolio/buy', methods=['POST'])
 @login_required
@@ -367,6 +425,15 @@ Thank you for using CrypSync!
     send_metric('CryptoSale', 1 if result['success'] else 0)
     return jsonify(result)
 
+@application.route('/api/portfolio/transactions', methods=['GET'])
+@login_required
+def get_transactions():
+    user_id = session['user_id']
+    limit = int(request.args.get('limit', 50))
+    data_version = portfolio_service.get_data_version(user_id)
+    etag = f"transactions-{user_id}-{limit}-{data_version}" if data_version is not None else None
+    return conditional_json(etag, lambda: portfolio_service.get_transaction_history(user_id, limit))
+
 @application.route('/charts')
 @login_required
 def charts():
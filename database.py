@@ -127,17 +127,20 @@ def init_database():
         )
     ''')
     
-    # Historical prices table (for caching)
+    # Historical prices (epoch timestamps, keyed by coin and time)
+    init_historical_tables(cursor)
+    
+    # Per-user data version, bumped on every portfolio write (ETag validator)
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS historical_prices (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            crypto_id TEXT NOT NULL,
-            price_usd REAL NOT NULL,
-            timestamp TEXT NOT NULL,
-            source TEXT NOT NULL
+        CREATE TABLE IF NOT EXISTS user_data_versions (
+            user_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
         )
     ''')
     
+    # Shared price store tables (quotes, rate-limit budget and refresh lease across workers)
+    init_shared_price_tables(cursor)
+    
     # Create indexes for better performance
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_holdings_user ON holdings(user_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_user ON transactions(user_id)')
@@ -169,6 +172,129 @@ def init_database():
     
     print(f"✅ Database initialized successfully at {DATABASE_PATH}")
 
+def init_historical_tables(cursor):
+    """Create historical_prices and price_candles, migrating the old row-id/ISO-text layout in place"""
+    cursor.execute("PRAGMA table_info(historical_prices)")
+    columns = {col[1]: col[2] for col in cursor.fetchall()}
+    legacy = bool(columns) and ('id' in columns or columns.get('timestamp', '').upper() == 'TEXT')
+    if legacy:
+        cursor.execute('ALTER TABLE historical_prices RENAME TO historical_prices_legacy')
+    
+    # The (crypto_id, timestamp) primary key is the range-scan index and rejects duplicate points;
+    # WITHOUT ROWID stores each coin's rows contiguously in time order
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS historical_prices (
+            crypto_id TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
+            price_usd REAL NOT NULL,
+            source TEXT NOT NULL,
+            PRIMARY KEY (crypto_id, timestamp)
+        ) WITHOUT ROWID
+    ''')
+    
+    if legacy:
+        cursor.execute('''
+            INSERT OR REPLACE INTO historical_prices (crypto_id, timestamp, price_usd, source)
+            SELECT crypto_id, CAST(strftime('%s', timestamp) AS INTEGER), price_usd, source
+            FROM historical_prices_legacy
+            WHERE strftime('%s', timestamp) IS NOT NULL
+        ''')
+        cursor.execute('DROP TABLE historical_prices_legacy')
+    
+    # OHLC rollups of historical_prices, kept up to date as points are written;
+    # resolution is the bucket width in seconds and bucket its start epoch
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS price_candles (
+            crypto_id TEXT NOT NULL,
+            resolution INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            open REAL NOT NULL,
+            high REAL NOT NULL,
+            low REAL NOT NULL,
+            close REAL NOT NULL,
+            samples INTEGER NOT NULL,
+            first_ts INTEGER NOT NULL,
+            last_ts INTEGER NOT NULL,
+            PRIMARY KEY (crypto_id, resolution, bucket)
+        ) WITHOUT ROWID
+    ''')
+    
+    # Per-coin history version, bumped by every write or purge (ETag validator)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS history_versions (
+            crypto_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+
+def init_shared_price_tables(cursor):
+    """Create tables used to share prices between worker processes"""
+    # Latest quote per coin, written by whichever worker holds the refresh lease
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS price_quotes (
+            crypto_id TEXT PRIMARY KEY,
+            price_usd REAL NOT NULL,
+            change_24h REAL NOT NULL,
+            fetched_at TEXT NOT NULL,
+            cached_at REAL NOT NULL
+        )
+    ''')
+    
+    # Token bucket state shared by all workers
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            name TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    
+    # Coins requested by readers that the ingester should start tracking
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS price_demand (
+            crypto_id TEXT PRIMARY KEY,
+            requested_at REAL NOT NULL
+        )
+    ''')
+    
+    # Market gateway responses, keyed by request; rows with NULL data are requests the ingester has not served yet
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS market_responses (
+            request_key TEXT PRIMARY KEY,
+            endpoint TEXT NOT NULL,
+            path TEXT NOT NULL,
+            params TEXT NOT NULL,
+            data TEXT,
+            cached_at REAL,
+            requested_at REAL
+        )
+    ''')
+    
+    # Time-limited leases so only one worker refreshes at a time
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+
+def bump_user_data_version(cursor, user_id):
+    """Mark a user's portfolio data as changed; call inside the writing transaction"""
+    cursor.execute('''
+        INSERT INTO user_data_versions (user_id, version) VALUES (?, 1)
+        ON CONFLICT(user_id) DO UPDATE SET version = version + 1
+    ''', (user_id,))
+
+def get_user_data_version(user_id):
+    """Current portfolio data version for a user (0 if never written)"""
+    conn = get_db_connection()
+    try:
+        row = conn.execute('SELECT version FROM user_data_versions WHERE user_id = ?', (user_id,)).fetchone()
+    finally:
+        conn.close()
+    return row['version'] if row else 0
+
 def create_admin_user(email='admin@crypsync.com', password='admin123'):
     """Create default admin user"""
     import bcrypt
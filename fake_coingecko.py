@@ -0,0 +1,593 @@
+#!/usr/bin/env python3
+"""
+Fake CoinGecko Server
+Local stand-in for the CoinGecko endpoints CrypSync uses, with deterministic
+synthetic price walks and configurable latency, errors, 429s and outages.
+
+Usage: python fake_coingecko.py [--port 8765] [--latency lognormal --latency-ms 80]
+       [--error-rate 0.05] [--rate-limit 30] [--outage 60:30]
+       COINGECKO_BASE_URL=http://127.0.0.1:8765/api/v3 python app.py
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+API_PREFIX = '/api/v3'
+DAY = 86400
+
+# id -> (symbol, name, starting price, circulating supply)
+COINS = {
+    'bitcoin': ('btc', 'Bitcoin', 60000.0, 19_700_000),
+    'ethereum': ('eth', 'Ethereum', 3000.0, 120_000_000),
+    'tether': ('usdt', 'Tether', 1.0, 110_000_000_000),
+    'binancecoin': ('bnb', 'BNB', 550.0, 150_000_000),
+    'solana': ('sol', 'Solana', 150.0, 460_000_000),
+    'ripple': ('xrp', 'XRP', 0.55, 55_000_000_000),
+    'usd-coin': ('usdc', 'USDC', 1.0, 33_000_000_000),
+    'cardano': ('ada', 'Cardano', 0.45, 35_000_000_000),
+    'dogecoin': ('doge', 'Dogecoin', 0.12, 145_000_000_000),
+    'tron': ('trx', 'TRON', 0.12, 87_000_000_000),
+    'avalanche-2': ('avax', 'Avalanche', 30.0, 390_000_000),
+    'polkadot': ('dot', 'Polkadot', 6.5, 1_400_000_000),
+    'chainlink': ('link', 'Chainlink', 14.0, 600_000_000),
+    'matic-network': ('matic', 'Polygon', 0.6, 9_300_000_000),
+    'litecoin': ('ltc', 'Litecoin', 75.0, 75_000_000),
+    'shiba-inu': ('shib', 'Shiba Inu', 0.00002, 589_000_000_000_000),
+    'uniswap': ('uni', 'Uniswap', 8.0, 600_000_000),
+    'stellar': ('xlm', 'Stellar', 0.1, 29_000_000_000),
+    'cosmos': ('atom', 'Cosmos Hub', 7.0, 390_000_000),
+    'monero': ('xmr', 'Monero', 160.0, 18_400_000)
+}
+
+STABLECOINS = {'tether', 'usd-coin'}
+
+class PriceWalk:
+    """Deterministic geometric random walk per coin, one step every `tick` seconds"""
+    
+    def __init__(self, seed=42, tick=300, history_days=366, anchor=None, frozen=False):
+        self.seed = seed
+        self.tick = tick
+        self.anchor = int(anchor if anchor is not None else time.time()) // tick * tick
+        self.start = self.anchor - history_days * DAY  # first point of the walk
+        self.frozen = frozen
+        self._log_prices = {}  # crypto_id -> (step rng, log prices), extended lazily
+        self._lock = threading.Lock()
+    
+    def now(self):
+        """Current time on the walk's clock"""
+        return self.anchor if self.frozen else time.time()
+    
+    def coin_info(self, crypto_id):
+        """(symbol, name, starting price, supply) for a catalog or synthetic coin"""
+        if crypto_id in COINS:
+            return COINS[crypto_id]
+        
+        # Any other id is a synthetic coin whose parameters derive from its name
+        h = zlib.crc32(crypto_id.encode())
+        price = 10 ** ((h % 700) / 100 - 3)  # 0.001 .. 10000
+        supply = 10 ** (6 + (h >> 10) % 5) * (1 + (h >> 16) % 9)
+        return (crypto_id.replace('-', '')[:4], crypto_id.replace('-', ' ').title(), price, supply)
+    
+    def price_at(self, crypto_id, timestamp):
+        """Price at a unix timestamp, interpolated between ticks"""
+        position = max(0.0, (timestamp - self.start) / self.tick)
+        index = int(position)
+        
+        with self._lock:
+            series = self._extend(crypto_id, index + 1)
+            low, high = series[index], series[index + 1]
+        
+        return math.exp(low + (high - low) * (position - index))
+    
+    def _extend(self, crypto_id, index):
+        """Grow a coin's walk up to index (caller holds the lock)"""
+        if crypto_id not in self._log_prices:
+            # Each coin has its own step stream, so the walk never depends on request order
+            rng = random.Random(f"{self.seed}:{crypto_id}")
+            self._log_prices[crypto_id] = (rng, [math.log(self.coin_info(crypto_id)[2])])
+        
+        rng, series = self._log_prices[crypto_id]
+        stable = crypto_id in STABLECOINS
+        sigma = 0.0002 if stable else 0.0015
+        origin = series[0]
+        while len(series) <= index:
+            level = series[-1]
+            step = rng.gauss(0, sigma)
+            if stable:
+                step -= (level - origin) * 0.05  # mean reversion keeps the peg
+            series.append(level + step)
+        return series
+    
+    def quote(self, crypto_id, timestamp=None):
+        """Price, 24h change, market cap and volume at a point in time"""
+        timestamp = self.now() if timestamp is None else timestamp
+        price = self.price_at(crypto_id, timestamp)
+        previous = self.price_at(crypto_id, timestamp - DAY)
+        supply = self.coin_info(crypto_id)[3]
+        
+        # Volume wobbles deterministically around 4% of market cap
+        wobble = (zlib.crc32(f"{crypto_id}:{int(timestamp) // self.tick}".encode()) % 1000) / 1000
+        market_cap = price * supply
+        
+        return {
+            'price': price,
+            'change_24h': (price / previous - 1) * 100,
+            'market_cap': market_cap,
+            'volume': market_cap * (0.02 + 0.04 * wobble),
+            'high_24h': max(price, previous) * 1.01,
+            'low_24h': min(price, previous) * 0.99
+        }
+    
+    def series(self, crypto_id, days):
+        """[timestamp_ms, price] points with CoinGecko's automatic granularity"""
+        now = self.now()
+        if days <= 1:
+            step = self.tick
+        elif days <= 90:
+            step = 3600
+        else:
+            step = DAY
+        
+        start = now - days * DAY
+        points = []
+        t = start
+        while t < now:
+            points.append((t, self.price_at(crypto_id, t)))
+            t += step
+        points.append((now, self.price_at(crypto_id, now)))
+        return points
+
+class FaultInjector:
+    """Decides per request whether to delay, fail, throttle or drop it"""
+    
+    LATENCY_DISTRIBUTIONS = ('none', 'fixed', 'uniform', 'normal', 'lognormal', 'exponential')
+    
+    def __init__(self, seed=42, latency='none', latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                 throttle_rate=0.0, rate_limit=0, outages=None, outage_mode='refuse'):
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit  # requests per minute, 0 = unlimited
+        self.outages = outages or []  # (start, duration) in seconds after server start
+        self.outage_mode = outage_mode  # refuse | error | hang
+        self.outage = False  # manual outage switch, see /_control
+        self.started_at = time.time()
+        
+        self._rng = random.Random(seed)
+        self._recent = []  # request times inside the current rate-limit window
+        self._lock = threading.Lock()
+    
+    def delay(self):
+        """Seconds to wait before answering"""
+        mean = self.latency_ms / 1000
+        jitter = self.jitter_ms / 1000
+        
+        with self._lock:
+            if self.latency == 'fixed':
+                value = mean
+            elif self.latency == 'uniform':
+                value = self._rng.uniform(mean - jitter, mean + jitter)
+            elif self.latency == 'normal':
+                value = self._rng.gauss(mean, jitter)
+            elif self.latency == 'lognormal' and mean > 0:
+                # Parameterised so the arithmetic mean is latency_ms and the spread is jitter_ms
+                sigma = math.sqrt(math.log(1 + (jitter / mean) ** 2))
+                value = self._rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+            elif self.latency == 'exponential' and mean > 0:
+                value = self._rng.expovariate(1 / mean)
+            else:
+                value = 0.0
+        return max(0.0, value)
+    
+    def in_outage(self):
+        """True while a scheduled or manual outage is active"""
+        if self.outage:
+            return True
+        elapsed = time.time() - self.started_at
+        return any(start <= elapsed < start + duration for start, duration in self.outages)
+    
+    def decide(self):
+        """Fault for this request: None, 'outage', 'rate_limited', 'throttled' or 'error'"""
+        if self.in_outage():
+            return 'outage'
+        
+        now = time.time()
+        with self._lock:
+            if self.rate_limit:
+                self._recent = [t for t in self._recent if now - t < 60]
+                if len(self._recent) >= self.rate_limit:
+                    return 'rate_limited'
+                self._recent.append(now)
+            
+            roll = self._rng.random()
+        
+        if roll < self.throttle_rate:
+            return 'throttled'
+        if roll < self.throttle_rate + self.error_rate:
+            return 'error'
+        return None
+    
+    def retry_after(self):
+        """Seconds until the rate-limit window frees a slot"""
+        with self._lock:
+            if not self._recent:
+                return 1
+            return max(1, math.ceil(60 - (time.time() - self._recent[0])))
+    
+    def get_config(self):
+        """Current settings, as accepted by update()"""
+        return {
+            'latency': self.latency,
+            'latency_ms': self.latency_ms,
+            'jitter_ms': self.jitter_ms,
+            'error_rate': self.error_rate,
+            'throttle_rate': self.throttle_rate,
+            'rate_limit': self.rate_limit,
+            'outages': self.outages,
+            'outage_mode': self.outage_mode,
+            'outage': self.outage
+        }
+    
+    def update(self, changes):
+        """Apply settings changed at runtime"""
+        for key, value in changes.items():
+            if key not in self.get_config():
+                raise ValueError(f"Unknown setting: {key}")
+            if key == 'latency' and value not in self.LATENCY_DISTRIBUTIONS:
+                raise ValueError(f"Unknown latency distribution: {value}")
+            if key == 'outages':
+                value = [tuple(window) for window in value]
+            setattr(self, key, value)
+
+class FakeCoinGeckoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+    
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+    
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        path = parsed.path
+        params = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        
+        if path == '/_control':
+            return self._send_json(200, self.server.get_control_state())
+        
+        if path.startswith(API_PREFIX):
+            path = path[len(API_PREFIX):]
+        
+        route = self._route(path)
+        if route is None:
+            return self._send_json(404, {'error': 'Not found'})
+        
+        self.server.record_request(path)
+        faults = self.server.faults
+        fault = faults.decide()
+        
+        if fault == 'outage':
+            self.server.record_fault(fault)
+            if faults.outage_mode == 'hang':
+                time.sleep(self.server.hang_seconds)
+            elif faults.outage_mode == 'error':
+                return self._send_json(503, {'error': 'Service Unavailable'})
+            # Drop the connection without a response, like an unreachable upstream
+            self.close_connection = True
+            return
+        
+        time.sleep(faults.delay())
+        
+        if fault in ('rate_limited', 'throttled'):
+            self.server.record_fault(fault)
+            return self._send_json(429, {'status': {'error_code': 429, 'error_message': "You've exceeded the Rate Limit."}},
+                                   headers={'Retry-After': str(faults.retry_after())})
+        if fault == 'error':
+            self.server.record_fault(fault)
+            return self._send_json(500, {'error': 'Internal Server Error'})
+        
+        handler, args = route
+        try:
+            status, body = handler(params, *args)
+        except ValueError as e:
+            status, body = 400, {'error': str(e)}
+        self._send_json(status, body)
+    
+    def do_POST(self):
+        if urlparse(self.path).path != '/_control':
+            return self._send_json(404, {'error': 'Not found'})
+        
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            changes = json.loads(self.rfile.read(length) or b'{}')
+            if changes.pop('reset_stats', False):
+                self.server.reset_stats()
+            self.server.faults.update(changes)
+        except ValueError as e:
+            return self._send_json(400, {'error': str(e)})
+        self._send_json(200, self.server.get_control_state())
+    
+    def _route(self, path):
+        """(handler, path args) for an API path"""
+        parts = [p for p in path.split('/') if p]
+        if parts == ['simple', 'price']:
+            return self._simple_price, ()
+        if parts == ['coins', 'markets']:
+            return self._coins_markets, ()
+        if parts == ['global']:
+            return self._global, ()
+        if parts == ['ping']:
+            return self._ping, ()
+        if len(parts) == 4 and parts[0] == 'coins' and parts[2:] == ['market_chart', 'range']:
+            return self._market_chart_range, (parts[1],)
+        if len(parts) == 3 and parts[0] == 'coins' and parts[2] == 'market_chart':
+            return self._market_chart, (parts[1],)
+        if len(parts) == 2 and parts[0] == 'coins':
+            return self._coin, (parts[1],)
+        return None
+    
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def _ping(self, params):
+        return 200, {'gecko_says': '(V3) To the Moon!'}
+    
+    def _simple_price(self, params):
+        ids = [i.strip() for i in params.get('ids', '').split(',') if i.strip()]
+        currencies = [c.strip() for c in params.get('vs_currencies', 'usd').split(',') if c.strip()]
+        walk = self.server.walk
+        
+        result = {}
+        for crypto_id in ids:
+            quote = walk.quote(crypto_id)
+            entry = {}
+            for currency in currencies:
+                entry[currency] = quote['price']
+                if params.get('include_market_cap') == 'true':
+                    entry[f'{currency}_market_cap'] = quote['market_cap']
+                if params.get('include_24hr_vol') == 'true':
+                    entry[f'{currency}_24h_vol'] = quote['volume']
+                if params.get('include_24hr_change') == 'true':
+                    entry[f'{currency}_24h_change'] = quote['change_24h']
+            if params.get('include_last_updated_at') == 'true':
+                entry['last_updated_at'] = int(walk.now())
+            result[crypto_id] = entry
+        return 200, result
+    
+    def _global(self, params):
+        walk = self.server.walk
+        quotes = {crypto_id: walk.quote(crypto_id) for crypto_id in COINS}
+        total_cap = sum(q['market_cap'] for q in quotes.values())
+        previous_cap = sum(q['market_cap'] / (1 + q['change_24h'] / 100) for q in quotes.values())
+        
+        return 200, {'data': {
+            'active_cryptocurrencies': len(COINS),
+            'markets': 1000,
+            'total_market_cap': {'usd': total_cap},
+            'total_volume': {'usd': sum(q['volume'] for q in quotes.values())},
+            'market_cap_percentage': {COINS[c][0]: q['market_cap'] / total_cap * 100 for c, q in quotes.items()},
+            'market_cap_change_percentage_24h_usd': (total_cap / previous_cap - 1) * 100,
+            'updated_at': int(walk.now())
+        }}
+    
+    def _market_row(self, crypto_id, params):
+        walk = self.server.walk
+        symbol, name, _, supply = walk.coin_info(crypto_id)
+        now = walk.now()
+        quote = walk.quote(crypto_id, now)
+        
+        row = {
+            'id': crypto_id,
+            'symbol': symbol,
+            'name': name,
+            'image': f'https://assets.coingecko.com/coins/images/1/large/{crypto_id}.png',
+            'current_price': quote['price'],
+            'market_cap': quote['market_cap'],
+            'fully_diluted_valuation': quote['market_cap'],
+            'total_volume': quote['volume'],
+            'high_24h': quote['high_24h'],
+            'low_24h': quote['low_24h'],
+            'price_change_24h': quote['price'] - walk.price_at(crypto_id, now - DAY),
+            'price_change_percentage_24h': quote['change_24h'],
+            'circulating_supply': supply,
+            'total_supply': supply,
+            'last_updated': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(now))
+        }
+        
+        windows = {'1h': 3600, '24h': DAY, '7d': 7 * DAY, '14d': 14 * DAY, '30d': 30 * DAY, '1y': 365 * DAY}
+        for window in params.get('price_change_percentage', '').split(','):
+            window = window.strip()
+            if window in windows:
+                previous = walk.price_at(crypto_id, now - windows[window])
+                row[f'price_change_percentage_{window}_in_currency'] = (quote['price'] / previous - 1) * 100
+        
+        if params.get('sparkline') == 'true':
+            row['sparkline_in_7d'] = {'price': [walk.price_at(crypto_id, now - 7 * DAY + h * 3600) for h in range(168)]}
+        return row
+    
+    def _coins_markets(self, params):
+        walk = self.server.walk
+        ids = [i.strip() for i in params.get('ids', '').split(',') if i.strip()] or list(COINS)
+        per_page = min(250, int(params.get('per_page', 100)))
+        page = max(1, int(params.get('page', 1)))
+        
+        # Rank by market cap without building full rows for every coin
+        now = walk.now()
+        ranked = sorted(ids, key=lambda c: walk.price_at(c, now) * walk.coin_info(c)[3], reverse=True)
+        if params.get('order') == 'market_cap_asc':
+            ranked.reverse()
+        
+        rows = []
+        for rank, crypto_id in enumerate(ranked[(page - 1) * per_page:page * per_page], start=(page - 1) * per_page + 1):
+            row = self._market_row(crypto_id, params)
+            row['market_cap_rank'] = rank
+            rows.append(row)
+        return 200, rows
+    
+    def _coin(self, params, crypto_id):
+        walk = self.server.walk
+        row = self._market_row(crypto_id, {'sparkline': params.get('sparkline', 'false'),
+                                           'price_change_percentage': '7d,30d'})
+        market_data = {
+            'current_price': {'usd': row['current_price']},
+            'market_cap': {'usd': row['market_cap']},
+            'total_volume': {'usd': row['total_volume']},
+            'high_24h': {'usd': row['high_24h']},
+            'low_24h': {'usd': row['low_24h']},
+            'price_change_percentage_24h': row['price_change_percentage_24h'],
+            'price_change_percentage_7d': row['price_change_percentage_7d_in_currency'],
+            'price_change_percentage_30d': row['price_change_percentage_30d_in_currency'],
+            'circulating_supply': row['circulating_supply'],
+            'total_supply': row['total_supply']
+        }
+        if 'sparkline_in_7d' in row:
+            market_data['sparkline_7d'] = row['sparkline_in_7d']
+        
+        return 200, {
+            'id': crypto_id,
+            'symbol': row['symbol'],
+            'name': row['name'],
+            'description': {'en': f"{row['name']} is a synthetic coin served by the fake CoinGecko server."},
+            'image': {size: row['image'] for size in ('thumb', 'small', 'large')},
+            'market_cap_rank': sorted(COINS, key=lambda c: -walk.price_at(c, walk.now()) * COINS[c][3]).index(crypto_id) + 1
+                               if crypto_id in COINS else None,
+            'market_data': market_data,
+            'last_updated': row['last_updated']
+        }
+    
+    def _chart_body(self, crypto_id, points):
+        supply = self.server.walk.coin_info(crypto_id)[3]
+        return {
+            'prices': [[int(t * 1000), p] for t, p in points],
+            'market_caps': [[int(t * 1000), p * supply] for t, p in points],
+            'total_volumes': [[int(t * 1000), p * supply * 0.04] for t, p in points]
+        }
+    
+    def _market_chart(self, params, crypto_id):
+        days = params.get('days', '1')
+        days = 365 if days == 'max' else float(days)
+        return 200, self._chart_body(crypto_id, self.server.walk.series(crypto_id, days))
+    
+    def _market_chart_range(self, params, crypto_id):
+        walk = self.server.walk
+        start, end = float(params['from']), float(params['to'])
+        span_days = (end - start) / DAY
+        step = walk.tick if span_days <= 1 else 3600 if span_days <= 90 else DAY
+        points = [(t, walk.price_at(crypto_id, t)) for t in range(int(start), int(end) + 1, step)]
+        return 200, self._chart_body(crypto_id, points)
+
+class FakeCoinGeckoServer(ThreadingHTTPServer):
+    daemon_threads = True
+    
+    def __init__(self, address, walk=None, faults=None, hang_seconds=30, verbose=False):
+        super().__init__(address, FakeCoinGeckoHandler)
+        self.walk = walk or PriceWalk()
+        self.faults = faults or FaultInjector()
+        self.hang_seconds = hang_seconds
+        self.verbose = verbose
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+    
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+    
+    def reset_stats(self):
+        with self._stats_lock:
+            self.stats = {'requests': 0, 'by_path': {}, 'faults': {}}
+    
+    def record_request(self, path):
+        with self._stats_lock:
+            self.stats['requests'] += 1
+            self.stats['by_path'][path] = self.stats['by_path'].get(path, 0) + 1
+    
+    def record_fault(self, fault):
+        with self._stats_lock:
+            self.stats['faults'][fault] = self.stats['faults'].get(fault, 0) + 1
+    
+    def get_control_state(self):
+        with self._stats_lock:
+            stats = json.loads(json.dumps(self.stats))
+        return {'config': self.faults.get_config(), 'stats': stats, 'in_outage': self.faults.in_outage()}
+    
+    def start_background(self):
+        """Serve from a daemon thread; returns the base URL to point clients at"""
+        threading.Thread(target=self.serve_forever, name='fake-coingecko', daemon=True).start()
+        return self.base_url
+    
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def parse_outage(value):
+    """'START:DURATION' in seconds after server start"""
+    start, duration = value.split(':')
+    return float(start), float(duration)
+
+def main():
+    parser = argparse.ArgumentParser(description='Local fake CoinGecko API for offline benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=42, help='seed for price walks and fault rolls')
+    parser.add_argument('--tick', type=int, default=300, help='seconds between price walk steps')
+    parser.add_argument('--anchor', type=float, help='unix time the walk is anchored to (default: now)')
+    parser.add_argument('--frozen', action='store_true', help='keep the clock at the anchor so prices never move')
+    parser.add_argument('--latency', choices=FaultInjector.LATENCY_DISTRIBUTIONS, default='none')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='mean added latency')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='spread (half-width for uniform, stddev otherwise)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of requests answered with 429')
+    parser.add_argument('--rate-limit', type=int, default=0, help='requests per minute before 429 (0 = unlimited)')
+    parser.add_argument('--outage', type=parse_outage, action='append', default=[],
+                        help='START:DURATION seconds after startup, may be repeated')
+    parser.add_argument('--outage-mode', choices=('refuse', 'error', 'hang'), default='refuse')
+    parser.add_argument('--hang-seconds', type=float, default=30, help='how long hung requests stall')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args()
+    
+    server = FakeCoinGeckoServer(
+        (args.host, args.port),
+        walk=PriceWalk(seed=args.seed, tick=args.tick, anchor=args.anchor, frozen=args.frozen),
+        faults=FaultInjector(
+            seed=args.seed,
+            latency=args.latency,
+            latency_ms=args.latency_ms,
+            jitter_ms=args.jitter_ms,
+            error_rate=args.error_rate,
+            throttle_rate=args.throttle_rate,
+            rate_limit=args.rate_limit,
+            outages=args.outage,
+            outage_mode=args.outage_mode
+        ),
+        hang_seconds=args.hang_seconds,
+        verbose=args.verbose
+    )
+    
+    print(f"Fake CoinGecko listening on {server.base_url}")
+    print(f"Point CrypSync at it with COINGECKO_BASE_URL={server.base_url}")
+    print(f"Change faults at runtime: POST JSON to http://{args.host}:{args.port}/_control")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
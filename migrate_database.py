@@ -6,6 +6,7 @@ Adds role column and tracked_coins table to existing database
 import sqlite3
 import os
 from datetime import datetime
+from database import init_historical_tables
 
 DATABASE_PATH = 'crypsync.db'
 
@@ -67,14 +68,20 @@ def migrate_database():
         else:
             print("2. Tracked coins table already exists\n")
         
+        # Move historical_prices to epoch timestamps with a (crypto_id, timestamp) key
+        print("3. Migrating historical_prices...")
+        init_historical_tables(cursor)
+        print("   ✓ Historical prices use epoch timestamps")
+        print("   ✓ price_candles table ready (rolled up from history on next start)\n")
+        
         # Create indexes if they don't exist
-        print("3. Creating indexes...")
+        print("4. Creating indexes...")
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_tracked_coins_status ON tracked_coins(status)')
         print("   ✓ Indexes created\n")
         
         # Update admin user if exists
-        print("4. Checking for admin user...")
+        print("5. Checking for admin user...")
         cursor.execute("SELECT user_id FROM users WHERE email = 'admin@crypsync.com'")
         admin = cursor.fetchone()
         
@@ -116,6 +116,28 @@ class AdminService:
         except Exception as e:
             return {'success': False, 'error': 'FETCH_FAILED', 'message': str(e)}
     
+    def get_price_universe(self):
+        """Get ids of coins that need live prices: tracked, held or alerted on"""
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT coin_id AS crypto_id FROM tracked_coins WHERE status = 'active'
+                UNION
+                SELECT crypto_id FROM holdings WHERE amount > 0
+                UNION
+                SELECT crypto_id FROM price_alerts WHERE status = 'ACTIVE'
+            ''')
+            
+            rows = cursor.fetchall()
+            conn.close()
+            
+            return [row['crypto_id'] for row in rows]
+        except Exception as e:
+            print(f"Error loading price universe: {e}")
+            return []
+    
     def add_tracked_coin(self, coin_id, name, symbol, added_by):
         """Add a new coin to tracking"""
         try:
@@ -220,6 +242,7 @@ class AdminService:
             cursor.execute('DELETE FROM portfolio_alerts WHERE user_id = ?', (user_id,))
             cursor.execute('DELETE FROM price_alerts WHERE user_id = ?', (user_id,))
             cursor.execute('DELETE FROM sessions WHERE user_id = ?', (user_id,))
+            cursor.execute('DELETE FROM user_data_versions WHERE user_id = ?', (user_id,))
             cursor.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
             
             conn.commit()
@@ -19,7 +19,9 @@ class AdminServiceAWS:
             total_users = users_response.get('Count', 0)
             
             # Get total transactions
-            portfolio_response = self.portfolio_table.scan(Select='COUNT')
+            # Each user's '#version' counter item carries no transaction_type
+            portfolio_response = self.portfolio_table.scan(Select='COUNT',
+                                                           FilterExpression='attribute_exists(transaction_type)')
             total_transactions = portfolio_response.get('Count', 0)
             
             # Get active alerts
@@ -80,6 +82,8 @@ class AdminServiceAWS:
             
             transactions = []
             for item in response.get('Items', []):
+                if 'transaction_type' not in item:
+                    continue
                 transactions.append({
                     'email': item.get('email'),
                     'transaction_id': item.get('TransactionID'),
@@ -62,6 +62,15 @@ class AlertService:
         except Exception as e:
             return {'success': False, 'error': 'ALERT_DELETION_FAILED', 'message': str(e)}
     
+    def get_alerted_coins(self):
+        """Get ids of coins with at least one active alert"""
+        coins = set()
+        for user_alerts in list(self.alerts.values()):
+            for alert in list(user_alerts.values()):
+                if alert['state'] == 'ACTIVE':
+                    coins.add(alert['crypto_id'])
+        return coins
+    
     def evaluate_alerts(self, current_prices):
         """Evaluate all active alerts against current prices"""
         triggered_alerts = []
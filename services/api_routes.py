@@ -0,0 +1,170 @@
+"""
+API Routes
+Response helpers and the market / historical API routes shared by app.py and app_aws.py
+"""
+from flask import request, jsonify, Response
+
+from services.historical_service import parse_timestamp, candle_count, DEFAULT_MAX_POINTS
+from services.history_store import CANDLE_RESOLUTIONS
+from services.market_service import COIN_ID_PATTERN
+
+MAX_HISTORY_BATCH = 25  # coins per /api/historical/batch request
+MAX_HISTORY_POINTS = 10000  # upper bound on the max_points a client may ask for
+MAX_HISTORY_DAYS = 3650  # longest `days` window a client may ask for
+
+# Conditional GET: answer 304 from a cheap version check before any DB or upstream work
+def conditional_json(etag, build):
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        result = build()
+        response = jsonify(result)
+        if not result.get('success'):
+            return response
+    
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def history_query_args():
+    """(days, start, end, resolution, max_points) from the query string, or an error response"""
+    try:
+        days = int(request.args.get('days', 7))
+    except ValueError:
+        days = 0
+    if not 1 <= days <= MAX_HISTORY_DAYS:
+        return None, (jsonify({'success': False, 'error': 'INVALID_RANGE',
+                               'message': f'days must be a whole number between 1 and {MAX_HISTORY_DAYS}'}), 400)
+    
+    # Optional explicit [start, end) window, as epoch seconds or ISO 8601
+    try:
+        start = parse_timestamp(request.args['start']) if request.args.get('start') else None
+        end = parse_timestamp(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        return None, (jsonify({'success': False, 'error': 'INVALID_RANGE', 'message': 'start and end must be epoch seconds or ISO 8601'}), 400)
+    if start is not None and end is not None and start >= end:
+        return None, (jsonify({'success': False, 'error': 'INVALID_RANGE', 'message': 'start must be before end'}), 400)
+    
+    # 'auto' serves the finest precomputed candles that fit max_points; 'raw' every stored point,
+    # LTTB-downsampled to max_points for the chart
+    resolution = request.args.get('resolution', 'auto')
+    if resolution not in ('auto', 'raw') and resolution not in CANDLE_RESOLUTIONS:
+        return None, (jsonify({'success': False, 'error': 'INVALID_RESOLUTION',
+                               'message': f"resolution must be auto, raw or one of {', '.join(CANDLE_RESOLUTIONS)}"}), 400)
+    max_points = min(max(1, request.args.get('max_points', DEFAULT_MAX_POINTS, type=int)), MAX_HISTORY_POINTS)
+    return (days, start, end, resolution, max_points), None
+
+# Market data gateway: browser pages read CoinGecko market data through the server-side cache
+MARKET_ERROR_STATUS = {'INVALID_COIN_ID': 400, 'INVALID_DAYS': 400, 'INVALID_PAGE': 400, 'NOT_FOUND': 404, 'RATE_LIMITED': 429,
+                       'UPSTREAM_UNAVAILABLE': 503}
+
+def market_response(result):
+    if not result['success']:
+        return jsonify(result), MARKET_ERROR_STATUS.get(result['error'], 503)
+    
+    response = jsonify(result['data'])
+    response.headers['Cache-Control'] = f"public, max-age={result['max_age']}"
+    response.headers['X-Cache'] = 'STALE' if result.get('stale') else 'HIT' if result['cached'] or result.get('coalesced') else 'MISS'
+    return response
+
+def register_market_routes(app, market_service):
+    """Public /api/market/* routes backed by market_service"""
+    @app.route('/api/market/markets')
+    def get_market_markets():
+        ids = request.args.get('ids')
+        result = market_service.get_markets(
+            ids=ids.split(',') if ids else None,
+            page=request.args.get('page', 1, type=int),
+            per_page=request.args.get('per_page', 50, type=int),
+            sparkline=request.args.get('sparkline') == 'true',
+            price_change_percentage=request.args.get('price_change_percentage')
+        )
+        return market_response(result)
+    
+    @app.route('/api/market/global')
+    def get_market_global():
+        return market_response(market_service.get_global())
+    
+    @app.route('/api/market/coins/<crypto_id>')
+    def get_market_coin(crypto_id):
+        return market_response(market_service.get_coin(crypto_id, sparkline=request.args.get('sparkline') == 'true'))
+    
+    @app.route('/api/market/coins/<crypto_id>/market_chart')
+    def get_market_chart(crypto_id):
+        return market_response(market_service.get_market_chart(crypto_id, request.args.get('days', '7')))
+
+def register_history_routes(app, historical_service, price_service, visualization_service, login_required):
+    """/api/historical and /api/historical/batch, behind the app's login_required"""
+    @app.route('/api/historical')
+    @login_required
+    def get_historical():
+        crypto_id = request.args.get('crypto_id', 'bitcoin')
+        args, error = history_query_args()
+        if error:
+            return error
+        days, start, end, resolution, max_points = args
+        
+        # The price version moves relative windows along; the history version covers backfills and purges
+        price_version = price_service.get_price_version([crypto_id])
+        history_version = historical_service.get_history_version([crypto_id])
+        etag = f"historical-{price_version}-{history_version}" if price_version and history_version else None
+        
+        def build():
+            # Repeated dashboard loads of the same window are served from the query cache
+            cache_key = (crypto_id, start or days, end, resolution, max_points)
+            cached = historical_service.get_cached_historical_data(cache_key)
+            if cached is not None:
+                return cached
+            
+            result = historical_service.get_historical_data(crypto_id, days, start, end, resolution, max_points)
+            if result['success']:
+                result = {'success': True, 'data': visualization_service.prepare_chart_data(result['data'], max_points),
+                          'resolution': result['resolution']}
+                historical_service.cache_historical_data(cache_key, result, crypto_id, end)
+            return result
+        
+        return conditional_json(etag, build)
+    
+    @app.route('/api/historical/batch')
+    @login_required
+    def get_historical_batch():
+        # Several coins' closes on one candle axis, for comparison charts
+        crypto_ids = list(dict.fromkeys(i.strip().lower() for i in request.args.get('ids', '').split(',') if i.strip()))
+        if not crypto_ids or len(crypto_ids) > MAX_HISTORY_BATCH:
+            return jsonify({'success': False, 'error': 'INVALID_COINS',
+                            'message': f'ids must list between 1 and {MAX_HISTORY_BATCH} coins'}), 400
+        invalid = [i for i in crypto_ids if not COIN_ID_PATTERN.match(i)]
+        if invalid:
+            return jsonify({'success': False, 'error': 'INVALID_COIN_ID', 'message': f'Invalid coin id: {invalid[0]}'}), 400
+        
+        args, error = history_query_args()
+        if error:
+            return error
+        days, start, end, resolution, max_points = args
+        if resolution == 'raw':
+            return jsonify({'success': False, 'error': 'INVALID_RESOLUTION',
+                            'message': 'batch series are aligned on candles; use auto or a candle resolution'}), 400
+        # Batch series are not downsampled, so an explicit resolution has to fit max_points
+        if resolution != 'auto' and candle_count(resolution, days, start, end) > max_points:
+            return jsonify({'success': False, 'error': 'TOO_MANY_POINTS',
+                            'message': f'{resolution} candles over this window exceed {max_points} points; use a coarser resolution or auto'}), 400
+        
+        price_version = price_service.get_price_version(crypto_ids)
+        history_version = historical_service.get_history_version(crypto_ids)
+        etag = f"historical-batch-{price_version}-{history_version}" if price_version and history_version else None
+        
+        def build():
+            cache_key = ('batch', tuple(crypto_ids), start or days, end, resolution, max_points)
+            cached = historical_service.get_cached_historical_data(cache_key)
+            if cached is not None:
+                return cached
+            
+            result = historical_service.get_historical_batch(crypto_ids, days, start, end, resolution, max_points)
+            if result['success']:
+                result = {'success': True, 'resolution': result['resolution'],
+                          'data': visualization_service.prepare_comparison_data(result['timestamps'], result['series'])}
+                historical_service.cache_historical_data(cache_key, result, crypto_ids, end)
+            return result
+        
+        return conditional_json(etag, build)
@@ -0,0 +1,125 @@
+"""
+Async Price Service
+asyncio counterpart to PriceService: fans id batches out concurrently under
+the shared rate limiter, reusing PriceService's cache and circuit breaker
+"""
+import asyncio
+import aiohttp
+from services.price_service import PriceService
+from services.rate_limiter import AsyncTokenBucket
+
+class AsyncPriceService:
+    def __init__(self, price_service=None, max_concurrency=5):
+        # Cache, circuit breaker, shared store, batching and rate budget all live on the sync service
+        self.price_service = price_service or PriceService()
+        self.max_concurrency = max_concurrency
+        self._session = None
+        self._in_flight = {}  # batch key -> task, coalesces concurrent fetches within the loop
+        self._rate_limiter = None
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()
+    
+    def _get_session(self):
+        """Lazily create the pooled aiohttp session inside the running loop"""
+        if self._session is None or self._session.closed:
+            client = self.price_service.client
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=client.pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=client.connect_timeout, sock_read=client.read_timeout),
+                headers=dict(client.session.headers)
+            )
+        return self._session
+    
+    @property
+    def rate_limiter(self):
+        """Async view of the sync service's current bucket (shared once use_shared_store is called)"""
+        bucket = self.price_service.rate_limiter
+        if self._rate_limiter is None or self._rate_limiter.bucket is not bucket:
+            self._rate_limiter = AsyncTokenBucket(bucket)
+        return self._rate_limiter
+    
+    async def _off_loop(self, func, *args):
+        """Run func in a worker thread when it may touch the shared SQLite store"""
+        if self.price_service.shared_store is None:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+    
+    async def close(self):
+        """Close pooled connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+    
+    async def get_current_prices(self, crypto_ids):
+        """Get current prices for specified cryptocurrencies"""
+        ps = self.price_service
+        try:
+            crypto_ids = ps._normalize_ids(crypto_ids)
+            cached_prices, missing_ids = await self._off_loop(ps._lookup_local, crypto_ids)
+            
+            if not missing_ids:
+                response = {'success': True, 'data': ps._in_request_order(crypto_ids, cached_prices), 'cached': True}
+                return ps._flag_stale(response)
+            
+            result = await self.fetch_from_api(missing_ids)
+            return ps._flag_stale(ps._merge_fetch_result(crypto_ids, cached_prices, missing_ids, result))
+        
+        except Exception as e:
+            return {'success': False, 'error': 'PRICE_FETCH_FAILED', 'message': str(e)}
+    
+    async def fetch_from_api(self, crypto_ids):
+        """Fetch all batches concurrently; a failed batch only degrades its own coins"""
+        if not self.price_service.upstream_enabled:
+            return await self._off_loop(self.price_service._request_from_ingester, crypto_ids)
+        
+        batches = self.price_service._batch_ids(crypto_ids)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def run(batch):
+            async with semaphore:
+                return await self._fetch_batch_coalesced(batch)
+        
+        results = await asyncio.gather(*(run(batch) for batch in batches))
+        return self.price_service._combine_batch_results(crypto_ids, results)
+    
+    async def _fetch_batch_coalesced(self, batch):
+        """Share one in-flight request per batch between concurrent coroutines"""
+        key = tuple(sorted(batch))
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_batch(batch))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+    
+    async def _fetch_batch(self, batch):
+        """Fetch one batch from CoinGecko"""
+        ps = self.price_service
+        
+        # Check circuit breaker
+        if not ps._circuit_allows_request():
+            return ps._fallback_to_cache(batch, 'API temporarily unavailable',
+                                         'API_UNAVAILABLE', 'CoinGecko API is temporarily unavailable')
+        
+        # Rate limiting
+        if not await self.rate_limiter.acquire(timeout=ps.rate_limit_timeout):
+            return ps._fallback_to_cache(batch, 'Rate limit reached, using cached data',
+                                         'RATE_LIMITED', 'CoinGecko rate limit reached, try again shortly')
+        
+        url, params = ps._build_price_request(batch)
+        try:
+            async with self._get_session().get(url, params=params) as response:
+                response.raise_for_status()
+                data = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            # ValueError: a body that is not valid JSON
+            ps._record_failure()
+            return ps._fallback_to_cache(batch, 'Using cached data due to API error',
+                                         'API_UNAVAILABLE', f'CoinGecko API error: {str(e)}')
+        
+        prices = ps._parse_prices(batch, data)
+        await self._off_loop(ps._store_fetched, prices)
+        return {'success': True, 'data': prices, 'cached': False}
@@ -0,0 +1,134 @@
+"""
+CoinGecko Client
+Pooled keep-alive HTTP session for CoinGecko with separate connect/read
+timeouts and per-call latency broken into connect, wait and transfer phases
+"""
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Connect time of the current call, written by the connection classes below
+_call_timing = threading.local()
+
+class _TimedConnectMixin:
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _call_timing.connect = getattr(_call_timing, 'connect', 0.0) + time.perf_counter() - start
+            _call_timing.new_connections = getattr(_call_timing, 'new_connections', 0) + 1
+
+class _TimedHTTPConnection(_TimedConnectMixin, HTTPConnection):
+    pass
+
+class _TimedHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+    pass
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool
+        }
+
+class CoinGeckoClient:
+    def __init__(self, base_url=None, pool_size=None, connect_timeout=None, read_timeout=None, api_key=None):
+        self.base_url = base_url or os.getenv('COINGECKO_BASE_URL', 'https://api.coingecko.com/api/v3')
+        self.pool_size = pool_size or int(os.getenv('COINGECKO_POOL_SIZE', 10))
+        self.connect_timeout = connect_timeout or float(os.getenv('COINGECKO_CONNECT_TIMEOUT', 3.05))
+        self.read_timeout = read_timeout or float(os.getenv('COINGECKO_READ_TIMEOUT', 10))
+        api_key = api_key or os.getenv('COINGECKO_API_KEY')
+        
+        self.session = requests.Session()
+        adapter = _TimedHTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Accept': 'application/json', 'User-Agent': 'CrypSync/1.0'})
+        if api_key and api_key != 'optional-api-key':
+            self.session.headers['x-cg-demo-api-key'] = api_key
+        
+        self.last_timing = None
+        self._stats = {'calls': 0, 'errors': 0, 'new_connections': 0,
+                       'connect': 0.0, 'wait': 0.0, 'transfer': 0.0, 'total': 0.0}
+        self._stats_lock = threading.Lock()
+    
+    def url(self, path):
+        """Build a full URL from an API path"""
+        return f"{self.base_url}/{path.lstrip('/')}"
+    
+    def get_json(self, url, params=None):
+        """GET a URL on the pooled session and decode the JSON body"""
+        _call_timing.connect = 0.0
+        _call_timing.new_connections = 0
+        start = time.perf_counter()
+        try:
+            # stream=True returns once headers arrive so the body read can be timed separately
+            response = self.session.get(url, params=params, stream=True,
+                                        timeout=(self.connect_timeout, self.read_timeout))
+            headers_at = time.perf_counter()
+            body = response.content
+            end = time.perf_counter()
+        except requests.exceptions.RequestException:
+            self._record_error(time.perf_counter() - start)
+            raise
+        
+        connect = _call_timing.connect
+        self._record({
+            'connect': connect,
+            'wait': max(0.0, headers_at - start - connect),
+            'transfer': end - headers_at,
+            'total': end - start,
+            'new_connections': _call_timing.new_connections,
+            'status': response.status_code,
+            'bytes': len(body)
+        })
+        
+        response.raise_for_status()
+        return response.json()
+    
+    def _record(self, timing):
+        """Accumulate per-phase latency"""
+        with self._stats_lock:
+            self.last_timing = timing
+            self._stats['calls'] += 1
+            self._stats['new_connections'] += timing['new_connections']
+            for phase in ('connect', 'wait', 'transfer', 'total'):
+                self._stats[phase] += timing[phase]
+    
+    def _record_error(self, total):
+        """Count a call that failed before a response arrived"""
+        with self._stats_lock:
+            self._stats['errors'] += 1
+            self.last_timing = {'error': True, 'total': total}
+    
+    def get_metrics(self):
+        """Average latency per phase in milliseconds and connection reuse"""
+        with self._stats_lock:
+            calls = self._stats['calls']
+            metrics = {
+                'calls': calls,
+                'errors': self._stats['errors'],
+                'new_connections': self._stats['new_connections'],
+                'connection_reuse_ratio': round(1 - self._stats['new_connections'] / calls, 4) if calls else 0.0,
+                'pool_size': self.pool_size,
+                'last_call': self.last_timing
+            }
+            for phase in ('connect', 'wait', 'transfer', 'total'):
+                metrics[f'avg_{phase}_ms'] = round(self._stats[phase] / calls * 1000, 2) if calls else 0.0
+            return metrics
+    
+    def close(self):
+        """Close pooled connections"""
+        self.session.close()
@@ -2,68 +2,215 @@
 Historical Service
 Stores and retrieves historical price data
 """
+import calendar
+import hashlib
+import os
+import time
 from datetime import datetime, timedelta
 from decimal import Decimal
+from services.history_store import SQLiteHistoryStore, MemoryHistoryStore, MmapHistoryStore, CANDLE_RESOLUTIONS
+from services.query_cache import QueryCache
+from services.visualization_service import lttb_indices
+
+DEFAULT_MAX_POINTS = 3000  # chart points the automatic resolution aims to stay under
+
+def to_epoch(timestamp):
+    """Epoch seconds for a datetime; naive datetimes are treated as UTC"""
+    if timestamp.tzinfo is not None:
+        return int(timestamp.timestamp())
+    return calendar.timegm(timestamp.timetuple())
+
+def parse_timestamp(value):
+    """Naive UTC datetime from epoch seconds or an ISO 8601 string; ValueError if neither"""
+    try:
+        return datetime.utcfromtimestamp(float(value))
+    except (TypeError, ValueError, OverflowError):
+        pass
+    
+    timestamp = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if timestamp.tzinfo is not None:
+        timestamp = datetime.utcfromtimestamp(to_epoch(timestamp))
+    return timestamp
+
+def pick_resolution(start, end, max_points=DEFAULT_MAX_POINTS):
+    """Finest candle resolution whose bucket count over [start, end) fits max_points"""
+    span = to_epoch(end) - to_epoch(start)
+    for name, seconds in CANDLE_RESOLUTIONS.items():
+        if span / seconds <= max_points:
+            return name
+    return name
+
+def candle_count(resolution, days=7, start=None, end=None):
+    """Buckets of a CANDLE_RESOLUTIONS key over [start, end); start defaults to `days` ago, end to now"""
+    now = datetime.utcnow()
+    span = to_epoch(end or now) - to_epoch(start or now - timedelta(days=days))
+    return -(-span // CANDLE_RESOLUTIONS[resolution])
+
+def version_digest(versions, crypto_ids):
+    """Short validator over crypto_ids from {crypto_id: history version}; coins never written count as 0"""
+    h = hashlib.sha1()
+    for crypto_id in sorted(crypto_ids):
+        h.update(f"{crypto_id}@{versions.get(crypto_id, 0)};".encode())
+    return h.hexdigest()[:16]
+
+def align_series(candles):
+    """Shared time axis and per-coin closes (None where a coin has no candle) from {crypto_id: candle rows}"""
+    timestamps = sorted({row[0] for rows in candles.values() for row in rows})
+    index = {bucket: i for i, bucket in enumerate(timestamps)}
+    series = {}
+    for crypto_id, rows in candles.items():
+        closes = [None] * len(timestamps)
+        for row in rows:
+            closes[index[row[0]]] = row[4]
+        series[crypto_id] = closes
+    return timestamps, series
 
 class HistoricalService:
-    def __init__(self):
-        self.prices = {}  # In-memory storage (replace with DynamoDB in production)
-        self.cache = {}
+    def __init__(self, engine=None, store=None, retention_days=90):
+        # 'sqlite' persists to historical_prices and is shared by every worker; 'memory' is per process;
+        # 'mmap' keeps one memory-mapped file per coin for long retention
+        engine = engine or os.getenv('HISTORY_ENGINE', 'sqlite')
+        if store is not None:
+            self.store = store
+        elif engine == 'memory':
+            self.store = MemoryHistoryStore()
+        elif engine == 'mmap':
+            self.store = MmapHistoryStore(os.getenv('HISTORY_MMAP_DIR'))
+        else:
+            self.store = SQLiteHistoryStore(os.getenv('HISTORY_DB_PATH'))
+        
+        self.retention_days = retention_days
+        self.purge_interval = 3600  # seconds between retention sweeps per coin
+        self._last_purge = {}
+        self.cache = QueryCache(int(os.getenv('HISTORY_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+                                int(os.getenv('HISTORY_CACHE_TTL', 60)))
     
     def store_price_snapshot(self, crypto_id, price, timestamp=None):
         """Store a price snapshot"""
+        return self.store_price_snapshots({crypto_id: price}, timestamp)
+    
+    def store_price_snapshots(self, prices, timestamp=None):
+        """Store one snapshot per coin ({crypto_id: price}) in a single batch"""
         try:
             if timestamp is None:
                 timestamp = datetime.utcnow()
+            epoch = to_epoch(timestamp)
             
-            snapshot = {
-                'crypto_id': crypto_id,
-                'price_usd': Decimal(str(price)),
-                'timestamp': timestamp,
-                'recorded_at': timestamp.isoformat(),
-                'source': 'coingecko'
-            }
-            
-            # Store snapshot
-            if crypto_id not in self.prices:
-                self.prices[crypto_id] = []
+            rows = [(crypto_id, epoch, float(price), 'coingecko') for crypto_id, price in prices.items()]
+            self.store.write(rows)
+            for crypto_id in prices:
+                self.cache.invalidate(crypto_id, epoch)
+            self._purge_expired(prices.keys())
             
-            self.prices[crypto_id].append(snapshot)
+            return {'success': True, 'message': f'{len(rows)} price snapshots stored'}
+        
+        except Exception as e:
+            return {'success': False, 'error': 'STORAGE_FAILED', 'message': str(e)}
+    
+    def backfill(self, crypto_id, points, source='coingecko', batch_size=10000):
+        """Bulk-load (epoch, price) points for one coin, skipping ones already stored"""
+        try:
+            cutoff = int(time.time()) - self.retention_days * 86400
+            rows = [(crypto_id, int(epoch), float(price), source) for epoch, price in points if epoch >= cutoff]
             
-            # Keep only last 90 days
-            cutoff_date = datetime.utcnow() - timedelta(days=90)
-            self.prices[crypto_id] = [
-                s for s in self.prices[crypto_id]
-                if s['timestamp'] >= cutoff_date
-            ]
+            inserted = 0
+            for i in range(0, len(rows), batch_size):
+                inserted += self.store.write_missing(rows[i:i + batch_size])
+            if inserted:
+                self.cache.invalidate(crypto_id)
             
-            return {'success': True, 'message': 'Price snapshot stored'}
+            return {'success': True, 'inserted': inserted, 'skipped': len(rows) - inserted}
         
         except Exception as e:
             return {'success': False, 'error': 'STORAGE_FAILED', 'message': str(e)}
     
-    def get_historical_data(self, crypto_id, days=7):
-        """Retrieve historical prices for date range"""
+    def _purge_expired(self, crypto_ids):
+        """Drop points past retention, at most once per purge_interval per coin"""
+        now = time.time()
+        due = [c for c in crypto_ids if now - self._last_purge.get(c, 0) >= self.purge_interval]
+        if not due:
+            return
+        
+        self.store.purge(due, int(now) - self.retention_days * 86400)
+        for crypto_id in due:
+            self._last_purge[crypto_id] = now
+    
+    def get_historical_data(self, crypto_id, days=7, start=None, end=None, resolution='raw', max_points=DEFAULT_MAX_POINTS):
+        """Retrieve historical prices in [start, end); start defaults to `days` ago"""
+        # resolution: 'raw' points, a CANDLE_RESOLUTIONS key for OHLC candles (price_usd is the close),
+        # or 'auto' for the finest candles that fit max_points
         try:
-            start_date = datetime.utcnow() - timedelta(days=days)
+            if start is None:
+                start = datetime.utcnow() - timedelta(days=days)
+            if resolution == 'auto':
+                resolution = pick_resolution(start, end or datetime.utcnow(), max_points)
+            end_epoch = to_epoch(end) if end is not None else None
             
-            if crypto_id not in self.prices:
-                return {'success': True, 'data': []}
+            data = []
+            if resolution == 'raw':
+                # Downsample the numeric columns first and build rows only for the points that are kept
+                epochs, prices = self.store.read_columns(crypto_id, to_epoch(start), end_epoch)
+                kept = lttb_indices(epochs, prices, max_points) if max_points else range(len(epochs))
+                for i in kept:
+                    timestamp = datetime.utcfromtimestamp(int(epochs[i]))
+                    data.append({
+                        'crypto_id': crypto_id,
+                        'price_usd': Decimal(str(float(prices[i]))),
+                        'timestamp': timestamp,
+                        'recorded_at': timestamp.isoformat()
+                    })
+            else:
+                rows = self.store.read_candles(crypto_id, CANDLE_RESOLUTIONS[resolution], to_epoch(start), end_epoch)
+                for bucket, open_, high, low, close, samples in rows:
+                    timestamp = datetime.utcfromtimestamp(bucket)
+                    data.append({
+                        'crypto_id': crypto_id,
+                        'price_usd': Decimal(str(close)),
+                        'open': Decimal(str(open_)),
+                        'high': Decimal(str(high)),
+                        'low': Decimal(str(low)),
+                        'samples': samples,
+                        'timestamp': timestamp,
+                        'recorded_at': timestamp.isoformat()
+                    })
             
-            # Filter by date range
-            filtered_data = [
-                s for s in self.prices[crypto_id]
-                if s['timestamp'] >= start_date
-            ]
-            
-            # Sort by timestamp
-            filtered_data.sort(key=lambda x: x['timestamp'])
+            return {'success': True, 'data': data, 'resolution': resolution}
+        
+        except Exception as e:
+            return {'success': False, 'error': 'FETCH_FAILED', 'message': str(e)}
+    
+    def get_historical_batch(self, crypto_ids, days=7, start=None, end=None, resolution='auto', max_points=DEFAULT_MAX_POINTS):
+        """Closes for several coins on one shared candle axis, read from the store at once"""
+        # Series are not downsampled, so an explicit resolution must fit max_points like 'auto' does
+        if resolution != 'auto' and candle_count(resolution, days, start, end) > max_points:
+            return {'success': False, 'error': 'TOO_MANY_POINTS',
+                    'message': f'{resolution} candles over this window exceed {max_points} points'}
+        try:
+            if start is None:
+                start = datetime.utcnow() - timedelta(days=days)
+            if resolution == 'auto':
+                resolution = pick_resolution(start, end or datetime.utcnow(), max_points)
             
-            return {'success': True, 'data': filtered_data}
+            candles = self.store.read_candles_many(crypto_ids, CANDLE_RESOLUTIONS[resolution], to_epoch(start),
+                                                   to_epoch(end) if end is not None else None)
+            timestamps, series = align_series(candles)
+            return {'success': True, 'resolution': resolution, 'timestamps': timestamps, 'series': series}
         
         except Exception as e:
             return {'success': False, 'error': 'FETCH_FAILED', 'message': str(e)}
     
+    def get_history_version(self, crypto_ids):
+        """Validator that changes whenever stored points for crypto_ids do; None if the store is unreadable"""
+        try:
+            return version_digest(self.store.read_versions(crypto_ids), crypto_ids)
+        except Exception as e:
+            print(f"Error reading history versions: {e}")
+            return None
+    
     def get_cached_historical_data(self, cache_key):
         """Check cache for frequently accessed historical data"""
         return self.cache.get(cache_key)
+    
+    def cache_historical_data(self, cache_key, data, crypto_id, end=None):
+        """Cache a query result until it expires or a new point lands before end"""
+        self.cache.put(cache_key, data, crypto_id, to_epoch(end) if end is not None else None)
@@ -1,17 +1,94 @@
 """
 Historical Service - AWS DynamoDB Implementation
 """
+from bisect import bisect_left
 from datetime import datetime, timedelta
 from decimal import Decimal
 import os
 import time
+import uuid
+from services.historical_service import (pick_resolution, align_series, candle_count, to_epoch, version_digest,
+                                         DEFAULT_MAX_POINTS)
+from services.history_store import CANDLE_RESOLUTIONS, rollup_candles
+from services.query_cache import QueryCache
+
+# Candles kept as items in '{crypto_id}#candle#{name}' partitions; 1m candles are about the size of the
+# raw points, so those are still rolled up on read
+CANDLE_ROLLUPS = ('5m', '1h', '1d')
 
 class HistoricalServiceAWS:
     def __init__(self, dynamodb):
         self.dynamodb = dynamodb
         self.table_name = os.getenv('DYNAMODB_PRICES_TABLE', 'CryptoPrices')
         self.table = dynamodb.Table(self.table_name)
-        self.cache = {}
+        self.cache = QueryCache(int(os.getenv('HISTORY_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+                                int(os.getenv('HISTORY_CACHE_TTL', 60)))
+    
+    def _version_item(self, crypto_id, expires_at):
+        """Item in the coin's '#version' partition, rewritten with a fresh token on every history write"""
+        return {
+            'CryptoTicker': f'{crypto_id}#version',
+            'Timestamp': Decimal(0),
+            'version': uuid.uuid4().hex,
+            'expires_at': expires_at
+        }
+    
+    def _candle_item(self, crypto_id, name, bucket, open_, high, low, close, samples, first_at, last_at):
+        """Item for one stored candle; first_at / last_at let later points move the open and close"""
+        return {
+            'CryptoTicker': f'{crypto_id}#candle#{name}',
+            'Timestamp': Decimal(bucket),
+            'open': Decimal(str(open_)),
+            'high': Decimal(str(high)),
+            'low': Decimal(str(low)),
+            'price_usd': Decimal(str(close)),
+            'samples': samples,
+            'first_at': Decimal(first_at),
+            'last_at': Decimal(last_at),
+            'expires_at': bucket + CANDLE_RESOLUTIONS[name] + 90 * 86400
+        }
+    
+    def _roll_candles(self, batch, points):
+        """Merge (crypto_id, epoch, price) points into the stored candles"""
+        # Read-merge-write, so snapshots for a coin must come from one writer (the refresher or daemon lease holder)
+        keys = {(crypto_id, name, epoch - epoch % CANDLE_RESOLUTIONS[name])
+                for crypto_id, epoch, price in points for name in CANDLE_ROLLUPS}
+        stored = self._batch_get([{'CryptoTicker': f'{crypto_id}#candle#{name}', 'Timestamp': Decimal(bucket)}
+                                  for crypto_id, name, bucket in keys])
+        candles = {(item['CryptoTicker'], int(item['Timestamp'])): item for item in stored}
+        
+        for crypto_id, epoch, price in sorted(points, key=lambda point: point[1]):
+            price = Decimal(str(price))
+            for name in CANDLE_ROLLUPS:
+                bucket = epoch - epoch % CANDLE_RESOLUTIONS[name]
+                candle = candles.get((f'{crypto_id}#candle#{name}', bucket))
+                if candle is None:
+                    candles[(f'{crypto_id}#candle#{name}', bucket)] = self._candle_item(
+                        crypto_id, name, bucket, price, price, price, price, 1, epoch, epoch)
+                    continue
+                if epoch < candle['first_at']:
+                    candle['open'], candle['first_at'] = price, Decimal(epoch)
+                if epoch >= candle['last_at']:
+                    candle['price_usd'], candle['last_at'] = price, Decimal(epoch)
+                candle['high'] = max(candle['high'], price)
+                candle['low'] = min(candle['low'], price)
+                candle['samples'] += 1
+        
+        for candle in candles.values():
+            batch.put_item(Item=candle)
+    
+    def _rebuild_candles(self, batch, crypto_id, points, touched):
+        """Rewrite the stored candles containing any epoch in touched from every point ({epoch: price}) in them"""
+        epochs = sorted(points)
+        prices = [points[epoch] for epoch in epochs]
+        for name in CANDLE_ROLLUPS:
+            resolution = CANDLE_RESOLUTIONS[name]
+            buckets = {epoch - epoch % resolution for epoch in touched}
+            for bucket, open_, high, low, close, samples in rollup_candles(epochs, prices, resolution):
+                if bucket in buckets:
+                    first = bisect_left(epochs, bucket)
+                    batch.put_item(Item=self._candle_item(crypto_id, name, bucket, open_, high, low, close, samples,
+                                                          epochs[first], epochs[first + samples - 1]))
     
     def store_price_snapshot(self, crypto_id, price, timestamp=None):
         """Store a price snapshot to DynamoDB"""
@@ -20,18 +97,22 @@ class HistoricalServiceAWS:
                 timestamp = datetime.utcnow()
             
             # Calculate TTL (90 days from now)
-            ttl = int((datetime.utcnow() + timedelta(days=90)).timestamp())
+            ttl = to_epoch(datetime.utcnow() + timedelta(days=90))
             
             self.table.put_item(
                 Item={
                     'CryptoTicker': crypto_id,  # Partition key
-                    'Timestamp': Decimal(str(int(timestamp.timestamp()))),  # Sort key (Number)
+                    'Timestamp': Decimal(to_epoch(timestamp)),  # Sort key (Number)
                     'price_usd': Decimal(str(price)),
                     'recorded_at': timestamp.isoformat(),
                     'source': 'coingecko',
                     'expires_at': ttl
                 }
             )
+            with self.table.batch_writer() as batch:
+                self._roll_candles(batch, [(crypto_id, to_epoch(timestamp), price)])
+                batch.put_item(Item=self._version_item(crypto_id, ttl))
+            self.cache.invalidate(crypto_id, to_epoch(timestamp))
             
             return {'success': True, 'message': 'Price snapshot stored'}
         
@@ -39,41 +120,216 @@ class HistoricalServiceAWS:
             print(f"Error storing price snapshot: {e}")
             return {'success': False, 'error': 'STORAGE_FAILED', 'message': str(e)}
     
-    def get_historical_data(self, crypto_id, days=7):
-        """Retrieve historical prices for date range"""
+    def store_price_snapshots(self, prices, timestamp=None):
+        """Store one snapshot per coin ({crypto_id: price}) with a batch writer"""
         try:
-            start_date = datetime.utcnow() - timedelta(days=days)
-            start_timestamp = int(start_date.timestamp())
+            if timestamp is None:
+                timestamp = datetime.utcnow()
             
-            response = self.table.query(
-                KeyConditionExpression='CryptoTicker = :cid AND #ts >= :start',
-                ExpressionAttributeNames={'#ts': 'Timestamp'},
-                ExpressionAttributeValues={
-                    ':cid': crypto_id,
-                    ':start': start_timestamp
-                }
-            )
+            ttl = to_epoch(datetime.utcnow() + timedelta(days=90))
+            with self.table.batch_writer() as batch:
+                for crypto_id, price in prices.items():
+                    batch.put_item(
+                        Item={
+                            'CryptoTicker': crypto_id,
+                            'Timestamp': Decimal(to_epoch(timestamp)),
+                            'price_usd': Decimal(str(price)),
+                            'recorded_at': timestamp.isoformat(),
+                            'source': 'coingecko',
+                            'expires_at': ttl
+                        }
+                    )
+                    batch.put_item(Item=self._version_item(crypto_id, ttl))
+                self._roll_candles(batch, [(crypto_id, to_epoch(timestamp), price) for crypto_id, price in prices.items()])
+            for crypto_id in prices:
+                self.cache.invalidate(crypto_id, to_epoch(timestamp))
+            
+            return {'success': True, 'message': f'{len(prices)} price snapshots stored'}
+        
+        except Exception as e:
+            print(f"Error storing price snapshots: {e}")
+            return {'success': False, 'error': 'STORAGE_FAILED', 'message': str(e)}
+    
+    def backfill(self, crypto_id, points, source='coingecko'):
+        """Bulk-load (epoch, price) points for one coin, skipping ones already stored"""
+        try:
+            cutoff = int(time.time()) - 90 * 86400
+            loaded = {}
+            for epoch, price in points:
+                if epoch >= cutoff:
+                    loaded.setdefault(int(epoch), float(price))
+            if not loaded:
+                return {'success': True, 'inserted': 0, 'skipped': 0}
+            
+            # Read the stored points over the whole days being loaded: they decide what is skipped
+            # and the rebuilt candles need them
+            day = CANDLE_RESOLUTIONS['1d']
+            query = self._range_query(crypto_id, min(loaded) - min(loaded) % day, max(loaded) - max(loaded) % day + day)
+            stored = {int(item['Timestamp']): float(item['price_usd'])
+                      for item in self._query_all(dict(query, ProjectionExpression='#ts, price_usd'))}
+            new = {epoch: price for epoch, price in loaded.items() if epoch not in stored}
+            
+            with self.table.batch_writer(overwrite_by_pkeys=['CryptoTicker', 'Timestamp']) as batch:
+                for epoch, price in sorted(new.items()):
+                    batch.put_item(
+                        Item={
+                            'CryptoTicker': crypto_id,
+                            'Timestamp': Decimal(epoch),
+                            'price_usd': Decimal(str(price)),
+                            'recorded_at': datetime.utcfromtimestamp(epoch).isoformat(),
+                            'source': source,
+                            'expires_at': epoch + 90 * 86400
+                        }
+                    )
+                if new:
+                    stored.update(new)
+                    self._rebuild_candles(batch, crypto_id, stored, new)
+                    batch.put_item(Item=self._version_item(crypto_id, int(time.time()) + 90 * 86400))
+            if new:
+                self.cache.invalidate(crypto_id)
+            
+            return {'success': True, 'inserted': len(new), 'skipped': len(loaded) - len(new)}
+        
+        except Exception as e:
+            print(f"Error backfilling {crypto_id}: {e}")
+            return {'success': False, 'error': 'STORAGE_FAILED', 'message': str(e)}
+    
+    def get_historical_data(self, crypto_id, days=7, start=None, end=None, resolution='raw', max_points=DEFAULT_MAX_POINTS):
+        """Retrieve historical prices in [start, end); start defaults to `days` ago"""
+        try:
+            if start is None:
+                start = datetime.utcnow() - timedelta(days=days)
+            if resolution == 'auto':
+                resolution = pick_resolution(start, end or datetime.utcnow(), max_points)
+            end_epoch = to_epoch(end) if end is not None else None
+            
+            if resolution != 'raw':
+                return {'success': True, 'data': self._read_candles(crypto_id, resolution, to_epoch(start), end_epoch),
+                        'resolution': resolution}
+            
+            # Items come back in sort key (Timestamp) order
+            items = self._query_all(self._range_query(crypto_id, to_epoch(start), end_epoch))
             
             # Convert data for JSON serialization
             data = []
-            for item in response['Items']:
+            for item in items:
                 data.append({
                     'crypto_id': item['CryptoTicker'],
                     'price_usd': float(item['price_usd']),
-                    'timestamp': datetime.fromtimestamp(int(item['Timestamp'])),
+                    'timestamp': datetime.utcfromtimestamp(int(item['Timestamp'])),
                     'recorded_at': item['recorded_at'],
                     'source': item.get('source', 'coingecko')
                 })
             
-            # Sort by timestamp
-            data.sort(key=lambda x: x['timestamp'])
-            
-            return {'success': True, 'data': data}
+            return {'success': True, 'data': data, 'resolution': resolution}
         
         except Exception as e:
             print(f"Error fetching historical data: {e}")
             return {'success': False, 'error': 'FETCH_FAILED', 'message': str(e)}
     
+    def get_historical_batch(self, crypto_ids, days=7, start=None, end=None, resolution='auto', max_points=DEFAULT_MAX_POINTS):
+        """Closes for several coins on one shared candle axis"""
+        # DynamoDB has no multi-partition range read, so this is still one query per coin
+        if resolution != 'auto' and candle_count(resolution, days, start, end) > max_points:
+            return {'success': False, 'error': 'TOO_MANY_POINTS',
+                    'message': f'{resolution} candles over this window exceed {max_points} points'}
+        if start is None:
+            start = datetime.utcnow() - timedelta(days=days)
+        if resolution == 'auto':
+            resolution = pick_resolution(start, end or datetime.utcnow(), max_points)
+        
+        candles = {}
+        for crypto_id in crypto_ids:
+            result = self.get_historical_data(crypto_id, start=start, end=end, resolution=resolution)
+            if not result['success']:
+                return result
+            candles[crypto_id] = [(to_epoch(candle['timestamp']), candle['open'], candle['high'], candle['low'],
+                                   candle['price_usd']) for candle in result['data']]
+        
+        timestamps, series = align_series(candles)
+        return {'success': True, 'resolution': resolution, 'timestamps': timestamps, 'series': series}
+    
+    def get_history_version(self, crypto_ids):
+        """Validator from the coins' '#version' items in one batch read; None if DynamoDB is unreachable"""
+        try:
+            items = self._batch_get([{'CryptoTicker': f'{crypto_id}#version', 'Timestamp': Decimal(0)} for crypto_id in crypto_ids])
+            versions = {item['CryptoTicker'][:-len('#version')]: item['version'] for item in items}
+            return version_digest(versions, crypto_ids)
+        
+        except Exception as e:
+            print(f"Error reading history versions: {e}")
+            return None
+    
+    def _batch_get(self, keys):
+        """Items for the given keys, 100 per batch_get_item call, retrying unprocessed keys"""
+        items = []
+        for i in range(0, len(keys), 100):
+            request = {self.table_name: {'Keys': keys[i:i + 100]}}
+            while request:
+                response = self.dynamodb.batch_get_item(RequestItems=request)
+                items.extend(response['Responses'].get(self.table_name, []))
+                request = response.get('UnprocessedKeys')
+        return items
+    
+    def _range_query(self, partition, start, end=None):
+        """Query for a partition's items with start <= Timestamp < end"""
+        if end is None:
+            return dict(
+                KeyConditionExpression='CryptoTicker = :cid AND #ts >= :start',
+                ExpressionAttributeNames={'#ts': 'Timestamp'},
+                ExpressionAttributeValues={
+                    ':cid': partition,
+                    ':start': start
+                }
+            )
+        return dict(
+            KeyConditionExpression='CryptoTicker = :cid AND #ts BETWEEN :start AND :last',
+            ExpressionAttributeNames={'#ts': 'Timestamp'},
+            ExpressionAttributeValues={
+                ':cid': partition,
+                ':start': start,
+                ':last': end - 1
+            }
+        )
+    
+    def _query_all(self, query):
+        """Every item matching query, following LastEvaluatedKey past DynamoDB's 1 MB page limit"""
+        items = []
+        while True:
+            response = self.table.query(**query)
+            items.extend(response['Items'])
+            if 'LastEvaluatedKey' not in response:
+                return items
+            query = dict(query, ExclusiveStartKey=response['LastEvaluatedKey'])
+    
+    def _read_candles(self, crypto_id, name, start, end=None):
+        """OHLC candles covering [start, end), from the stored rollups where they exist"""
+        resolution = CANDLE_RESOLUTIONS[name]
+        start -= start % resolution
+        rows = []
+        if name in CANDLE_ROLLUPS:
+            rows = [(int(item['Timestamp']), float(item['open']), float(item['high']), float(item['low']),
+                     float(item['price_usd']), int(item['samples']))
+                    for item in self._query_all(self._range_query(f'{crypto_id}#candle#{name}', start, end))]
+        
+        # History written before the rollups existed, and 1m candles, are rolled up from the raw points
+        gap_end = rows[0][0] if rows else end
+        if gap_end is None or start < gap_end:
+            items = self._query_all(self._range_query(crypto_id, start, gap_end))
+            rows = rollup_candles([int(item['Timestamp']) for item in items],
+                                  [float(item['price_usd']) for item in items], resolution) + rows
+        
+        data = []
+        for bucket, open_, high, low, close, samples in rows:
+            timestamp = datetime.utcfromtimestamp(bucket)
+            data.append({'crypto_id': crypto_id, 'price_usd': close, 'open': open_, 'high': high, 'low': low,
+                         'samples': samples, 'timestamp': timestamp, 'recorded_at': timestamp.isoformat()})
+        return data
+    
     def get_cached_historical_data(self, cache_key):
         """Check cache for frequently accessed data"""
         return self.cache.get(cache_key)
+    
+    def cache_historical_data(self, cache_key, data, crypto_id, end=None):
+        """Cache a query result until it expires or a new point lands before end"""
+        self.cache.put(cache_key, data, crypto_id, to_epoch(end) if end is not None else None)
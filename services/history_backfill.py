@@ -0,0 +1,196 @@
+"""
+History Backfill
+Bulk-loads historical prices so a coin has charts before live snapshots
+accumulate. Series come from CoinGecko market_chart (or the local stand-in via
+COINGECKO_BASE_URL) or from CSV/JSON files, and are written in large batches
+that skip points already stored. Finished coins are checkpointed in a state
+file, so an interrupted run picks up where it stopped; the checkpoint is cleared
+once a run completes, so the next run tops up every coin.
+
+Usage: python -m services.history_backfill [--coins bitcoin,ethereum] [--days 90]
+                                           [--file prices.csv ...] [--state backfill_state.json] [--restart]
+                                           [--store crypsync.db]
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from dotenv import load_dotenv
+
+from services.historical_service import parse_timestamp, to_epoch
+from services.market_service import MARKET_CHART_DAYS
+
+def to_epoch_seconds(value):
+    """Epoch seconds from epoch seconds/milliseconds or an ISO 8601 string"""
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return to_epoch(parse_timestamp(value))
+    # CoinGecko reports milliseconds; anything past year 5000 in seconds is treated as such
+    return int(value / 1000) if value > 1e11 else int(value)
+
+def load_file(path):
+    """{crypto_id: [(epoch, price), ...]} from a CSV or JSON file"""
+    # CSV: crypto_id,timestamp,price_usd rows. JSON: a list of such objects, or
+    # {crypto_id: market_chart payload or [[timestamp, price], ...]}
+    series = {}
+    if path.lower().endswith('.csv'):
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                price = row.get('price_usd', row.get('price'))
+                series.setdefault(row['crypto_id'].strip(), []).append((to_epoch_seconds(row['timestamp']), float(price)))
+        return series
+    
+    with open(path) as f:
+        data = json.load(f)
+    
+    if isinstance(data, list):
+        for row in data:
+            price = row.get('price_usd', row.get('price'))
+            series.setdefault(row['crypto_id'], []).append((to_epoch_seconds(row['timestamp']), float(price)))
+        return series
+    
+    for crypto_id, points in data.items():
+        if isinstance(points, dict):
+            points = points.get('prices', [])
+        series[crypto_id] = [(to_epoch_seconds(timestamp), float(price)) for timestamp, price in points]
+    return series
+
+class HistoryBackfill:
+    def __init__(self, historical_service, market_service=None, state_file=None):
+        self.historical_service = historical_service
+        self.market_service = market_service
+        self.state_file = state_file
+        self.retries = 5
+        self.retry_delay = 10  # seconds to wait out the rate limit or an open circuit breaker
+        self.state = self._load_state()
+    
+    def _load_state(self):
+        """Coins already finished per source, from the state file"""
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {'done': {}}
+        with open(self.state_file) as f:
+            return json.load(f)
+    
+    def _save_state(self):
+        if not self.state_file:
+            return
+        tmp_path = f"{self.state_file}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_file)
+    
+    def fetch_market_chart(self, crypto_id, days):
+        """(epoch, price) points from CoinGecko market_chart, waiting out rate limits"""
+        for attempt in range(self.retries):
+            result = self.market_service.get_market_chart(crypto_id, days)
+            if result['success']:
+                return {'success': True, 'data': [(to_epoch_seconds(ms), price) for ms, price in result['data'].get('prices', [])]}
+            if result['error'] not in ('RATE_LIMITED', 'API_UNAVAILABLE', 'API_TIMEOUT'):
+                return result
+            time.sleep(self.retry_delay)
+        return result
+    
+    def run(self, crypto_ids, days=90):
+        """Backfill each coin from market_chart, skipping coins a previous run finished"""
+        source = f'market_chart:{days}'
+        return self._run(source, crypto_ids, lambda crypto_id: self.fetch_market_chart(crypto_id, days))
+    
+    def run_file(self, path):
+        """Backfill every coin in a CSV/JSON file"""
+        series = load_file(path)
+        source = f'file:{os.path.abspath(path)}'
+        return self._run(source, sorted(series), lambda crypto_id: {'success': True, 'data': series[crypto_id]},
+                         label='import')
+    
+    def _run(self, source, crypto_ids, load, label='coingecko'):
+        done = set(self.state['done'].get(source, []))
+        summary = {'success': True, 'coins': 0, 'inserted': 0, 'skipped': 0, 'failed': []}
+        started = time.monotonic()
+        
+        for crypto_id in crypto_ids:
+            if crypto_id in done:
+                continue
+            
+            coin_started = time.monotonic()
+            result = load(crypto_id)
+            if result['success']:
+                result = self.historical_service.backfill(crypto_id, result['data'], source=label)
+            if not result['success']:
+                print(f"  {crypto_id}: failed ({result.get('message', result.get('error'))})")
+                summary['failed'].append(crypto_id)
+                continue
+            
+            elapsed = time.monotonic() - coin_started
+            rows = result['inserted'] + result['skipped']
+            print(f"  {crypto_id}: {result['inserted']} new, {result['skipped']} already stored "
+                  f"({rows / elapsed if elapsed else 0:,.0f} rows/s)")
+            
+            summary['coins'] += 1
+            summary['inserted'] += result['inserted']
+            summary['skipped'] += result['skipped']
+            done.add(crypto_id)
+            self.state['done'][source] = sorted(done)
+            self._save_state()
+        
+        # A complete run needs no resume point; keeping it would make the next run skip every coin
+        if not summary['failed'] and source in self.state['done']:
+            del self.state['done'][source]
+            self._save_state()
+        
+        elapsed = time.monotonic() - started
+        summary['seconds'] = round(elapsed, 2)
+        summary['rows_per_second'] = round((summary['inserted'] + summary['skipped']) / elapsed) if elapsed else 0
+        summary['success'] = not summary['failed']
+        return summary
+
+def main():
+    load_dotenv()
+    
+    parser = argparse.ArgumentParser(description='CrypSync historical price backfill')
+    parser.add_argument('--coins', help='comma-separated coin ids (defaults to the tracked price universe)')
+    parser.add_argument('--days', default='90', choices=MARKET_CHART_DAYS, help='days of market_chart history per coin')
+    parser.add_argument('--file', action='append', default=[], help='CSV or JSON file to import instead of CoinGecko')
+    parser.add_argument('--state', default='backfill_state.json', help='checkpoint file for resuming')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and redo every coin')
+    parser.add_argument('--store', default=os.getenv('PRICE_STORE_PATH'),
+                        help='SQLite file holding the rate-limit budget shared with the web workers and daemon')
+    args = parser.parse_args()
+    
+    from database import init_database
+    from services.price_daemon import build_historical_service
+    init_database()
+    
+    if args.restart and os.path.exists(args.state):
+        os.remove(args.state)
+    backfill = HistoryBackfill(build_historical_service(), state_file=args.state)
+    
+    if args.file:
+        summaries = []
+        for path in args.file:
+            print(f"Importing {path}")
+            summaries.append(backfill.run_file(path))
+    else:
+        from services.admin_service import AdminService
+        from services.market_service import MarketService
+        from services.price_service import PriceService
+        from services.shared_price_store import SharedPriceStore
+        # Draw on the same CoinGecko budget as the web workers and daemon, so a bulk run cannot push them into 429s
+        price_service = PriceService()
+        price_service.use_shared_store(SharedPriceStore(args.store))
+        backfill.market_service = MarketService(price_service)
+        crypto_ids = [c.strip().lower() for c in args.coins.split(',') if c.strip()] if args.coins \
+            else sorted(AdminService().get_price_universe())
+        print(f"Backfilling {len(crypto_ids)} coins, {args.days} days each")
+        summaries = [backfill.run(crypto_ids, args.days)]
+    
+    for summary in summaries:
+        print(f"Done: {summary['coins']} coins, {summary['inserted']} rows written, {summary['skipped']} already stored "
+              f"in {summary['seconds']}s ({summary['rows_per_second']:,} rows/s)")
+        if summary['failed']:
+            print(f"Failed (rerun to retry): {', '.join(summary['failed'])}")
+
+if __name__ == '__main__':
+    main()
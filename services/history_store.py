@@ -0,0 +1,847 @@
+"""
+History Store
+Storage engines behind HistoricalService. Rows are (epoch seconds, price, source)
+per coin, always returned in time order; read_columns() returns the same window as
+int64/float64 columns for numeric work. Every write also rolls the points into OHLC
+candles at each of CANDLE_RESOLUTIONS, read back with read_candles(); the mmap
+engine rolls them up from its records at read time instead. read_versions() gives
+a per-coin token that changes whenever a coin's stored points do.
+"""
+import bisect
+import fcntl
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import threading
+from array import array
+from contextlib import contextmanager
+from itertools import repeat
+from database import DATABASE_PATH, init_historical_tables
+
+try:
+    import numpy
+except ImportError:  # optional: columns stay as array.array
+    numpy = None
+
+# Candle widths in seconds, finest first
+CANDLE_RESOLUTIONS = {'1m': 60, '5m': 300, '1h': 3600, '1d': 86400}
+
+# mmap engine record: int64 epoch seconds, float64 price, native byte order
+RECORD = struct.Struct('=qd')
+FLOOR = struct.Struct('=q')  # retention cutoff in a coin's .floor sidecar file
+COIN_FILE_PATTERN = re.compile(r'^[a-z0-9][a-z0-9-]{0,99}$')
+
+def as_columns(epochs, prices):
+    """Wrap int64/float64 arrays as NumPy arrays without copying when NumPy is installed"""
+    if numpy is None:
+        return epochs, prices
+    return numpy.frombuffer(epochs, dtype=numpy.int64), numpy.frombuffer(prices, dtype=numpy.float64)
+
+def rollup_candles(epochs, prices, resolution):
+    """(bucket, open, high, low, close, samples) from time-ordered epoch/price columns"""
+    if not len(epochs):
+        return []
+    
+    if numpy is not None:
+        epochs = numpy.asarray(epochs)
+        prices = numpy.asarray(prices)
+        buckets = epochs - epochs % resolution
+        starts = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(buckets)) + 1))
+        ends = numpy.append(starts[1:], len(epochs))
+        return list(zip(buckets[starts].tolist(), prices[starts].tolist(),
+                        numpy.maximum.reduceat(prices, starts).tolist(),
+                        numpy.minimum.reduceat(prices, starts).tolist(),
+                        prices[ends - 1].tolist(), (ends - starts).tolist()))
+    
+    candles = []
+    for epoch, price in zip(epochs, prices):
+        bucket = epoch - epoch % resolution
+        if candles and candles[-1][0] == bucket:
+            candle = candles[-1]
+            candle[2] = max(candle[2], price)
+            candle[3] = min(candle[3], price)
+            candle[4] = price
+            candle[5] += 1
+        else:
+            candles.append([bucket, price, price, price, price, 1])
+    return [tuple(candle) for candle in candles]
+
+class SQLiteHistoryStore:
+    def __init__(self, db_path=None, busy_timeout=5):
+        self.db_path = db_path or DATABASE_PATH
+        self.busy_timeout = busy_timeout
+        
+        conn = self._connect()
+        try:
+            # WAL lets every worker read history while the refresher writes
+            conn.execute('PRAGMA journal_mode=WAL')
+            init_historical_tables(conn.cursor())
+            needs_rollup = (conn.execute('SELECT 1 FROM price_candles LIMIT 1').fetchone() is None and
+                            conn.execute('SELECT 1 FROM historical_prices LIMIT 1').fetchone() is not None)
+        finally:
+            conn.close()
+        
+        # History recorded before candles existed
+        if needs_rollup:
+            self.rebuild_candles()
+    
+    def _connect(self):
+        """Open a connection in autocommit mode so transactions are explicit"""
+        return sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None)
+    
+    def write(self, rows):
+        """Insert (crypto_id, epoch, price, source) rows in one transaction, replacing points at the same epoch"""
+        if not rows:
+            return 0
+        
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            replaced = self._replaced_keys(conn, rows)
+            conn.executemany('''
+                INSERT OR REPLACE INTO historical_prices (crypto_id, timestamp, price_usd, source)
+                VALUES (?, ?, ?, ?)
+            ''', rows)
+            
+            # A replaced price is already folded into its candles, so those buckets are rebuilt from the table
+            stale = {(crypto_id, resolution, epoch - epoch % resolution)
+                     for crypto_id, epoch in replaced for resolution in CANDLE_RESOLUTIONS.values()}
+            self._roll_candles(conn, rows, skip=stale)
+            self._rebuild_buckets(conn, stale)
+            self._bump_versions(conn, {row[0] for row in rows})
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return len(rows)
+    
+    def write_missing(self, rows):
+        """Insert only rows whose (crypto_id, epoch) is not stored yet; returns how many were new"""
+        if not rows:
+            return 0
+        
+        by_coin = {}
+        for row in rows:
+            by_coin.setdefault(row[0], []).append(row)
+        
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            new_rows = []
+            for crypto_id, coin_rows in by_coin.items():
+                epochs = [row[1] for row in coin_rows]
+                seen = {epoch for (epoch,) in conn.execute('''
+                    SELECT timestamp FROM historical_prices
+                    WHERE crypto_id = ? AND timestamp BETWEEN ? AND ?
+                ''', (crypto_id, min(epochs), max(epochs)))}
+                for row in coin_rows:
+                    if row[1] not in seen:
+                        seen.add(row[1])
+                        new_rows.append(row)
+            
+            conn.executemany('''
+                INSERT INTO historical_prices (crypto_id, timestamp, price_usd, source)
+                VALUES (?, ?, ?, ?)
+            ''', new_rows)
+            self._roll_candles(conn, new_rows)
+            self._bump_versions(conn, {row[0] for row in new_rows})
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return len(new_rows)
+    
+    def _bump_versions(self, conn, crypto_ids):
+        """Mark the coins' history as changed; call inside the writing transaction"""
+        conn.executemany('''
+            INSERT INTO history_versions (crypto_id, version) VALUES (?, 1)
+            ON CONFLICT(crypto_id) DO UPDATE SET version = version + 1
+        ''', [(crypto_id,) for crypto_id in crypto_ids])
+    
+    def read_versions(self, crypto_ids):
+        """{crypto_id: history version} for the coins that have ever been written"""
+        placeholders = ','.join('?' * len(crypto_ids))
+        conn = self._connect()
+        try:
+            return dict(conn.execute(f'SELECT crypto_id, version FROM history_versions WHERE crypto_id IN ({placeholders})',
+                                     list(crypto_ids)).fetchall())
+        finally:
+            conn.close()
+    
+    def _replaced_keys(self, conn, rows):
+        """(crypto_id, epoch) of rows that overwrite a stored point or repeat earlier in the batch"""
+        keys = set()
+        replaced = set()
+        for row in rows:
+            key = (row[0], int(row[1]))
+            (replaced if key in keys else keys).add(key)
+        
+        keys = list(keys)
+        for i in range(0, len(keys), 400):
+            chunk = keys[i:i + 400]
+            # Joining against the VALUES list probes the primary key per row; IN (VALUES ...) would scan the table
+            replaced.update(conn.execute(f'''
+                SELECT h.crypto_id, h.timestamp FROM (VALUES {','.join(['(?, ?)'] * len(chunk))}) AS k
+                JOIN historical_prices AS h ON h.crypto_id = k.column1 AND h.timestamp = k.column2
+            ''', [value for key in chunk for value in key]).fetchall())
+        return replaced
+    
+    def _rebuild_buckets(self, conn, buckets):
+        """Recompute (crypto_id, resolution, bucket) candles from historical_prices (caller holds the transaction)"""
+        for crypto_id, resolution, bucket in buckets:
+            points = conn.execute('''
+                SELECT timestamp, price_usd FROM historical_prices
+                WHERE crypto_id = ? AND timestamp >= ? AND timestamp < ?
+                ORDER BY timestamp
+            ''', (crypto_id, bucket, bucket + resolution)).fetchall()
+            if not points:
+                continue
+            prices = [price for _, price in points]
+            conn.execute('''
+                INSERT OR REPLACE INTO price_candles
+                    (crypto_id, resolution, bucket, open, high, low, close, samples, first_ts, last_ts)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (crypto_id, resolution, bucket, prices[0], max(prices), min(prices), prices[-1], len(points),
+                  points[0][0], points[-1][0]))
+    
+    def _roll_candles(self, conn, rows, skip=()):
+        """Fold (crypto_id, epoch, price, ...) rows into their candles, except buckets in skip (caller holds the transaction)"""
+        # Merge the batch per bucket first so a bulk load upserts each candle once, not once per point
+        candles = {}
+        for row in sorted(rows, key=lambda row: row[1]):
+            crypto_id, epoch, price = row[0], row[1], row[2]
+            for resolution in CANDLE_RESOLUTIONS.values():
+                key = (crypto_id, resolution, epoch - epoch % resolution)
+                if key in skip:
+                    continue
+                candle = candles.get(key)
+                if candle is None:
+                    candles[key] = [price, price, price, price, 1, epoch, epoch]
+                else:
+                    candle[1] = max(candle[1], price)
+                    candle[2] = min(candle[2], price)
+                    candle[3] = price
+                    candle[4] += 1
+                    candle[6] = epoch
+        
+        # Column references in DO UPDATE see the stored candle, excluded.* the incoming one
+        conn.executemany('''
+            INSERT INTO price_candles (crypto_id, resolution, bucket, open, high, low, close, samples, first_ts, last_ts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (crypto_id, resolution, bucket) DO UPDATE SET
+                open = CASE WHEN excluded.first_ts < first_ts THEN excluded.open ELSE open END,
+                close = CASE WHEN excluded.last_ts >= last_ts THEN excluded.close ELSE close END,
+                high = MAX(high, excluded.high),
+                low = MIN(low, excluded.low),
+                samples = samples + excluded.samples,
+                first_ts = MIN(first_ts, excluded.first_ts),
+                last_ts = MAX(last_ts, excluded.last_ts)
+        ''', [key + tuple(candle) for key, candle in candles.items()])
+    
+    def rebuild_candles(self):
+        """Roll up every stored point from scratch, e.g. after history was written without candles"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM price_candles')
+            rows = conn.execute('''
+                SELECT crypto_id, timestamp, price_usd FROM historical_prices
+                ORDER BY crypto_id, timestamp
+            ''').fetchall()
+            self._roll_candles(conn, rows)
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return len(rows)
+    
+    def read(self, crypto_id, start, end=None):
+        """(epoch, price, source) rows with start <= epoch < end, via the primary key range"""
+        conn = self._connect()
+        try:
+            if end is None:
+                return conn.execute('''
+                    SELECT timestamp, price_usd, source FROM historical_prices
+                    WHERE crypto_id = ? AND timestamp >= ?
+                    ORDER BY timestamp
+                ''', (crypto_id, start)).fetchall()
+            return conn.execute('''
+                SELECT timestamp, price_usd, source FROM historical_prices
+                WHERE crypto_id = ? AND timestamp >= ? AND timestamp < ?
+                ORDER BY timestamp
+            ''', (crypto_id, start, end)).fetchall()
+        finally:
+            conn.close()
+    
+    def read_candles(self, crypto_id, resolution, start, end=None):
+        """(bucket, open, high, low, close, samples) for the candles covering [start, end)"""
+        start -= start % resolution
+        conn = self._connect()
+        try:
+            if end is None:
+                return conn.execute('''
+                    SELECT bucket, open, high, low, close, samples FROM price_candles
+                    WHERE crypto_id = ? AND resolution = ? AND bucket >= ?
+                    ORDER BY bucket
+                ''', (crypto_id, resolution, start)).fetchall()
+            return conn.execute('''
+                SELECT bucket, open, high, low, close, samples FROM price_candles
+                WHERE crypto_id = ? AND resolution = ? AND bucket >= ? AND bucket < ?
+                ORDER BY bucket
+            ''', (crypto_id, resolution, start, end)).fetchall()
+        finally:
+            conn.close()
+    
+    def read_candles_many(self, crypto_ids, resolution, start, end=None):
+        """{crypto_id: candle rows} for several coins in one query"""
+        start -= start % resolution
+        placeholders = ','.join('?' * len(crypto_ids))
+        params = [resolution, *crypto_ids, start]
+        if end is not None:
+            params.append(end)
+        
+        conn = self._connect()
+        try:
+            rows = conn.execute(f'''
+                SELECT crypto_id, bucket, open, high, low, close, samples FROM price_candles
+                WHERE resolution = ? AND crypto_id IN ({placeholders}) AND bucket >= ?
+                {'AND bucket < ?' if end is not None else ''}
+                ORDER BY crypto_id, bucket
+            ''', params).fetchall()
+        finally:
+            conn.close()
+        
+        candles = {crypto_id: [] for crypto_id in crypto_ids}
+        for row in rows:
+            candles[row[0]].append(row[1:])
+        return candles
+    
+    def read_columns(self, crypto_id, start, end=None):
+        """(epochs, prices) for start <= epoch < end as int64/float64 columns"""
+        rows = self.read(crypto_id, start, end)
+        return as_columns(array('q', [row[0] for row in rows]), array('d', [row[1] for row in rows]))
+    
+    def purge(self, crypto_ids, before):
+        """Delete rows older than before for the given coins"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            purged = [crypto_id for crypto_id in crypto_ids if conn.execute(
+                'DELETE FROM historical_prices WHERE crypto_id = ? AND timestamp < ?', (crypto_id, before)).rowcount]
+            # Drop candles only once their whole bucket is past retention
+            conn.executemany('DELETE FROM price_candles WHERE crypto_id = ? AND resolution = ? AND bucket < ?', [
+                (crypto_id, resolution, before - before % resolution)
+                for crypto_id in crypto_ids
+                for resolution in CANDLE_RESOLUTIONS.values()
+            ])
+            self._bump_versions(conn, purged)
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+class PriceColumns:
+    """One coin's history as parallel contiguous columns, 17 bytes per point"""
+    
+    def __init__(self):
+        self.epochs = array('q')   # int64 epoch seconds, ascending
+        self.prices = array('d')   # float64 USD
+        self.sources = array('B')  # index into MemoryHistoryStore.sources
+        self.head = 0              # points before head have expired
+        self.shared = False        # epochs/prices are viewed by read_columns callers
+    
+    def __len__(self):
+        return len(self.epochs) - self.head
+    
+    def detach(self):
+        """Copy-on-write: move to fresh epoch/price buffers, leaving earlier read_columns views on the old ones"""
+        if self.shared:
+            self.epochs = self.epochs[:]
+            self.prices = self.prices[:]
+            self.shared = False
+    
+    def bounds(self, start, end=None):
+        """Index range of the points with start <= epoch < end"""
+        lo = bisect.bisect_left(self.epochs, start, self.head)
+        hi = len(self.epochs) if end is None else bisect.bisect_left(self.epochs, end, lo)
+        return lo, hi
+
+class CandleColumns:
+    """One coin's candles at one resolution as parallel columns, ordered by bucket"""
+    
+    def __init__(self):
+        self.buckets = array('q')
+        self.open = array('d')
+        self.high = array('d')
+        self.low = array('d')
+        self.close = array('d')
+        self.samples = array('q')
+        self.first_ts = array('q')
+        self.last_ts = array('q')
+        self.head = 0
+    
+    def add(self, bucket, epoch, price):
+        """Fold one point into the candle for its bucket"""
+        buckets = self.buckets
+        if buckets and buckets[-1] == bucket:
+            i = len(buckets) - 1
+        elif not buckets or bucket > buckets[-1]:
+            self._insert(len(buckets), bucket, epoch, price)
+            return
+        else:
+            i = bisect.bisect_left(buckets, bucket, self.head)
+            if i == len(buckets) or buckets[i] != bucket:
+                self._insert(i, bucket, epoch, price)
+                return
+        
+        if epoch < self.first_ts[i]:
+            self.open[i] = price
+            self.first_ts[i] = epoch
+        if epoch >= self.last_ts[i]:
+            self.close[i] = price
+            self.last_ts[i] = epoch
+        if price > self.high[i]:
+            self.high[i] = price
+        if price < self.low[i]:
+            self.low[i] = price
+        self.samples[i] += 1
+    
+    def reset(self, bucket, epochs, prices):
+        """Recompute the candle for bucket from all of its time-ordered points"""
+        i = bisect.bisect_left(self.buckets, bucket, self.head)
+        if i == len(self.buckets) or self.buckets[i] != bucket or not len(epochs):
+            return
+        self.open[i], self.close[i] = prices[0], prices[-1]
+        self.high[i], self.low[i] = max(prices), min(prices)
+        self.samples[i] = len(epochs)
+        self.first_ts[i], self.last_ts[i] = epochs[0], epochs[-1]
+    
+    def _insert(self, i, bucket, epoch, price):
+        for column, value in ((self.buckets, bucket), (self.open, price), (self.high, price), (self.low, price),
+                              (self.close, price), (self.samples, 1), (self.first_ts, epoch), (self.last_ts, epoch)):
+            column.insert(i, value)
+    
+    def rows(self, start, end=None):
+        """(bucket, open, high, low, close, samples) for buckets in [start, end)"""
+        lo = bisect.bisect_left(self.buckets, start, self.head)
+        hi = len(self.buckets) if end is None else bisect.bisect_left(self.buckets, end, lo)
+        return list(zip(self.buckets[lo:hi], self.open[lo:hi], self.high[lo:hi], self.low[lo:hi],
+                        self.close[lo:hi], self.samples[lo:hi]))
+    
+    def expire(self, before):
+        """Advance past buckets older than before, compacting like PriceColumns"""
+        self.head = bisect.bisect_left(self.buckets, before, self.head)
+        if self.head > len(self.buckets) // 2:
+            for column in (self.buckets, self.open, self.high, self.low, self.close,
+                           self.samples, self.first_ts, self.last_ts):
+                del column[:self.head]
+            self.head = 0
+
+class MemoryHistoryStore:
+    def __init__(self):
+        # crypto_id -> PriceColumns; points stay in time order and expired ones sit before head,
+        # so inserts append in O(1) and eviction only moves the head
+        self.prices = {}
+        self.candles = {}  # (crypto_id, resolution) -> CandleColumns
+        self.sources = []
+        self._source_codes = {}
+        self._lock = threading.RLock()  # writers vs. read_columns handing out views
+        self.versions = {}  # crypto_id -> writes and purges so far
+        self._instance = os.urandom(4).hex()  # versions are per process, so tag them with this store
+    
+    def write(self, rows):
+        """Add (crypto_id, epoch, price, source) rows, replacing any point at the same epoch"""
+        with self._lock:
+            self._write(rows)
+        return len(rows)
+    
+    def _write(self, rows):
+        for crypto_id, epoch, price, source in rows:
+            epoch, price = int(epoch), float(price)
+            self.versions[crypto_id] = self.versions.get(crypto_id, 0) + 1
+            series = self.prices.get(crypto_id)
+            if series is None:
+                series = self.prices[crypto_id] = PriceColumns()
+                for resolution in CANDLE_RESOLUTIONS.values():
+                    self.candles[(crypto_id, resolution)] = CandleColumns()
+            
+            code = self._source_codes.get(source)
+            if code is None:
+                code = self._source_codes[source] = len(self.sources)
+                self.sources.append(source)
+            
+            series.detach()
+            epochs = series.epochs
+            if not epochs or epoch > epochs[-1]:
+                epochs.append(epoch)
+                series.prices.append(price)
+                series.sources.append(code)
+                self._add_to_candles(crypto_id, epoch, price)
+                continue
+            
+            # Same epoch replaces; a late arrival is placed to keep the time order bisection relies on
+            i = bisect.bisect_left(epochs, epoch, series.head)
+            if i < len(epochs) and epochs[i] == epoch:
+                series.prices[i] = price
+                series.sources[i] = code
+                self._rebuild_candles(crypto_id, series, epoch)
+            else:
+                epochs.insert(i, epoch)
+                series.prices.insert(i, price)
+                series.sources.insert(i, code)
+                self._add_to_candles(crypto_id, epoch, price)
+    
+    def _add_to_candles(self, crypto_id, epoch, price):
+        """Fold a newly inserted point into its candle at every resolution"""
+        for resolution in CANDLE_RESOLUTIONS.values():
+            self.candles[(crypto_id, resolution)].add(epoch - epoch % resolution, epoch, price)
+    
+    def _rebuild_candles(self, crypto_id, series, epoch):
+        """Recompute the candles containing epoch after its price was replaced"""
+        for resolution in CANDLE_RESOLUTIONS.values():
+            bucket = epoch - epoch % resolution
+            lo = bisect.bisect_left(series.epochs, bucket)
+            hi = bisect.bisect_left(series.epochs, bucket + resolution, lo)
+            self.candles[(crypto_id, resolution)].reset(bucket, series.epochs[lo:hi], series.prices[lo:hi])
+    
+    def write_missing(self, rows):
+        """Add only rows whose (crypto_id, epoch) is not stored yet; returns how many were new"""
+        with self._lock:
+            return self._write_missing(rows)
+    
+    def _write_missing(self, rows):
+        by_coin = {}
+        for crypto_id, epoch, price, source in rows:
+            by_coin.setdefault(crypto_id, {}).setdefault(int(epoch), (float(price), source))
+        
+        added = 0
+        for crypto_id, points in by_coin.items():
+            series = self.prices.get(crypto_id)
+            if series is not None:
+                live = series.epochs[series.head:]
+                for epoch in live:
+                    points.pop(epoch, None)
+            if not points:
+                continue
+            added += len(points)
+            
+            new_rows = [(crypto_id, epoch, price, source) for epoch, (price, source) in sorted(points.items())]
+            if series is None or not len(series) or new_rows[0][1] > series.epochs[-1]:
+                self.write(new_rows)
+                continue
+            
+            # Inserting a long backfill one point at a time would shift the columns per point; rebuild in one pass
+            merged = sorted(new_rows + [(crypto_id, epoch, price, self.sources[code]) for epoch, price, code in
+                                        zip(live, series.prices[series.head:], series.sources[series.head:])],
+                            key=lambda row: row[1])
+            del self.prices[crypto_id]
+            self.write(merged)
+        return added
+    
+    def read(self, crypto_id, start, end=None):
+        """(epoch, price, source) rows with start <= epoch < end, found by bisection"""
+        series = self.prices.get(crypto_id)
+        if series is None:
+            return []
+        
+        lo, hi = series.bounds(start, end)
+        sources = self.sources
+        return list(zip(series.epochs[lo:hi], series.prices[lo:hi],
+                        [sources[code] for code in series.sources[lo:hi]]))
+    
+    def read_versions(self, crypto_ids):
+        """{crypto_id: history version} for the coins that have been written in this process"""
+        return {crypto_id: f'{self._instance}.{self.versions[crypto_id]}' for crypto_id in crypto_ids
+                if crypto_id in self.versions}
+    
+    def read_candles(self, crypto_id, resolution, start, end=None):
+        """(bucket, open, high, low, close, samples) for the candles covering [start, end)"""
+        candles = self.candles.get((crypto_id, resolution))
+        if candles is None:
+            return []
+        return candles.rows(start - start % resolution, end)
+    
+    def read_candles_many(self, crypto_ids, resolution, start, end=None):
+        """{crypto_id: candle rows} for several coins"""
+        return {crypto_id: self.read_candles(crypto_id, resolution, start, end) for crypto_id in crypto_ids}
+    
+    def read_columns(self, crypto_id, start, end=None):
+        """(epochs, prices) for start <= epoch < end as int64/float64 columns"""
+        series = self.prices.get(crypto_id)
+        if series is None:
+            return as_columns(array('q'), array('d'))
+        
+        # Views straight onto the live columns; the next write moves to fresh buffers instead of resizing these
+        with self._lock:
+            lo, hi = series.bounds(start, end)
+            series.shared = True
+            return as_columns(memoryview(series.epochs)[lo:hi], memoryview(series.prices)[lo:hi])
+    
+    def purge(self, crypto_ids, before):
+        """Expire points older than before by advancing each coin's head"""
+        with self._lock:
+            self._purge(crypto_ids, before)
+    
+    def _purge(self, crypto_ids, before):
+        for crypto_id in crypto_ids:
+            series = self.prices.get(crypto_id)
+            if series is None:
+                continue
+            
+            head = bisect.bisect_left(series.epochs, before, series.head)
+            if head != series.head:
+                series.head = head
+                self.versions[crypto_id] = self.versions.get(crypto_id, 0) + 1
+            for resolution in CANDLE_RESOLUTIONS.values():
+                self.candles[(crypto_id, resolution)].expire(before - before % resolution)
+            
+            # Compact once the dead prefix outweighs the live points, keeping eviction amortised O(1)
+            if series.head > len(series.epochs) // 2:
+                # Slices rather than del: del would resize buffers read_columns views may still hold
+                series.epochs = series.epochs[series.head:]
+                series.prices = series.prices[series.head:]
+                series.sources = series.sources[series.head:]
+                series.shared = False
+                series.head = 0
+
+class MmapHistoryStore:
+    def __init__(self, directory=None, source='coingecko'):
+        # One append-only file of RECORD-sized (epoch, price) entries per coin, in time order;
+        # every worker maps the same files, so the OS page cache holds one copy
+        self.directory = directory or 'price_history'
+        self.source = source  # records carry no source; reads report this one
+        os.makedirs(self.directory, exist_ok=True)
+        
+        self._maps = {}  # crypto_id -> (inode, byte size, (epochs, prices) views)
+        self._floors = {}  # crypto_id -> (sidecar inode, retention cutoff)
+        self._lock = threading.Lock()
+    
+    def _path(self, crypto_id, suffix='bin'):
+        if not COIN_FILE_PATTERN.match(crypto_id):
+            raise ValueError(f'Invalid coin id: {crypto_id}')
+        return os.path.join(self.directory, f'{crypto_id}.{suffix}')
+    
+    def _floor(self, crypto_id):
+        """Retention cutoff any process has purged the coin to, read from its sidecar file (None if never purged)"""
+        path = self._path(crypto_id, 'floor')
+        try:
+            inode = os.stat(path).st_ino
+        except FileNotFoundError:
+            return None
+        
+        cached = self._floors.get(crypto_id)
+        if cached is not None and cached[0] == inode:
+            return cached[1]
+        with open(path, 'rb') as f:
+            floor = FLOOR.unpack(f.read(FLOOR.size))[0]
+        self._floors[crypto_id] = (inode, floor)
+        return floor
+    
+    def _set_floor(self, crypto_id, before):
+        """Persist a higher retention cutoff so every worker's reads apply it (caller holds the lock)"""
+        floor = self._floor(crypto_id)
+        if floor is not None and floor >= before:
+            return
+        # Swapped in whole, so the new inode tells other processes to reread it
+        path = self._path(crypto_id, 'floor')
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as tmp:
+            tmp.write(FLOOR.pack(before))
+        os.replace(tmp_path, path)
+    
+    @contextmanager
+    def _locked(self, crypto_id):
+        """Open a coin's file under an exclusive flock, shared by writers in every process"""
+        path = self._path(crypto_id)
+        while True:
+            f = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b')
+            fcntl.flock(f, fcntl.LOCK_EX)
+            # A compaction may have replaced the file while we waited; lock the new one instead
+            if os.path.exists(path) and os.stat(path).st_ino == os.fstat(f.fileno()).st_ino:
+                break
+            f.close()
+        try:
+            size = os.fstat(f.fileno()).st_size
+            if size % RECORD.size:
+                # Drop a record torn by a crash mid-append
+                f.truncate(size - size % RECORD.size)
+            yield f
+        finally:
+            f.close()
+    
+    def write(self, rows):
+        """Append (crypto_id, epoch, price, source) rows, replacing any point at the same epoch"""
+        self._write(rows, replace=True)
+        return len(rows)
+    
+    def write_missing(self, rows):
+        """Add only rows whose (crypto_id, epoch) is not stored yet; returns how many were new"""
+        return self._write(rows, replace=False)
+    
+    def _write(self, rows, replace):
+        # Duplicate epochs within the batch: the last wins on replace, the first otherwise
+        by_coin = {}
+        for crypto_id, epoch, price, source in rows:
+            points = by_coin.setdefault(crypto_id, {})
+            if replace:
+                points[int(epoch)] = float(price)
+            else:
+                points.setdefault(int(epoch), float(price))
+        
+        added = 0
+        for crypto_id, points in by_coin.items():
+            points = sorted(points.items())
+            with self._locked(crypto_id) as f:
+                size = os.fstat(f.fileno()).st_size
+                last = None
+                if size:
+                    f.seek(size - RECORD.size)
+                    last = RECORD.unpack(f.read(RECORD.size))[0]
+                
+                if last is None or points[0][0] > last:
+                    f.seek(size)
+                    f.write(b''.join(RECORD.pack(epoch, price) for epoch, price in points))
+                    added += len(points)
+                elif points[0][0] == last and len(points) == 1:
+                    # The same snapshot recorded twice: overwrite the last record in place
+                    if replace:
+                        f.seek(size - RECORD.size)
+                        f.write(RECORD.pack(*points[0]))
+                else:
+                    # Late or backfilled points: merge and swap in a rewritten file
+                    f.seek(0)
+                    stored = dict(RECORD.iter_unpack(f.read()))
+                    merged = dict(stored) if replace else dict(points)
+                    merged.update(points if replace else stored)
+                    added += len(merged) - len(stored)
+                    self._replace(crypto_id, b''.join(RECORD.pack(epoch, price) for epoch, price in sorted(merged.items())))
+        return added
+    
+    def _replace(self, crypto_id, data):
+        """Atomically swap in a new file of packed records (caller holds the lock); readers remap on their next read"""
+        path = self._path(crypto_id)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, path)
+    
+    def _columns(self, crypto_id):
+        """Zero-copy (epochs, prices) views over the coin's mapped file, remapped when it changes"""
+        try:
+            st = os.stat(self._path(crypto_id))
+        except FileNotFoundError:
+            return None
+        size = st.st_size - st.st_size % RECORD.size
+        
+        with self._lock:
+            cached = self._maps.get(crypto_id)
+            if cached is not None and cached[:2] == (st.st_ino, size):
+                return cached[2]
+            if not size:
+                return None
+            
+            with open(self._path(crypto_id), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            # Old mappings are dropped rather than closed, so views handed out earlier stay valid
+            if numpy is not None:
+                records = numpy.frombuffer(mapped, dtype=[('epoch', '=i8'), ('price', '=f8')])
+                columns = (records['epoch'], records['price'])
+            else:
+                view = memoryview(mapped)
+                columns = (view.cast('q')[0::2], view.cast('d')[1::2])
+            self._maps[crypto_id] = (st.st_ino, size, columns)
+            return columns
+    
+    def _window(self, crypto_id, start, end=None):
+        """Views of the points with start <= epoch < end, or None when the coin has no file"""
+        columns = self._columns(crypto_id)
+        if columns is None:
+            return None
+        
+        epochs, prices = columns
+        floor = self._floor(crypto_id)
+        if floor is not None:
+            start = max(start, floor)
+        lo = self._bisect(epochs, start)
+        hi = len(epochs) if end is None else self._bisect(epochs, end, lo)
+        return epochs[lo:hi], prices[lo:hi]
+    
+    def _bisect(self, epochs, epoch, lo=0):
+        """Index of the first mapped epoch >= epoch"""
+        if numpy is not None:
+            return lo + int(numpy.searchsorted(epochs[lo:], epoch))
+        return bisect.bisect_left(epochs, epoch, lo)
+    
+    def read(self, crypto_id, start, end=None):
+        """(epoch, price, source) rows with start <= epoch < end, found by bisection"""
+        window = self._window(crypto_id, start, end)
+        if window is None:
+            return []
+        epochs, prices = window
+        return list(zip(epochs.tolist(), prices.tolist(), repeat(self.source)))
+    
+    def read_columns(self, crypto_id, start, end=None):
+        """(epochs, prices) for start <= epoch < end as views straight onto the mapped file"""
+        window = self._window(crypto_id, start, end)
+        if window is None:
+            return as_columns(array('q'), array('d'))
+        return window
+    
+    def read_versions(self, crypto_ids):
+        """{crypto_id: history version} from the coin's record and floor files, as every process sees them"""
+        versions = {}
+        for crypto_id in crypto_ids:
+            stamps = []
+            for suffix in ('bin', 'floor'):
+                try:
+                    st = os.stat(self._path(crypto_id, suffix))
+                except FileNotFoundError:
+                    continue
+                stamps.append(f'{st.st_ino}.{st.st_size}.{st.st_mtime_ns}')
+            if stamps:
+                versions[crypto_id] = '-'.join(stamps)
+        return versions
+    
+    def read_candles(self, crypto_id, resolution, start, end=None):
+        """(bucket, open, high, low, close, samples) for the candles covering [start, end)"""
+        # Whole buckets, matching the candles the other engines maintain
+        window = self._window(crypto_id, start - start % resolution, None if end is None else end - end % -resolution)
+        if window is None:
+            return []
+        return rollup_candles(*window, resolution)
+    
+    def read_candles_many(self, crypto_ids, resolution, start, end=None):
+        """{crypto_id: candle rows} for several coins"""
+        return {crypto_id: self.read_candles(crypto_id, resolution, start, end) for crypto_id in crypto_ids}
+    
+    def purge(self, crypto_ids, before):
+        """Hide points older than before for every process, compacting a file once they outweigh the live ones"""
+        for crypto_id in crypto_ids:
+            if not os.path.exists(self._path(crypto_id)):
+                continue
+            
+            with self._locked(crypto_id) as f:
+                self._set_floor(crypto_id, before)
+                columns = self._columns(crypto_id)
+                if columns is None:
+                    continue
+                
+                # Bisect the mapped epochs; only a compaction reads the live records back
+                expired = self._bisect(columns[0], before)
+                if expired and expired * 2 >= len(columns[0]):
+                    f.seek(expired * RECORD.size)
+                    self._replace(crypto_id, f.read())
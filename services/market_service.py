@@ -0,0 +1,289 @@
+"""
+Market Service
+Server-side gateway for the CoinGecko market endpoints the browser pages use.
+Responses are cached per endpoint and concurrent misses share one upstream call,
+so every viewer of a page costs at most one request per TTL.
+"""
+import re
+import threading
+import time
+import requests
+from services.price_service import PriceService
+from services.rate_limiter import TokenBucket
+from services.shared_price_store import SharedTokenBucket
+from services.single_flight import SingleFlight
+
+COIN_ID_PATTERN = re.compile(r'^[a-z0-9-]{1,100}$')
+
+# Query values the gateway forwards; anything else would let callers mint cache misses
+MARKET_CHART_DAYS = ('1', '7', '14', '30', '90', '180', '365', 'max')
+MARKET_PAGE_SIZES = (10, 25, 50, 100, 250)
+MAX_MARKET_PAGE = 100
+MAX_MARKET_IDS = 250
+
+class MarketService:
+    def __init__(self, price_service=None):
+        # Shares the pooled client, rate budget and circuit breaker with price fetching
+        self.price_service = price_service or PriceService()
+        self.client = self.price_service.client
+        
+        # Seconds each endpoint's responses stay fresh
+        self.ttl = {
+            'markets': 60,
+            'global': 120,
+            'coin': 120,
+            'market_chart_intraday': 60,  # days <= 1, five-minute points
+            'market_chart': 600
+        }
+        self.max_stale_age = 900  # serve older copies while CoinGecko is unavailable
+        self.max_entries = 500
+        self.single_flight = SingleFlight()
+        self.single_flight_timeout = 15
+        self.rate_limit_share = 0.3  # fraction of the CoinGecko budget browser traffic may use
+        self._rate_limiter = None
+        self._rate_limiter_store = None
+        
+        self.cache = {}  # cache key -> {'data', 'cached_at'}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+    
+    def get_markets(self, ids=None, page=1, per_page=50, sparkline=False, price_change_percentage=None):
+        """Paged /coins/markets rows in USD ordered by market cap"""
+        if int(per_page) not in MARKET_PAGE_SIZES or not 1 <= int(page) <= MAX_MARKET_PAGE:
+            return {'success': False, 'error': 'INVALID_PAGE',
+                    'message': f"per_page must be one of {', '.join(map(str, MARKET_PAGE_SIZES))} "
+                               f"and page between 1 and {MAX_MARKET_PAGE}"}
+        
+        params = {
+            'vs_currency': 'usd',
+            'order': 'market_cap_desc',
+            'per_page': int(per_page),
+            'page': int(page),
+            'sparkline': 'true' if sparkline else 'false'
+        }
+        if ids:
+            ids = sorted({i.strip().lower() for i in ids if i and i.strip()})
+            if len(ids) > MAX_MARKET_IDS:
+                return {'success': False, 'error': 'INVALID_COIN_ID', 'message': f'At most {MAX_MARKET_IDS} coin ids per request'}
+            invalid = [i for i in ids if not COIN_ID_PATTERN.match(i)]
+            if invalid:
+                return {'success': False, 'error': 'INVALID_COIN_ID', 'message': f'Invalid coin id: {invalid[0]}'}
+            # One page holds every requested coin, so paging would only vary the cache key
+            params.update(ids=','.join(ids), per_page=MAX_MARKET_IDS, page=1)
+        if price_change_percentage:
+            windows = sorted({w.strip() for w in price_change_percentage.split(',')} & {'1h', '24h', '7d', '14d', '30d', '200d', '1y'})
+            if windows:
+                params['price_change_percentage'] = ','.join(windows)
+        
+        return self._get('markets', 'coins/markets', params)
+    
+    def get_global(self):
+        """Global market totals"""
+        return self._get('global', 'global', {})
+    
+    def get_coin(self, crypto_id, sparkline=False):
+        """Coin details without tickers, community or developer data"""
+        if not COIN_ID_PATTERN.match(crypto_id):
+            return {'success': False, 'error': 'INVALID_COIN_ID', 'message': f'Invalid coin id: {crypto_id}'}
+        
+        params = {
+            'localization': 'false',
+            'tickers': 'false',
+            'community_data': 'false',
+            'developer_data': 'false',
+            'sparkline': 'true' if sparkline else 'false'
+        }
+        return self._get('coin', f'coins/{crypto_id}', params)
+    
+    def get_market_chart(self, crypto_id, days):
+        """USD price, market cap and volume series for the last `days` days"""
+        if not COIN_ID_PATTERN.match(crypto_id):
+            return {'success': False, 'error': 'INVALID_COIN_ID', 'message': f'Invalid coin id: {crypto_id}'}
+        
+        try:
+            days = str(days) if days == 'max' else str(int(days))
+        except (TypeError, ValueError):
+            days = None
+        if days not in MARKET_CHART_DAYS:
+            return {'success': False, 'error': 'INVALID_DAYS', 'message': f"days must be one of {', '.join(MARKET_CHART_DAYS)}"}
+        
+        endpoint = 'market_chart_intraday' if days == '1' else 'market_chart'
+        return self._get(endpoint, f'coins/{crypto_id}/market_chart', {'vs_currency': 'usd', 'days': days})
+    
+    def _get(self, endpoint, path, params):
+        """Serve from cache within the endpoint TTL, otherwise fetch once for all waiting callers"""
+        key = (path, tuple(sorted(params.items())))
+        ttl = self.ttl[endpoint]
+        
+        entry = self._read_cache(key)
+        if entry and time.time() - entry['cached_at'] < ttl:
+            with self._lock:
+                self.hits += 1
+            return self._response(entry, ttl, cached=True)
+        
+        try:
+            result, shared = self.single_flight.do(key, lambda: self._fetch(key, endpoint, path, params, ttl),
+                                                   timeout=self.single_flight_timeout)
+        except TimeoutError:
+            return self._fallback(entry, ttl, 'API_TIMEOUT', 'Timed out waiting for CoinGecko')
+        
+        if shared:
+            result = dict(result, coalesced=True)
+        return result
+    
+    def _fetch(self, key, endpoint, path, params, ttl):
+        """Call CoinGecko under the shared rate limit and circuit breaker"""
+        ps = self.price_service
+        entry = self._read_cache(key)
+        
+        # Another caller may have refreshed the entry while we waited to lead
+        if entry and time.time() - entry['cached_at'] < ttl:
+            return self._response(entry, ttl, cached=True)
+        
+        # Another worker (or the price daemon) may already hold a fresher copy
+        if ps.shared_store is not None:
+            shared = self._load_from_shared_store(path, params)
+            if shared and (entry is None or shared['cached_at'] > entry['cached_at']):
+                entry = shared
+                self._write_cache(key, entry)
+                if time.time() - entry['cached_at'] < ttl:
+                    return self._response(entry, ttl, cached=True)
+        
+        with self._lock:
+            self.misses += 1
+        
+        if not ps.upstream_enabled:
+            return self._request_from_ingester(entry, endpoint, path, params, ttl)
+        
+        if not ps._circuit_allows_request():
+            return self._fallback(entry, ttl, 'API_UNAVAILABLE', 'CoinGecko API is temporarily unavailable')
+        
+        # The gateway's own share is checked first so browser traffic cannot drain the price refresher's budget
+        if not self._get_rate_limiter().try_acquire() or not ps.rate_limiter.acquire(timeout=ps.rate_limit_timeout):
+            return self._fallback(entry, ttl, 'RATE_LIMITED', 'CoinGecko rate limit reached, try again shortly')
+        
+        try:
+            data = self.client.get_json(self.client.url(path), params=params)
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status == 404:
+                return {'success': False, 'error': 'NOT_FOUND', 'message': 'Coin not found'}
+            ps._record_failure()
+            return self._fallback(entry, ttl, 'API_UNAVAILABLE', f'CoinGecko API error: {str(e)}')
+        except requests.exceptions.RequestException as e:
+            ps._record_failure()
+            return self._fallback(entry, ttl, 'API_UNAVAILABLE', f'CoinGecko API error: {str(e)}')
+        
+        ps._record_success()
+        entry = {'data': data, 'cached_at': time.time()}
+        self._write_cache(key, entry)
+        if ps.shared_store is not None:
+            self._write_to_shared_store(endpoint, path, params, entry)
+        return self._response(entry, ttl, cached=False)
+    
+    def _load_from_shared_store(self, path, params):
+        """Response another process fetched for this request, if any"""
+        try:
+            return self.price_service.shared_store.read_market_response(path, params)
+        except Exception as e:
+            print(f"Shared price store read failed: {e}")
+            return None
+    
+    def _write_to_shared_store(self, endpoint, path, params, entry):
+        """Publish a fetched response to other workers"""
+        try:
+            self.price_service.shared_store.write_market_response(endpoint, path, params, entry['data'], entry['cached_at'])
+        except Exception as e:
+            print(f"Shared price store write failed: {e}")
+    
+    def _request_from_ingester(self, entry, endpoint, path, params, ttl):
+        """Reader mode: ask the price daemon to fetch this request instead of calling CoinGecko"""
+        store = self.price_service.shared_store
+        if store is not None:
+            try:
+                store.request_market_response(endpoint, path, params)
+            except Exception as e:
+                print(f"Shared price store write failed: {e}")
+        return self._fallback(entry, ttl, 'UPSTREAM_UNAVAILABLE', 'Market data not available yet, the price daemon has been asked for it')
+    
+    def refresh_demanded(self, max_age=3600, limit=100):
+        """Ingester side: refresh market requests readers made within max_age seconds"""
+        store = self.price_service.shared_store
+        if store is None or not self.price_service.upstream_enabled:
+            return 0
+        
+        refreshed = 0
+        for request in store.get_demanded_market_requests(max_age, limit):
+            if request['endpoint'] not in self.ttl:
+                continue
+            # Still-fresh responses are answered from the cache, so each request costs at most one call per TTL
+            result = self._get(request['endpoint'], request['path'], request['params'])
+            if result['success'] and not result['cached']:
+                refreshed += 1
+        return refreshed
+    
+    def _get_rate_limiter(self):
+        """Gateway bucket holding rate_limit_share of PriceService's budget, shared across workers when possible"""
+        ps = self.price_service
+        with self._lock:
+            if self._rate_limiter is None or self._rate_limiter_store is not ps.shared_store:
+                capacity = max(1, int(ps.rate_limit_tokens * self.rate_limit_share))
+                bucket = TokenBucket(capacity, capacity / ps.rate_limit_window)
+                if ps.shared_store is not None:
+                    bucket = SharedTokenBucket(ps.shared_store, 'coingecko_market', capacity,
+                                               capacity / ps.rate_limit_window, fallback=bucket)
+                self._rate_limiter = bucket
+                self._rate_limiter_store = ps.shared_store
+            return self._rate_limiter
+    
+    def _response(self, entry, ttl, cached, warning=None):
+        """Wrap cached upstream data with its age and remaining freshness"""
+        age = time.time() - entry['cached_at']
+        response = {
+            'success': True,
+            'data': entry['data'],
+            'cached': cached,
+            'age': round(age, 1),
+            'max_age': max(0, int(ttl - age))
+        }
+        if warning:
+            response['warning'] = warning
+            response['stale'] = True
+        return response
+    
+    def _fallback(self, entry, ttl, error, message):
+        """Serve a stale copy when CoinGecko cannot be used"""
+        if entry and time.time() - entry['cached_at'] < self.max_stale_age:
+            with self._lock:
+                self.stale_served += 1
+            return self._response(entry, ttl, cached=True, warning=message)
+        return {'success': False, 'error': error, 'message': message}
+    
+    def _read_cache(self, key):
+        with self._lock:
+            return self.cache.get(key)
+    
+    def _write_cache(self, key, entry):
+        with self._lock:
+            self.cache.pop(key, None)
+            self.cache[key] = entry
+            # Dicts keep insertion order, so the first key is the least recently written
+            while len(self.cache) > self.max_entries:
+                del self.cache[next(iter(self.cache))]
+    
+    def get_metrics(self):
+        """Cache hit ratio and upstream call coalescing"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            metrics = {
+                'entries': len(self.cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale_served': self.stale_served,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+        metrics['single_flight'] = self.single_flight.get_metrics()
+        metrics['rate_limiter'] = self._get_rate_limiter().get_metrics()
+        return metrics
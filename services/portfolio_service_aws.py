@@ -6,6 +6,9 @@ from datetime import datetime
 from decimal import Decimal
 import os
 
+# Sort key of the per-user item whose counter is bumped on every portfolio write (ETag validator)
+DATA_VERSION_KEY = '#version'
+
 class PortfolioServiceAWS:
     def __init__(self, dynamodb):
         self.dynamodb = dynamodb
@@ -29,6 +32,8 @@ class PortfolioServiceAWS:
             transactions = []
             
             for item in response['Items']:
+                if item['TransactionID'] == DATA_VERSION_KEY:
+                    continue
                 print(f"DEBUG: Processing item: {item}")
                 crypto_id = item.get('crypto_id')
                 transaction_type = item.get('transaction_type')
@@ -104,6 +109,7 @@ class PortfolioServiceAWS:
                 }
             )
             
+            self._bump_data_version(user_id)
             print(f"DEBUG: Transaction added successfully with ID: {transaction_id}")
             
             return {
@@ -135,8 +141,54 @@ class PortfolioServiceAWS:
                     'TransactionID': transaction_id
                 }
             )
+            self._bump_data_version(user_id)
             
             return {'success': True, 'message': 'Transaction deleted successfully'}
         
         except Exception as e:
             return {'success': False, 'error': 'DELETE_FAILED', 'message': str(e)}
+    
+    def get_transaction_history(self, user_id, limit=50):
+        """Most recent transactions first - user_id is email"""
+        try:
+            items = []
+            query = dict(KeyConditionExpression='email = :email', ExpressionAttributeValues={':email': user_id})
+            while True:
+                response = self.table.query(**query)
+                items.extend(item for item in response['Items'] if item['TransactionID'] != DATA_VERSION_KEY)
+                if 'LastEvaluatedKey' not in response:
+                    break
+                query = dict(query, ExclusiveStartKey=response['LastEvaluatedKey'])
+            
+            items.sort(key=lambda item: item.get('timestamp', ''), reverse=True)
+            transactions = [{
+                'transaction_id': item.get('TransactionID'),
+                'crypto_id': item.get('crypto_id'),
+                'transaction_type': item.get('transaction_type'),
+                'amount': float(item.get('amount', 0)),
+                'price': float(item.get('price', 0)),
+                'total': float(item.get('total', 0)),
+                'timestamp': item.get('timestamp')
+            } for item in items[:limit]]
+            
+            return {'success': True, 'transactions': transactions, 'total_count': len(transactions)}
+        
+        except Exception as e:
+            return {'success': False, 'error': 'FETCH_FAILED', 'message': str(e)}
+    
+    def _bump_data_version(self, user_id):
+        """Mark the user's portfolio as changed"""
+        self.table.update_item(
+            Key={'email': user_id, 'TransactionID': DATA_VERSION_KEY},
+            UpdateExpression='ADD version_count :one',
+            ExpressionAttributeValues={':one': 1}
+        )
+    
+    def get_data_version(self, user_id):
+        """Current portfolio data version for a user (0 if never written, None if unreadable)"""
+        try:
+            response = self.table.get_item(Key={'email': user_id, 'TransactionID': DATA_VERSION_KEY})
+            return int(response.get('Item', {}).get('version_count', 0))
+        except Exception as e:
+            print(f"ERROR: Portfolio version read failed: {str(e)}")
+            return None
@@ -6,7 +6,7 @@ from datetime import datetime, timedelta
 from decimal import Decimal
 import uuid
 import json
-from database import get_db_connection
+from database import get_db_connection, bump_user_data_version
 
 class PortfolioService:
     def __init__(self):
@@ -100,6 +100,9 @@ class PortfolioService:
             ''', (transaction_id, user_id, crypto_id, 'BUY', float(amount_decimal),
                   float(price_decimal), float(total_cost), purchase_date.isoformat(), 'COMPLETED'))
             
+            # Invalidate cached portfolio/transaction responses
+            bump_user_data_version(cursor, user_id)
+            
             conn.commit()
             
             # Create portfolio snapshot
@@ -184,6 +187,9 @@ class PortfolioService:
             ''', (transaction_id, user_id, crypto_id, 'SELL', float(amount_decimal),
                   float(price_decimal), float(total_received), sale_date.isoformat(), 'COMPLETED'))
             
+            # Invalidate cached portfolio/transaction responses
+            bump_user_data_version(cursor, user_id)
+            
             conn.commit()
             
             # Create portfolio snapshot
@@ -0,0 +1,135 @@
+"""
+Price Daemon
+Standalone ingester that owns all CoinGecko traffic. It polls the tracked
+universe in batches, writes quotes to the shared price store, records
+historical snapshots and refreshes the market responses readers asked for;
+the Flask apps only read what it publishes.
+
+Usage: python -m services.price_daemon [--interval 30] [--batch-size 100] [--once]
+"""
+import argparse
+import os
+import signal
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+
+from database import init_database
+from services.admin_service import AdminService
+from services.market_service import MarketService
+from services.price_refresher import PriceRefresher
+from services.price_service import PriceService
+from services.shared_price_store import SharedPriceStore
+
+def build_historical_service():
+    """History backend for snapshots: DynamoDB on AWS, local service otherwise"""
+    if os.getenv('HISTORY_BACKEND', 'local').lower() == 'dynamodb':
+        import boto3
+        from services.historical_service_aws import HistoricalServiceAWS
+        dynamodb = boto3.resource('dynamodb', region_name=os.getenv('AWS_REGION', 'us-east-1'))
+        return HistoricalServiceAWS(dynamodb)
+    
+    from services.historical_service import HistoricalService
+    return HistoricalService()
+
+class PriceDaemon:
+    def __init__(self, store, interval=30, batch_size=100, historical_service=None, admin_service=None):
+        self.store = store
+        self.interval = interval
+        self.admin_service = admin_service or AdminService()
+        self.historical_service = historical_service
+        self.market_demand_age = 3600  # market requests nobody repeated for this long are dropped
+        self._stop_event = threading.Event()
+        
+        self.price_service = PriceService()
+        self.price_service.use_shared_store(store)
+        self.price_service.batch_size = batch_size
+        
+        self.refresher = PriceRefresher(
+            self.price_service,
+            universe_provider=self.get_universe,
+            interval=interval
+        )
+        if historical_service is not None:
+            self.refresher.add_listener(self.record_history)
+        
+        # Serves the readers' /api/market/* requests through the same client and rate budget
+        self.market_service = MarketService(self.price_service)
+    
+    def get_universe(self):
+        """Tracked, held and alerted coins plus coins readers asked for"""
+        universe = set(self.admin_service.get_price_universe())
+        universe.update(self.store.get_demanded_coins())
+        return universe
+    
+    def record_history(self, prices):
+        """Store one historical snapshot per fetched quote in a single batch"""
+        self.historical_service.store_price_snapshots(
+            {crypto_id: quote['price_usd'] for crypto_id, quote in prices.items()},
+            datetime.utcnow()
+        )
+    
+    def refresh_market(self):
+        """Refresh the market responses readers requested recently"""
+        try:
+            return self.market_service.refresh_demanded(max_age=self.market_demand_age)
+        except Exception as e:
+            print(f"Market refresh failed: {e}")
+            return 0
+    
+    def run_once(self):
+        """Run a single refresh cycle"""
+        result = self.refresher.refresh_once()
+        self.refresh_market()
+        return result
+    
+    def run_forever(self):
+        """Refresh on a fixed cadence until stopped"""
+        threading.Thread(target=self._refresh_market_forever, name='market-refresher', daemon=True).start()
+        self.refresher.run_forever()
+    
+    def _refresh_market_forever(self):
+        while not self._stop_event.is_set():
+            self.refresh_market()
+            self._stop_event.wait(self.interval)
+    
+    def stop(self, *args):
+        """Stop the refresh loops and release the refresh lease"""
+        self._stop_event.set()
+        self.refresher.stop()
+
+def main():
+    load_dotenv()
+    
+    parser = argparse.ArgumentParser(description='CrypSync price ingestion daemon')
+    parser.add_argument('--interval', type=int, default=int(os.getenv('PRICE_REFRESH_INTERVAL', 30)),
+                        help='seconds between refresh cycles')
+    parser.add_argument('--batch-size', type=int, default=int(os.getenv('PRICE_BATCH_SIZE', 100)),
+                        help='coins per CoinGecko request')
+    parser.add_argument('--store', default=os.getenv('PRICE_STORE_PATH'),
+                        help='SQLite file shared with the web workers (defaults to the app database)')
+    parser.add_argument('--once', action='store_true', help='run a single refresh cycle and exit')
+    args = parser.parse_args()
+    
+    init_database()
+    daemon = PriceDaemon(
+        SharedPriceStore(args.store),
+        interval=args.interval,
+        batch_size=args.batch_size,
+        historical_service=build_historical_service()
+    )
+    
+    if args.once:
+        result = daemon.run_once()
+        print(f"Refreshed {len(result.get('data', {}))} coins")
+        daemon.stop()
+        return
+    
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    print(f"Price daemon started (interval={args.interval}s, batch_size={args.batch_size})")
+    daemon.run_forever()
+    print("Price daemon stopped")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Price Refresher
+Polls CoinGecko in the background and publishes immutable price snapshots
+so request threads never wait on the upstream API
+"""
+import os
+import socket
+import threading
+import time
+
+class PriceRefresher:
+    def __init__(self, price_service, universe_provider=None, interval=30, max_demand_coins=500,
+                 follower_only=False, demand_ttl=None):
+        self.price_service = price_service
+        self.universe_provider = universe_provider
+        self.interval = interval  # seconds between refreshes
+        self.follower_only = follower_only  # never fetch, only publish what the shared store holds
+        self.listeners = []  # callables receiving freshly fetched prices
+        self.max_demand_coins = max_demand_coins
+        self.demand_ids = {}  # coins requested by users outside the tracked universe -> last requested
+        self.demand_ttl = demand_ttl if demand_ttl is not None else interval * 10  # drop coins nobody asked for since
+        self.last_refresh = None
+        self.last_error = None
+        self.lease_name = 'price_refresher'
+        self.owner_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.is_leader = False
+        self._demand_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Start the background refresh thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        
+        self._stop_event.clear()
+        self.price_service.refresher = self
+        self._thread = threading.Thread(target=self.run_forever, name='price-refresher', daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout=5):
+        """Stop the background refresh thread"""
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self.price_service.refresher = None
+        
+        store = self.price_service.shared_store
+        if store is not None and self.is_leader:
+            store.release_lease(self.lease_name, self.owner_id)
+            self.is_leader = False
+    
+    def add_listener(self, listener):
+        """Call listener(prices) after every successful upstream fetch"""
+        self.listeners.append(listener)
+    
+    def request_coins(self, crypto_ids):
+        """Add coins to the refresh set and refresh them on the next cycle"""
+        now = time.time()
+        with self._demand_lock:
+            for crypto_id in crypto_ids:
+                if crypto_id in self.demand_ids or len(self.demand_ids) < self.max_demand_coins:
+                    self.demand_ids[crypto_id] = now
+    
+    def touch_coins(self, crypto_ids):
+        """Mark on-demand coins as still read so they are not dropped"""
+        now = time.time()
+        with self._demand_lock:
+            for crypto_id in crypto_ids:
+                if crypto_id in self.demand_ids:
+                    self.demand_ids[crypto_id] = now
+    
+    def get_universe(self):
+        """Coins to refresh: the provider's active set plus recently requested on-demand coins"""
+        universe = set()
+        if self.universe_provider is not None:
+            universe.update(self.universe_provider())
+        
+        cutoff = time.time() - self.demand_ttl
+        with self._demand_lock:
+            for crypto_id in [c for c, requested_at in self.demand_ids.items() if requested_at < cutoff]:
+                del self.demand_ids[crypto_id]
+            universe.update(self.demand_ids)
+        
+        return sorted(universe)
+    
+    def refresh_once(self):
+        """Fetch the whole universe once and publish a new snapshot"""
+        crypto_ids = self.get_universe()
+        if not crypto_ids:
+            return {'success': True, 'data': {}}
+        
+        # With a shared store only the lease holder talks to CoinGecko
+        store = self.price_service.shared_store
+        if self.follower_only or (store is not None and not self._hold_lease(store)):
+            return self._publish_from_store(crypto_ids)
+        
+        # fetch_from_api splits large universes into parallel batches
+        result = self.price_service.fetch_from_api(crypto_ids)
+        if not result['success']:
+            self.last_error = result.get('message')
+            return result
+        
+        # Batches that fell back to cache come back unchanged and are not republished
+        changed = self._changed_quotes(result['data'])
+        if changed or self._has_removed_coins(crypto_ids):
+            self.price_service.publish_snapshot(changed, universe=crypto_ids)
+            self._notify_listeners(changed)
+            self.last_refresh = time.time()
+        self.last_error = result.get('warning')
+        
+        return result
+    
+    def _changed_quotes(self, prices):
+        """Quotes that are new or newer than the published snapshot"""
+        snapshot = self.price_service.snapshot
+        return {
+            crypto_id: quote for crypto_id, quote in prices.items()
+            if snapshot is None or crypto_id not in snapshot.quotes
+            or snapshot.quotes[crypto_id]['fetched_at'] != quote['fetched_at']
+        }
+    
+    def _has_removed_coins(self, crypto_ids):
+        """Whether the published snapshot still holds coins that left the universe"""
+        snapshot = self.price_service.snapshot
+        return snapshot is not None and not set(snapshot.quotes).issubset(crypto_ids)
+    
+    def _notify_listeners(self, prices):
+        """Hand fetched prices to listeners (history recording, etc.)"""
+        if not prices:
+            return
+        for listener in self.listeners:
+            try:
+                listener(prices)
+            except Exception as e:
+                print(f"Price listener failed: {e}")
+    
+    def _hold_lease(self, store):
+        """Take or renew the refresh lease; followers read what the leader writes"""
+        try:
+            self.is_leader = store.try_acquire_lease(self.lease_name, self.owner_id, ttl=max(self.interval * 3, 30))
+        except Exception as e:
+            # Fail open: refreshing ourselves beats serving nothing
+            print(f"Refresh lease check failed: {e}")
+            self.is_leader = True
+        return self.is_leader
+    
+    def _publish_from_store(self, crypto_ids):
+        """Publish quotes the leader wrote to the shared store, if they changed"""
+        prices = self.price_service._load_from_shared_store(crypto_ids)
+        
+        changed = self._changed_quotes(prices)
+        if changed or self._has_removed_coins(crypto_ids):
+            self.price_service.publish_snapshot(changed, universe=crypto_ids)
+            self.last_refresh = time.time()
+        
+        return {'success': True, 'data': prices, 'cached': True}
+    
+    def run_forever(self):
+        """Refresh loop, runs until stop() is called"""
+        while not self._stop_event.is_set():
+            try:
+                self.refresh_once()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Price refresh failed: {e}")
+            
+            self._wake_event.wait(self.interval)
+            self._wake_event.clear()
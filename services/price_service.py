@@ -3,148 +3,622 @@ Price Service
 Fetches and caches real-time cryptocurrency prices from CoinGecko API
 """
 import requests
+import calendar
+import sqlite3
 from datetime import datetime, timedelta
 from decimal import Decimal
 import time
+import threading
+import atexit
+import json
+import os
+import hashlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from services.single_flight import SingleFlight
+from services.rate_limiter import TokenBucket
+from services.shared_price_store import SharedTokenBucket
+from services.coingecko_client import CoinGeckoClient
+
+# Immutable view of the latest prices published by the background refresher;
+# fetched maps each coin to the epoch its quote was fetched at
+PriceSnapshot = namedtuple('PriceSnapshot', ['version', 'published_at', 'quotes', 'fetched'])
 
 class PriceService:
     def __init__(self):
-        self.base_url = "https://api.coingecko.com/api/v3"
-        self.cache = {}
-        self.cache_duration = 60  # seconds
+        self.client = CoinGeckoClient()  # pooled keep-alive session
+        self.base_url = self.client.base_url
+        self.cache = {}  # crypto_id -> {'quote': ..., 'cached_at': epoch seconds}
+        self.cache_duration = 60  # seconds, per coin
         self.rate_limit_tokens = 50
         self.rate_limit_window = 60  # seconds
-        self.last_request_time = None
+        self.rate_limit_timeout = 2  # seconds a fetch may wait for a token
+        self.local_rate_limiter = TokenBucket(self.rate_limit_tokens, self.rate_limit_tokens / self.rate_limit_window)
+        self.rate_limiter = self.local_rate_limiter
         self.circuit_breaker_failures = 0
         self.circuit_breaker_threshold = 5
         self.circuit_breaker_open = False
         self.circuit_breaker_reset_time = None
+        self.snapshot = None
+        self.snapshot_max_age = 300  # seconds before request threads stop trusting the snapshot
+        self.snapshot_listeners = []  # called with the changed quotes after each publish
+        self._snapshot_digest = (None, None)  # (snapshot version, whole-snapshot price version)
+        self.refresher = None
+        self.single_flight = SingleFlight()
+        self.single_flight_timeout = 15  # seconds a coalesced caller waits for the leader
+        self._lock = threading.RLock()  # guards cache, snapshot and circuit breaker state
+        self.shared_store = None
+        self.upstream_enabled = True  # False when a separate ingester owns all CoinGecko traffic
+        self.batch_size = 100  # max coins per /simple/price call
+        self.max_ids_chars = 2000  # keeps the ids= query string well under URL length limits
+        self.max_concurrency = 4  # batches fetched in parallel
+        self._executor = None
+        self.serve_stale = True  # stale-while-revalidate mode
+        self.max_stale_age = 300  # seconds; older quotes block on a fresh fetch
+        self._revalidating = set()
+        self._revalidate_executor = None
+        self.state_file = None  # warm-start cache file, see enable_persistence()
+        self._persist_stop = threading.Event()
     
     def get_current_prices(self, crypto_ids):
         """Get current prices for specified cryptocurrencies"""
         try:
-            # Check cache first
-            if self._is_cache_valid():
-                cached_prices = self._get_from_cache(crypto_ids)
-                if cached_prices:
-                    return {'success': True, 'data': cached_prices, 'cached': True}
+            crypto_ids = self._normalize_ids(crypto_ids)
+            cached_prices, missing_ids = self._lookup_local(crypto_ids)
+            self.touch_coins(cached_prices.keys())
             
-            # Fetch from API
-            result = self.fetch_from_api(crypto_ids)
-            return result
+            if not missing_ids:
+                response = {'success': True, 'data': self._in_request_order(crypto_ids, cached_prices), 'cached': True}
+                return self._flag_stale(response)
+            
+            # Fetch from API (cold misses when the refresher is running)
+            result = self.fetch_from_api(missing_ids)
+            return self._flag_stale(self._merge_fetch_result(crypto_ids, cached_prices, missing_ids, result))
         
         except Exception as e:
             return {'success': False, 'error': 'PRICE_FETCH_FAILED', 'message': str(e)}
     
+    def _lookup_local(self, crypto_ids):
+        """Prices available without calling CoinGecko, plus the ids still missing"""
+        # Read the background refresher's snapshot, then fresh cache entries
+        cached_prices = self._read_snapshot(crypto_ids)
+        remaining_ids = [c for c in crypto_ids if c not in cached_prices]
+        cached_prices.update(self._get_from_cache(remaining_ids, max_age=self.cache_duration) or {})
+        missing_ids = [c for c in crypto_ids if c not in cached_prices]
+        
+        # Other workers may already have fetched these into the shared store
+        if missing_ids and self.shared_store is not None:
+            cached_prices.update(self._load_from_shared_store(missing_ids))
+            missing_ids = [c for c in crypto_ids if c not in cached_prices]
+        
+        # Stale-while-revalidate: serve quotes under the hard max age now, refresh them in the background
+        if missing_ids and self.serve_stale:
+            stale_prices = self._get_stale_from_cache(missing_ids)
+            if stale_prices:
+                cached_prices.update(stale_prices)
+                missing_ids = [c for c in crypto_ids if c not in cached_prices]
+                self._revalidate_in_background(list(stale_prices.keys()))
+        
+        return cached_prices, missing_ids
+    
+    def _flag_stale(self, response):
+        """Mark a response as stale when any quote in it is being revalidated"""
+        if response.get('success') and any(q.get('stale') for q in response['data'].values()):
+            response['stale'] = True
+        return response
+    
+    def _get_stale_from_cache(self, crypto_ids):
+        """Expired cache entries still within max_stale_age, marked stale with their age"""
+        now = time.time()
+        stale = {}
+        with self._lock:
+            for crypto_id in crypto_ids:
+                entry = self.cache.get(crypto_id)
+                if entry is None:
+                    continue
+                age = now - entry['cached_at']
+                if age < self.max_stale_age:
+                    stale[crypto_id] = dict(entry['quote'], stale=True, age=round(age, 1))
+        return stale
+    
+    def _revalidate_in_background(self, crypto_ids):
+        """Refresh stale coins off the request thread, at most one refresh per coin at a time"""
+        with self._lock:
+            crypto_ids = [c for c in crypto_ids if c not in self._revalidating]
+            if not crypto_ids:
+                return
+            self._revalidating.update(crypto_ids)
+            if self._revalidate_executor is None:
+                self._revalidate_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='price-revalidate')
+        
+        def revalidate():
+            try:
+                self.fetch_from_api(crypto_ids)
+            except Exception as e:
+                print(f"Background price revalidation failed: {e}")
+            finally:
+                with self._lock:
+                    self._revalidating.difference_update(crypto_ids)
+        
+        self._revalidate_executor.submit(revalidate)
+    
+    def _merge_fetch_result(self, crypto_ids, cached_prices, missing_ids, result):
+        """Combine local hits with an upstream fetch result into one response"""
+        if not result['success']:
+            if cached_prices:
+                return {
+                    'success': True,
+                    'data': self._in_request_order(crypto_ids, cached_prices),
+                    'cached': True,
+                    'missing': missing_ids,
+                    'warning': result.get('message', 'Some prices are unavailable')
+                }
+            return result
+        
+        # Let the refresher keep these coins warm from now on
+        if self.refresher is not None and not result.get('cached'):
+            self.refresher.request_coins(result['data'].keys())
+        
+        # Merge cache hits with fetched prices, keeping request order
+        cached_prices.update(result['data'])
+        
+        response = dict(result)
+        response['data'] = self._in_request_order(crypto_ids, cached_prices)
+        response['cached'] = result.get('cached', False)
+        return response
+    
     def fetch_from_api(self, crypto_ids):
+        """Fetch prices from CoinGecko in size-bounded batches fetched in parallel"""
+        if not self.upstream_enabled:
+            return self._request_from_ingester(crypto_ids)
+        
+        batches = self._batch_ids(crypto_ids)
+        if len(batches) == 1:
+            return self._fetch_batch_coalesced(batches[0])
+        
+        results = list(self._get_executor().map(self._fetch_batch_coalesced, batches))
+        return self._combine_batch_results(crypto_ids, results)
+    
+    def _batch_ids(self, crypto_ids):
+        """Split ids into batches bounded by count and by ids= query length"""
+        batches = []
+        batch = []
+        batch_chars = 0
+        for crypto_id in crypto_ids:
+            if batch and (len(batch) >= self.batch_size or batch_chars + len(crypto_id) + 1 > self.max_ids_chars):
+                batches.append(batch)
+                batch = []
+                batch_chars = 0
+            batch.append(crypto_id)
+            batch_chars += len(crypto_id) + 1
+        
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    def _get_executor(self):
+        """Thread pool used to fan batches out in parallel"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='price-fetch')
+            return self._executor
+    
+    def _combine_batch_results(self, crypto_ids, results):
+        """Merge per-batch results; failed batches only lose their own coins"""
+        prices = {}
+        errors = []
+        all_cached = True
+        for result in results:
+            if result['success']:
+                prices.update(result['data'])
+                all_cached = all_cached and result.get('cached', False)
+            else:
+                errors.append(result)
+        
+        if not prices and errors:
+            return errors[0]
+        
+        response = {'success': True, 'data': prices, 'cached': all_cached, 'batches': len(results)}
+        if errors:
+            response['missing'] = [c for c in crypto_ids if c not in prices]
+            response['warning'] = errors[0].get('message', 'Some prices are unavailable')
+        return response
+    
+    def _fetch_batch_coalesced(self, crypto_ids):
+        """Fetch one batch, sharing one in-flight request per id set"""
+        key = tuple(sorted(set(crypto_ids)))
+        try:
+            result, shared = self.single_flight.do(
+                key,
+                lambda: self._fetch_from_api(crypto_ids),
+                timeout=self.single_flight_timeout
+            )
+        except TimeoutError:
+            return self._fallback_to_cache(crypto_ids, 'Timed out waiting for price update',
+                                           'API_TIMEOUT', 'Timed out waiting for CoinGecko response')
+        
+        if shared:
+            result = dict(result)
+            result['coalesced'] = True
+        return result
+    
+    def use_shared_store(self, shared_store):
+        """Share quotes and the rate-limit budget with other worker processes"""
+        self.shared_store = shared_store
+        self.rate_limiter = SharedTokenBucket(
+            shared_store,
+            'coingecko',
+            self.rate_limit_tokens,
+            self.rate_limit_tokens / self.rate_limit_window,
+            fallback=self.local_rate_limiter
+        )
+    
+    def _load_from_shared_store(self, crypto_ids):
+        """Pull fresh quotes written by other workers into the local cache"""
+        try:
+            entries = self.shared_store.read_quotes(crypto_ids, max_age=self.cache_duration)
+        except Exception as e:
+            print(f"Shared price store read failed: {e}")
+            return {}
+        
+        with self._lock:
+            self.cache.update(entries)
+        return {crypto_id: entry['quote'] for crypto_id, entry in entries.items()}
+    
+    def _write_to_shared_store(self, prices):
+        """Publish freshly fetched quotes to other workers"""
+        try:
+            self.shared_store.write_quotes(prices)
+        except Exception as e:
+            print(f"Shared price store write failed: {e}")
+    
+    def _request_from_ingester(self, crypto_ids):
+        """Reader mode: ask the ingester for these coins instead of calling CoinGecko"""
+        if self.shared_store is not None:
+            try:
+                self.shared_store.request_coins(crypto_ids)
+            except Exception as e:
+                print(f"Shared price store write failed: {e}")
+        
+        cached = self._get_from_cache(crypto_ids)
+        if cached:
+            return {'success': True, 'data': cached, 'cached': True, 'warning': 'Waiting for price ingester update'}
+        return {'success': False, 'error': 'PRICE_PENDING', 'message': 'Price not available yet, ingestion has been scheduled'}
+    
+    def enable_persistence(self, state_file, interval=60):
+        """Reload cache and circuit breaker from disk, then save them periodically and at exit"""
+        self.state_file = state_file
+        self.load_state()
+        atexit.register(self.save_state)
+        
+        def save_periodically():
+            while not self._persist_stop.wait(interval):
+                self.save_state()
+        
+        threading.Thread(target=save_periodically, name='price-state-saver', daemon=True).start()
+    
+    def save_state(self):
+        """Write cache entries and circuit breaker state to the state file"""
+        if not self.state_file:
+            return False
+        
+        with self._lock:
+            state = {
+                'saved_at': time.time(),
+                'cache': {
+                    crypto_id: {
+                        'cached_at': entry['cached_at'],
+                        'quote': {k: str(v) if isinstance(v, Decimal) else v for k, v in entry['quote'].items()}
+                    }
+                    for crypto_id, entry in self.cache.items()
+                },
+                'circuit_breaker': {
+                    'failures': self.circuit_breaker_failures,
+                    'open': self.circuit_breaker_open,
+                    'reset_time': self.circuit_breaker_reset_time.isoformat() if self.circuit_breaker_reset_time else None
+                }
+            }
+        
+        try:
+            # Write to a temp file and swap it in so readers never see a partial file
+            tmp_path = f"{self.state_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_file)
+            return True
+        except OSError as e:
+            print(f"Failed to save price cache state: {e}")
+            return False
+    
+    def load_state(self):
+        """Restore cache entries younger than max_stale_age and an unexpired open circuit breaker"""
+        if not self.state_file or not os.path.exists(self.state_file):
+            return 0
+        
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Failed to load price cache state: {e}")
+            return 0
+        
+        now = time.time()
+        max_age = max(self.cache_duration, self.max_stale_age if self.serve_stale else 0)
+        restored = 0
+        with self._lock:
+            for crypto_id, entry in state.get('cache', {}).items():
+                if now - entry['cached_at'] >= max_age or crypto_id in self.cache:
+                    continue
+                quote = dict(entry['quote'])
+                for field in ('price_usd', 'change_24h'):
+                    if field in quote:
+                        quote[field] = Decimal(quote[field])
+                self.cache[crypto_id] = {'quote': quote, 'cached_at': entry['cached_at']}
+                restored += 1
+            
+            breaker = state.get('circuit_breaker', {})
+            reset_time = breaker.get('reset_time')
+            if breaker.get('open') and reset_time and datetime.fromisoformat(reset_time) > datetime.utcnow():
+                self.circuit_breaker_open = True
+                self.circuit_breaker_reset_time = datetime.fromisoformat(reset_time)
+                self.circuit_breaker_failures = breaker.get('failures', 0)
+        
+        return restored
+    
+    def get_metrics(self):
+        """Upstream request metrics for monitoring"""
+        return {
+            'single_flight': self.single_flight.get_metrics(),
+            'rate_limiter': self.rate_limiter.get_metrics(),
+            'http': self.client.get_metrics(),
+            'cached_coins': len(self.cache),
+            'snapshot_version': self.snapshot.version if self.snapshot else None,
+            'upstream_enabled': self.upstream_enabled,
+            'circuit_breaker_open': self.circuit_breaker_open,
+            'circuit_breaker_failures': self.circuit_breaker_failures
+        }
+    
+    def _fetch_from_api(self, crypto_ids):
         """Fetch prices directly from CoinGecko API"""
         try:
             # Check circuit breaker
-            if self.circuit_breaker_open:
-                if datetime.utcnow() < self.circuit_breaker_reset_time:
-                    # Return cached data if available
-                    cached = self._get_from_cache(crypto_ids)
-                    if cached:
-                        return {'success': True, 'data': cached, 'cached': True, 'warning': 'API temporarily unavailable'}
-                    return {'success': False, 'error': 'API_UNAVAILABLE', 'message': 'CoinGecko API is temporarily unavailable'}
-                else:
-                    # Reset circuit breaker
-                    self.circuit_breaker_open = False
-                    self.circuit_breaker_failures = 0
+            if not self._circuit_allows_request():
+                return self._fallback_to_cache(crypto_ids, 'API temporarily unavailable',
+                                               'API_UNAVAILABLE', 'CoinGecko API is temporarily unavailable')
             
             # Rate limiting
-            self._apply_rate_limit()
+            if not self.rate_limiter.acquire(timeout=self.rate_limit_timeout):
+                return self._fallback_to_cache(crypto_ids, 'Rate limit reached, using cached data',
+                                               'RATE_LIMITED', 'CoinGecko rate limit reached, try again shortly')
             
             # Make API request
-            ids_param = ','.join(crypto_ids)
-            url = f"{self.base_url}/simple/price"
-            params = {
-                'ids': ids_param,
-                'vs_currencies': 'usd',
-                'include_24hr_change': 'true'
-            }
+            url, params = self._build_price_request(crypto_ids)
+            data = self.client.get_json(url, params=params)
             
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            # Transform data
-            prices = {}
-            for crypto_id in crypto_ids:
-                if crypto_id in data:
-                    prices[crypto_id] = {
-                        'crypto_id': crypto_id,
-                        'price_usd': Decimal(str(data[crypto_id]['usd'])),
-                        'change_24h': Decimal(str(data[crypto_id].get('usd_24h_change', 0))),
-                        'fetched_at': datetime.utcnow().isoformat()
-                    }
-            
-            # Update cache
-            self._update_cache(prices)
-            
-            # Reset circuit breaker on success
-            self.circuit_breaker_failures = 0
+            prices = self._parse_prices(crypto_ids, data)
+            self._store_fetched(prices)
             
             return {'success': True, 'data': prices, 'cached': False}
         
         except requests.exceptions.RequestException as e:
             # Increment circuit breaker failures
-            self.circuit_breaker_failures += 1
+            self._record_failure()
             
+            # Try to return cached data
+            return self._fallback_to_cache(crypto_ids, 'Using cached data due to API error',
+                                           'API_UNAVAILABLE', f'CoinGecko API error: {str(e)}')
+        
+        except sqlite3.Error as e:
+            # Shared rate limiter unusable (e.g. database is locked); CoinGecko itself did not fail
+            return self._fallback_to_cache(crypto_ids, 'Rate limiter unavailable, using cached data',
+                                           'RATE_LIMITED', f'Rate limiter unavailable: {str(e)}')
+    
+    def _build_price_request(self, crypto_ids):
+        """URL and query parameters for a /simple/price call"""
+        url = f"{self.base_url}/simple/price"
+        params = {
+            'ids': ','.join(crypto_ids),
+            'vs_currencies': 'usd',
+            'include_24hr_change': 'true'
+        }
+        return url, params
+    
+    def _parse_prices(self, crypto_ids, data):
+        """Transform a /simple/price response into quote dicts"""
+        prices = {}
+        fetched_at = datetime.utcnow().isoformat()
+        for crypto_id in crypto_ids:
+            if crypto_id in data and 'usd' in data[crypto_id]:
+                prices[crypto_id] = {
+                    'crypto_id': crypto_id,
+                    'price_usd': Decimal(str(data[crypto_id]['usd'])),
+                    'change_24h': Decimal(str(data[crypto_id].get('usd_24h_change') or 0)),
+                    'fetched_at': fetched_at
+                }
+        return prices
+    
+    def _store_fetched(self, prices):
+        """Cache freshly fetched prices, share them and reset the circuit breaker"""
+        self._update_cache(prices)
+        if self.shared_store is not None:
+            self._write_to_shared_store(prices)
+        
+        # Reset circuit breaker on success
+        self._record_success()
+    
+    def _fallback_to_cache(self, crypto_ids, warning, error, message):
+        """Serve cached (possibly stale) prices when the API cannot be used"""
+        cached = self._get_from_cache(crypto_ids)
+        if cached:
+            return {'success': True, 'data': cached, 'cached': True, 'warning': warning}
+        return {'success': False, 'error': error, 'message': message}
+    
+    def _circuit_allows_request(self):
+        """Check the circuit breaker, closing it again once the reset time has passed"""
+        with self._lock:
+            if not self.circuit_breaker_open:
+                return True
+            if datetime.utcnow() < self.circuit_breaker_reset_time:
+                return False
+            
+            # Reset circuit breaker
+            self.circuit_breaker_open = False
+            self.circuit_breaker_failures = 0
+            return True
+    
+    def _record_success(self):
+        """Reset circuit breaker failures after a successful call"""
+        with self._lock:
+            self.circuit_breaker_failures = 0
+    
+    def _record_failure(self):
+        """Count a failed call and open the circuit breaker at the threshold"""
+        with self._lock:
+            self.circuit_breaker_failures += 1
             if self.circuit_breaker_failures >= self.circuit_breaker_threshold:
                 self.circuit_breaker_open = True
                 self.circuit_breaker_reset_time = datetime.utcnow() + timedelta(seconds=60)
-            
-            # Try to return cached data
-            cached = self._get_from_cache(crypto_ids)
-            if cached:
-                return {'success': True, 'data': cached, 'cached': True, 'warning': 'Using cached data due to API error'}
-            
-            return {'success': False, 'error': 'API_UNAVAILABLE', 'message': f'CoinGecko API error: {str(e)}'}
     
-    def _is_cache_valid(self):
-        """Check if cache is still valid"""
-        if not self.cache:
-            return False
+    def _normalize_ids(self, crypto_ids):
+        """Strip blanks and duplicates from a list of coin ids"""
+        normalized = []
+        for crypto_id in crypto_ids:
+            crypto_id = crypto_id.strip()
+            if crypto_id and crypto_id not in normalized:
+                normalized.append(crypto_id)
+        return normalized
+    
+    def _in_request_order(self, crypto_ids, prices):
+        """Return prices ordered like the requested ids"""
+        return {c: prices[c] for c in crypto_ids if c in prices}
+    
+    def publish_snapshot(self, prices, universe=None):
+        """Publish a new immutable snapshot merging prices into the previous one"""
+        # Coins outside universe (when given) are dropped so removed coins stop being served
+        with self._lock:
+            previous = self.snapshot
+            quotes = dict(previous.quotes) if previous else {}
+            fetched = dict(previous.fetched) if previous else {}
+            # Listeners only hear about quotes that moved, not ones merely fetched again
+            moved = {
+                crypto_id: quote for crypto_id, quote in prices.items()
+                if crypto_id not in quotes or quotes[crypto_id]['price_usd'] != quote['price_usd']
+                or quotes[crypto_id].get('change_24h') != quote.get('change_24h')
+            }
+            for crypto_id, quote in prices.items():
+                quotes[crypto_id] = MappingProxyType(dict(quote))
+                fetched[crypto_id] = self._fetched_epoch(quote)
+            if universe is not None:
+                universe = set(universe)
+                for crypto_id in [c for c in quotes if c not in universe and c not in prices]:
+                    del quotes[crypto_id]
+                    del fetched[crypto_id]
+            
+            version = previous.version + 1 if previous else 1
+            snapshot = self.snapshot = PriceSnapshot(version, time.time(), MappingProxyType(quotes),
+                                                     MappingProxyType(fetched))
         
-        cache_age = self.get_cache_age()
-        return cache_age < self.cache_duration
+        for listener in self.snapshot_listeners:
+            try:
+                listener(moved)
+            except Exception as e:
+                print(f"Snapshot listener failed: {e}")
+        return snapshot
+    
+    def _fetched_epoch(self, quote):
+        """Epoch seconds of a quote's fetched_at (UTC ISO 8601); now if it has none"""
+        try:
+            return calendar.timegm(datetime.fromisoformat(quote['fetched_at']).timetuple())
+        except (KeyError, TypeError, ValueError):
+            return time.time()
     
-    def _get_from_cache(self, crypto_ids):
-        """Get prices from cache"""
-        if not self.cache:
+    def touch_coins(self, crypto_ids):
+        """Tell the refresher readers still want these coins"""
+        if self.refresher is not None:
+            self.refresher.touch_coins(crypto_ids)
+    
+    def add_snapshot_listener(self, listener):
+        """Register a callable notified with the quotes whose price or 24h change moved in each published snapshot"""
+        self.snapshot_listeners.append(listener)
+    
+    def get_price_version(self, crypto_ids=None):
+        """Validator for the published prices of crypto_ids (all coins if None); None when unknown"""
+        # Built from fetched_at stamps so workers reading the same shared quotes agree
+        snapshot = self.snapshot
+        if snapshot is None or time.time() - snapshot.published_at > self.snapshot_max_age:
             return None
         
-        result = {}
-        for crypto_id in crypto_ids:
-            if crypto_id in self.cache:
-                result[crypto_id] = self.cache[crypto_id]
+        whole_snapshot = crypto_ids is None
+        if whole_snapshot:
+            version, digest = self._snapshot_digest
+            if version == snapshot.version:
+                return digest
+            crypto_ids = snapshot.quotes.keys()
+        else:
+            crypto_ids = self._normalize_ids(crypto_ids)
+            if any(c not in snapshot.quotes for c in crypto_ids):
+                return None
+        
+        h = hashlib.sha1()
+        for crypto_id in sorted(crypto_ids):
+            h.update(f"{crypto_id}@{snapshot.quotes[crypto_id]['fetched_at']};".encode())
+        digest = h.hexdigest()[:16]
+        
+        if whole_snapshot:
+            self._snapshot_digest = (snapshot.version, digest)
+        return digest
+    
+    def _read_snapshot(self, crypto_ids):
+        """Get prices from the published snapshot, if it is recent enough"""
+        snapshot = self.snapshot
+        now = time.time()
+        if snapshot is None or now - snapshot.published_at > self.snapshot_max_age:
+            return {}
+        
+        # published_at moves whenever any coin changes, so each quote is also held to cache_duration;
+        # older ones fall through to the cache and stale-while-revalidate path
+        return {
+            c: dict(snapshot.quotes[c]) for c in crypto_ids
+            if c in snapshot.quotes and now - snapshot.fetched[c] < self.cache_duration
+        }
+    
+    def _get_from_cache(self, crypto_ids, max_age=None):
+        """Get prices from cache, optionally only entries younger than max_age seconds"""
+        with self._lock:
+            if not self.cache:
+                return None
+            
+            now = time.time()
+            result = {}
+            for crypto_id in crypto_ids:
+                entry = self.cache.get(crypto_id)
+                if entry is None:
+                    continue
+                if max_age is not None and now - entry['cached_at'] >= max_age:
+                    continue
+                result[crypto_id] = entry['quote']
         
         return result if result else None
     
     def _update_cache(self, prices):
-        """Update cache with new prices"""
-        self.cache.update(prices)
-        self.cache['_timestamp'] = datetime.utcnow()
-    
-    def get_cache_age(self):
-        """Returns age of cached data in seconds"""
-        if '_timestamp' not in self.cache:
-            return float('inf')
-        
-        cache_time = self.cache['_timestamp']
-        age = (datetime.utcnow() - cache_time).total_seconds()
-        return age
-    
-    def _apply_rate_limit(self):
-        """Apply rate limiting using token bucket algorithm"""
-        current_time = time.time()
-        
-        if self.last_request_time:
-            time_since_last = current_time - self.last_request_time
-            if time_since_last < (self.rate_limit_window / self.rate_limit_tokens):
-                sleep_time = (self.rate_limit_window / self.rate_limit_tokens) - time_since_last
-                time.sleep(sleep_time)
-        
-        self.last_request_time = time.time()
+        """Update cache with new prices, one entry per coin"""
+        now = time.time()
+        with self._lock:
+            for crypto_id, quote in prices.items():
+                self.cache[crypto_id] = {'quote': quote, 'cached_at': now}
+    
+    def get_cache_age(self, crypto_id=None):
+        """Returns age of cached data in seconds (for one coin, or the newest entry)"""
+        with self._lock:
+            if crypto_id is not None:
+                entry = self.cache.get(crypto_id)
+                if entry is None:
+                    return float('inf')
+                return time.time() - entry['cached_at']
+            
+            if not self.cache:
+                return float('inf')
+            
+            newest = max(entry['cached_at'] for entry in self.cache.values())
+            return time.time() - newest
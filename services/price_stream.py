@@ -0,0 +1,161 @@
+"""
+Price Stream
+Server-Sent Events fan-out of price snapshot changes. Each published snapshot
+becomes one event; subscribers wake only when quotes change and receive just
+the changed coins they asked for.
+
+Each open stream holds a request thread for its whole lifetime. Under gunicorn
+sync/gthread workers the subscriber cap defaults to half of --threads (so a
+sync worker refuses streams and clients poll); run a gevent/eventlet worker
+class to serve many streams per worker.
+"""
+import json
+import os
+import shlex
+import sys
+import threading
+import time
+from collections import deque
+
+def worker_threads():
+    """Request threads per gunicorn worker (from its command line), or None when threads are not the limit"""
+    # Outside gunicorn (Flask dev server) every request gets its own thread
+    if 'gunicorn' not in sys.modules:
+        return None
+    
+    # GUNICORN_CMD_ARGS is applied first, so the command line wins
+    args = shlex.split(os.getenv('GUNICORN_CMD_ARGS', '')) + sys.argv[1:]
+    threads, worker_class = 1, 'sync'
+    for i, arg in enumerate(args):
+        name, _, value = arg.partition('=')
+        if not value and i + 1 < len(args):
+            value = args[i + 1]
+        if name == '--threads':
+            threads = int(value)
+        elif name in ('-k', '--worker-class'):
+            worker_class = value
+    
+    # Cooperative workers park a stream on a greenlet, not an OS thread
+    if 'gevent' in worker_class or 'eventlet' in worker_class:
+        return None
+    return threads
+
+def default_max_subscribers(cooperative_limit=500):
+    """Streams a worker can hold while leaving threads for ordinary requests"""
+    threads = worker_threads()
+    return cooperative_limit if threads is None else threads // 2
+
+class PriceStream:
+    def __init__(self, price_service, history_size=256, heartbeat_interval=15, retry_ms=5000, max_subscribers=None):
+        self.price_service = price_service
+        self.heartbeat_interval = heartbeat_interval  # seconds between keep-alive comments
+        self.retry_ms = retry_ms  # client reconnect delay
+        self.max_subscribers = default_max_subscribers() if max_subscribers is None else max_subscribers
+        
+        # Recent events kept for Last-Event-ID resume: (event_id, {crypto_id: quote})
+        self.events = deque(maxlen=history_size)
+        self.last_event_id = 0
+        self.evicted_through = 0  # newest event id no longer in the buffer
+        self._condition = threading.Condition()
+        
+        self.subscribers = 0
+        self.events_published = 0
+        self.messages_sent = 0
+        self.resumed = 0
+        
+        price_service.add_snapshot_listener(self.publish)
+    
+    def publish(self, prices):
+        """Record changed quotes as a new event and wake subscribers"""
+        if not prices:
+            return
+        
+        quotes = {crypto_id: dict(quote) for crypto_id, quote in prices.items()}
+        with self._condition:
+            # Millisecond ids stay roughly comparable across workers when a client reconnects elsewhere
+            event_id = max(self.last_event_id + 1, int(time.time() * 1000))
+            if len(self.events) == self.events.maxlen:
+                self.evicted_through = self.events[0][0]
+            self.events.append((event_id, quotes))
+            self.last_event_id = event_id
+            self.events_published += 1
+            self._condition.notify_all()
+    
+    def try_subscribe(self):
+        """Reserve a subscriber slot; False when the stream is full"""
+        with self._condition:
+            if self.subscribers >= self.max_subscribers:
+                return False
+            self.subscribers += 1
+            return True
+    
+    def unsubscribe(self):
+        """Release a slot taken by try_subscribe()"""
+        with self._condition:
+            self.subscribers -= 1
+    
+    def stream(self, crypto_ids, last_event_id=None):
+        """Yield SSE frames for the given coins until the client disconnects"""
+        crypto_ids = set(self.price_service._normalize_ids(crypto_ids))
+        yield f"retry: {self.retry_ms}\n\n"
+        
+        with self._condition:
+            cursor = self.last_event_id
+            resumable = last_event_id is not None and self.evicted_through <= last_event_id <= cursor
+            missed = self._changes_since(last_event_id, crypto_ids) if resumable else None
+        
+        if resumable:
+            # Resume: replay only what changed while the client was away
+            with self._condition:
+                self.resumed += 1
+            if missed:
+                yield self._frame('prices', cursor, missed)
+        else:
+            # New client or a gap too old to replay: start from a full snapshot
+            result = self.price_service.get_current_prices(sorted(crypto_ids))
+            yield self._frame('snapshot', cursor, result.get('data', {}) if result['success'] else {})
+        last_sent = time.monotonic()
+        
+        while True:
+            with self._condition:
+                if self.last_event_id == cursor:
+                    self._condition.wait(max(0.0, self.heartbeat_interval - (time.monotonic() - last_sent)))
+                changes = self._changes_since(cursor, crypto_ids)
+                cursor = self.last_event_id
+            # An open stream keeps its on-demand coins in the refresh set
+            self.price_service.touch_coins(crypto_ids)
+            
+            if changes:
+                yield self._frame('prices', cursor, changes)
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= self.heartbeat_interval:
+                yield ": heartbeat\n\n"
+                last_sent = time.monotonic()
+    
+    def _changes_since(self, event_id, crypto_ids):
+        """Latest quote per subscribed coin across events newer than event_id (caller holds the lock)"""
+        changes = {}
+        for newer_id, quotes in reversed(self.events):
+            if newer_id <= event_id:
+                break
+            for crypto_id in crypto_ids.intersection(quotes):
+                changes.setdefault(crypto_id, quotes[crypto_id])
+        return changes
+    
+    def _frame(self, event, event_id, data):
+        """Encode one SSE message"""
+        with self._condition:
+            self.messages_sent += 1
+        return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+    
+    def get_metrics(self):
+        """Subscriber count and event fan-out"""
+        with self._condition:
+            return {
+                'subscribers': self.subscribers,
+                'events_published': self.events_published,
+                'messages_sent': self.messages_sent,
+                'resumed': self.resumed,
+                'last_event_id': self.last_event_id,
+                'buffered_events': len(self.events)
+            }
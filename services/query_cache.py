@@ -0,0 +1,110 @@
+"""
+Query Cache
+Bounded LRU cache with per-entry TTL and a byte budget, for historical query
+results. Entries are tagged with their coins and window end so new points for a
+coin drop only the windows they fall into.
+"""
+import sys
+import threading
+import time
+
+def estimate_size(value):
+    """Approximate bytes held by a JSON-like value (dicts, lists, scalars)"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(estimate_size(v) for v in value)
+    return size
+
+class QueryCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=60):
+        self.max_bytes = max_bytes
+        self.ttl = ttl  # seconds; also bounds staleness when another process appends
+        
+        # key -> (value, size, expires_at, crypto_ids, until); dict order is least to most recently used
+        self.entries = {}
+        self.by_coin = {}  # crypto_id -> set of keys
+        self.bytes = 0
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def get(self, key):
+        """Cached value, or None when missing or expired"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[2] <= time.time():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            
+            # Move to the most recently used end
+            del self.entries[key]
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, key, value, crypto_id, until=None):
+        """Cache value for a window of crypto_id (or a tuple of ids) ending at epoch `until` (None = still open)"""
+        crypto_ids = (crypto_id,) if isinstance(crypto_id, str) else tuple(crypto_id)
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        
+        with self._lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, size, time.time() + self.ttl, crypto_ids, until)
+            for coin in crypto_ids:
+                self.by_coin.setdefault(coin, set()).add(key)
+            self.bytes += size
+            
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+    
+    def invalidate(self, crypto_id, epoch=None):
+        """Drop crypto_id's windows that a point at epoch falls into (all of them when epoch is None)"""
+        with self._lock:
+            for key in list(self.by_coin.get(crypto_id, ())):
+                until = self.entries[key][4]
+                if epoch is None or until is None or epoch < until:
+                    self._remove(key)
+                    self.invalidations += 1
+    
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self.entries.clear()
+            self.by_coin.clear()
+            self.bytes = 0
+    
+    def _remove(self, key):
+        """Forget one entry (caller holds the lock)"""
+        value, size, expires_at, crypto_ids, until = self.entries.pop(key)
+        self.bytes -= size
+        for coin in crypto_ids:
+            keys = self.by_coin[coin]
+            keys.discard(key)
+            if not keys:
+                del self.by_coin[coin]
+    
+    def get_metrics(self):
+        """Hit ratio, size against budget, and eviction counts"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
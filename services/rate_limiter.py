@@ -0,0 +1,108 @@
+"""
+Rate Limiter
+Lock-protected token bucket that allows bursts and refills continuously,
+plus an asyncio adapter sharing the same budget
+"""
+import asyncio
+import threading
+import time
+
+class TokenBucket:
+    def __init__(self, capacity, refill_rate):
+        self.capacity = capacity  # maximum burst size
+        self.refill_rate = refill_rate  # tokens per second
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.acquired = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+    
+    def _refill(self, now):
+        """Add tokens earned since the last update (caller holds the lock)"""
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+            self.updated_at = now
+    
+    def try_acquire(self, tokens=1):
+        """Take tokens if available right now, never blocks"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                self.acquired += 1
+                return True
+            self.rejected += 1
+            return False
+    
+    def acquire(self, tokens=1, timeout=None):
+        """Take tokens, waiting up to timeout seconds (forever if None) for a refill"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    self.acquired += 1
+                    return True
+                
+                wait = (tokens - self.tokens) / self.refill_rate
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0 or wait > remaining:
+                        self.rejected += 1
+                        return False
+            
+            # Sleep outside the lock so other callers can keep using the bucket
+            time.sleep(wait)
+    
+    def available(self):
+        """Tokens currently available"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self.tokens
+    
+    def get_metrics(self):
+        """Bucket level and acquire/reject counts"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                'available': round(self.tokens, 2),
+                'capacity': self.capacity,
+                'refill_rate': self.refill_rate,
+                'acquired': self.acquired,
+                'rejected': self.rejected
+            }
+
+class AsyncTokenBucket:
+    def __init__(self, bucket, poll_interval=None):
+        # Wraps a TokenBucket / SharedTokenBucket so async callers share the same budget
+        self.bucket = bucket
+        self.poll_interval = poll_interval or min(1.0, 1.0 / bucket.refill_rate)
+    
+    def try_acquire(self, tokens=1):
+        """Take tokens if available right now, never blocks"""
+        return self.bucket.try_acquire(tokens)
+    
+    async def _try_acquire(self, tokens):
+        """try_acquire off the event loop when the bucket lives in a database"""
+        if isinstance(self.bucket, TokenBucket):
+            return self.bucket.try_acquire(tokens)
+        return await asyncio.to_thread(self.bucket.try_acquire, tokens)
+    
+    async def acquire(self, tokens=1, timeout=None):
+        """Take tokens, yielding to the event loop while waiting for a refill"""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        
+        while not await self._try_acquire(tokens):
+            delay = self.poll_interval
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return False
+                delay = min(delay, remaining)
+            await asyncio.sleep(delay)
+        return True
@@ -0,0 +1,303 @@
+"""
+Shared Price Store
+SQLite (WAL) backed quote and market response cache, rate-limit budget and
+refresh lease shared by every worker process
+"""
+import json
+import sqlite3
+import time
+from datetime import datetime
+from decimal import Decimal
+from database import DATABASE_PATH, init_shared_price_tables
+
+def market_request_key(path, params):
+    """Stable key for a market gateway request"""
+    return f"{path}?{json.dumps(params, sort_keys=True, separators=(',', ':'))}"
+
+class SharedPriceStore:
+    def __init__(self, db_path=None, busy_timeout=5):
+        self.db_path = db_path or DATABASE_PATH
+        self.busy_timeout = busy_timeout
+        
+        conn = self._connect()
+        try:
+            # WAL lets readers in every worker proceed while one worker writes
+            conn.execute('PRAGMA journal_mode=WAL')
+            init_shared_price_tables(conn.cursor())
+        finally:
+            conn.close()
+    
+    def _connect(self):
+        """Open a connection in autocommit mode so transactions are explicit"""
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+    
+    def read_quotes(self, crypto_ids, max_age=None):
+        """Get cache entries ({'quote', 'cached_at'}) for the given coins"""
+        if not crypto_ids:
+            return {}
+        
+        conn = self._connect()
+        try:
+            placeholders = ','.join('?' * len(crypto_ids))
+            rows = conn.execute(f'''
+                SELECT crypto_id, price_usd, change_24h, fetched_at, cached_at
+                FROM price_quotes
+                WHERE crypto_id IN ({placeholders})
+            ''', list(crypto_ids)).fetchall()
+        finally:
+            conn.close()
+        
+        now = time.time()
+        entries = {}
+        for row in rows:
+            if max_age is not None and now - row['cached_at'] >= max_age:
+                continue
+            entries[row['crypto_id']] = {
+                'quote': {
+                    'crypto_id': row['crypto_id'],
+                    'price_usd': Decimal(str(row['price_usd'])),
+                    'change_24h': Decimal(str(row['change_24h'])),
+                    'fetched_at': row['fetched_at']
+                },
+                'cached_at': row['cached_at']
+            }
+        return entries
+    
+    def write_quotes(self, prices, cached_at=None):
+        """Upsert quotes fetched from the API"""
+        if not prices:
+            return
+        
+        cached_at = cached_at or time.time()
+        rows = [
+            (crypto_id, float(quote['price_usd']), float(quote.get('change_24h', 0)),
+             quote.get('fetched_at') or datetime.utcnow().isoformat(), cached_at)
+            for crypto_id, quote in prices.items()
+        ]
+        
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('''
+                INSERT INTO price_quotes (crypto_id, price_usd, change_24h, fetched_at, cached_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(crypto_id) DO UPDATE SET
+                    price_usd = excluded.price_usd,
+                    change_24h = excluded.change_24h,
+                    fetched_at = excluded.fetched_at,
+                    cached_at = excluded.cached_at
+            ''', rows)
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+    
+    def request_coins(self, crypto_ids):
+        """Record coins readers asked for so the ingester picks them up"""
+        if not crypto_ids:
+            return
+        
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.executemany('''
+                INSERT INTO price_demand (crypto_id, requested_at) VALUES (?, ?)
+                ON CONFLICT(crypto_id) DO UPDATE SET requested_at = excluded.requested_at
+            ''', [(crypto_id, now) for crypto_id in crypto_ids])
+        finally:
+            conn.close()
+    
+    def get_demanded_coins(self, max_age=86400, limit=500):
+        """Coins requested within the last max_age seconds, most recent first"""
+        conn = self._connect()
+        try:
+            rows = conn.execute('''
+                SELECT crypto_id FROM price_demand
+                WHERE requested_at >= ?
+                ORDER BY requested_at DESC
+                LIMIT ?
+            ''', (time.time() - max_age, limit)).fetchall()
+        finally:
+            conn.close()
+        return [row['crypto_id'] for row in rows]
+    
+    def read_market_response(self, path, params):
+        """Cached market gateway response ({'data', 'cached_at'}), or None if nobody fetched it yet"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT data, cached_at FROM market_responses WHERE request_key = ? AND data IS NOT NULL',
+                (market_request_key(path, params),)
+            ).fetchone()
+        finally:
+            conn.close()
+        return {'data': json.loads(row['data']), 'cached_at': row['cached_at']} if row else None
+    
+    def write_market_response(self, endpoint, path, params, data, cached_at=None):
+        """Upsert a market gateway response fetched from the API"""
+        conn = self._connect()
+        try:
+            conn.execute('''
+                INSERT INTO market_responses (request_key, endpoint, path, params, data, cached_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(request_key) DO UPDATE SET
+                    data = excluded.data,
+                    cached_at = excluded.cached_at
+            ''', (market_request_key(path, params), endpoint, path, json.dumps(params, sort_keys=True),
+                  json.dumps(data), cached_at or time.time()))
+        finally:
+            conn.close()
+    
+    def request_market_response(self, endpoint, path, params):
+        """Record a market request readers made so the ingester keeps it fresh"""
+        conn = self._connect()
+        try:
+            conn.execute('''
+                INSERT INTO market_responses (request_key, endpoint, path, params, requested_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(request_key) DO UPDATE SET requested_at = excluded.requested_at
+            ''', (market_request_key(path, params), endpoint, path, json.dumps(params, sort_keys=True), time.time()))
+        finally:
+            conn.close()
+    
+    def get_demanded_market_requests(self, max_age=3600, limit=100):
+        """Market requests ({'endpoint', 'path', 'params'}) made within the last max_age seconds, most recent first"""
+        conn = self._connect()
+        try:
+            rows = conn.execute('''
+                SELECT endpoint, path, params FROM market_responses
+                WHERE requested_at >= ?
+                ORDER BY requested_at DESC
+                LIMIT ?
+            ''', (time.time() - max_age, limit)).fetchall()
+        finally:
+            conn.close()
+        return [{'endpoint': row['endpoint'], 'path': row['path'], 'params': json.loads(row['params'])} for row in rows]
+    
+    def try_acquire_lease(self, name, owner, ttl):
+        """Take or renew a named lease for ttl seconds; False if another owner holds it"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT owner, expires_at FROM leases WHERE name = ?', (name,)).fetchone()
+            if row and row['owner'] != owner and row['expires_at'] > now:
+                conn.execute('COMMIT')
+                return False
+            
+            conn.execute('''
+                INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            ''', (name, owner, now + ttl))
+            conn.execute('COMMIT')
+            return True
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+    
+    def release_lease(self, name, owner):
+        """Give up a lease held by owner"""
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM leases WHERE name = ? AND owner = ?', (name, owner))
+        finally:
+            conn.close()
+    
+    def take_tokens(self, name, tokens, capacity, refill_rate):
+        """Atomically refill and take tokens; returns (acquired, seconds to wait if not)"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT tokens, updated_at FROM rate_limit_buckets WHERE name = ?', (name,)).fetchone()
+            if row is None:
+                available = float(capacity)
+            else:
+                elapsed = max(0.0, now - row['updated_at'])
+                available = min(capacity, row['tokens'] + elapsed * refill_rate)
+            
+            acquired = available >= tokens
+            if acquired:
+                available -= tokens
+            
+            conn.execute('''
+                INSERT INTO rate_limit_buckets (name, tokens, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+            ''', (name, available, now))
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        
+        wait = 0.0 if acquired else (tokens - available) / refill_rate
+        return acquired, wait
+
+# Same API as TokenBucket, but the bucket level lives in the shared store
+class SharedTokenBucket:
+    def __init__(self, store, name, capacity, refill_rate, fallback=None):
+        self.store = store
+        self.name = name
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.fallback = fallback  # process-local TokenBucket used while the store is locked or unavailable
+        self.acquired = 0
+        self.rejected = 0
+        self.store_errors = 0
+    
+    def _take(self, tokens):
+        """(acquired, wait) from the shared bucket, or from the fallback bucket if the store fails"""
+        try:
+            return self.store.take_tokens(self.name, tokens, self.capacity, self.refill_rate)
+        except sqlite3.Error as e:
+            self.store_errors += 1
+            if self.fallback is None:
+                raise
+            print(f"Shared rate limiter unavailable, using local bucket: {e}")
+            return self.fallback.try_acquire(tokens), 1.0 / self.refill_rate
+    
+    def try_acquire(self, tokens=1):
+        """Take tokens if available right now, never blocks"""
+        acquired, _ = self._take(tokens)
+        if acquired:
+            self.acquired += 1
+        else:
+            self.rejected += 1
+        return acquired
+    
+    def acquire(self, tokens=1, timeout=None):
+        """Take tokens, waiting up to timeout seconds (forever if None) for a refill"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        
+        while True:
+            acquired, wait = self._take(tokens)
+            if acquired:
+                self.acquired += 1
+                return True
+            
+            if deadline is not None and time.monotonic() + wait > deadline:
+                self.rejected += 1
+                return False
+            time.sleep(wait)
+    
+    def get_metrics(self):
+        """Acquire/reject counts for this worker"""
+        return {
+            'shared': True,
+            'name': self.name,
+            'capacity': self.capacity,
+            'refill_rate': self.refill_rate,
+            'acquired': self.acquired,
+            'rejected': self.rejected,
+            'store_errors': self.store_errors
+        }
@@ -0,0 +1,68 @@
+"""
+Single Flight
+Coalesces concurrent calls for the same key into one in-flight execution
+"""
+import threading
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leader_calls = 0
+        self.coalesced_calls = 0
+        self.timeouts = 0
+    
+    def do(self, key, fn, timeout=None):
+        """Run fn once per key; returns (result, shared) where shared means another caller ran it"""
+        # Followers wait up to timeout seconds for the leader, then raise TimeoutError
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self.leader_calls += 1
+                leader = True
+            else:
+                self.coalesced_calls += 1
+                leader = False
+        
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        elif not call.done.wait(timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f'Timed out waiting for in-flight call {key!r}')
+        
+        if call.error is not None:
+            raise call.error
+        return call.result, not leader
+    
+    def in_flight(self):
+        """Number of keys currently being fetched"""
+        with self._lock:
+            return len(self._calls)
+    
+    def get_metrics(self):
+        """Leader versus coalesced call counts"""
+        with self._lock:
+            total = self.leader_calls + self.coalesced_calls
+            return {
+                'leader_calls': self.leader_calls,
+                'coalesced_calls': self.coalesced_calls,
+                'timeouts': self.timeouts,
+                'in_flight': len(self._calls),
+                'coalesced_ratio': round(self.coalesced_calls / total, 4) if total else 0.0
+            }
@@ -7,7 +7,10 @@ from datetime import datetime, timedelta
 import time
 
 class SystemService:
-    def __init__(self):
+    def __init__(self, price_service=None, market_service=None, price_stream=None):
+        self.price_service = price_service
+        self.market_service = market_service
+        self.price_stream = price_stream
         self.start_time = time.time()
         self.api_status = 'connected'
         self.last_api_check = datetime.now()
@@ -79,7 +82,7 @@ class SystemService:
     
     def get_api_status(self):
         """Get detailed API status"""
-        return {
+        status = {
             'success': True,
             'api': {
                 'coingecko': {
@@ -94,6 +97,16 @@ class SystemService:
                 }
             }
         }
+        
+        # Live upstream metrics (request coalescing, cache, circuit breaker)
+        if self.price_service is not None:
+            status['api']['coingecko']['metrics'] = self.price_service.get_metrics()
+        if self.market_service is not None:
+            status['api']['coingecko']['market_gateway'] = self.market_service.get_metrics()
+        if self.price_stream is not None:
+            status['api']['coingecko']['price_stream'] = self.price_stream.get_metrics()
+        
+        return status
     
     def update_api_status(self, status):
         """Update API status after API call"""
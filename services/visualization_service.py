@@ -2,11 +2,76 @@
 Visualization Service
 Transforms historical data into chart-ready format
 """
+import calendar
+from array import array
+from datetime import datetime
 from decimal import Decimal
 
+try:
+    import numpy
+except ImportError:  # optional: downsampling falls back to pure Python
+    numpy = None
+
+def lttb_indices(xs, ys, max_points):
+    """Indices of the points Largest-Triangle-Three-Buckets keeps to draw (xs, ys) with max_points"""
+    n = len(xs)
+    if max_points >= n:
+        return list(range(n))
+    if max_points < 3:
+        return [0, n - 1][:max_points]
+    
+    # First and last points are always kept; the rest split into max_points - 2 buckets
+    every = (n - 2) / (max_points - 2)
+    bounds = [int(i * every) + 1 for i in range(max_points - 2)] + [n - 1]
+    if numpy is not None:
+        return _lttb_numpy(numpy.asarray(xs, dtype=numpy.float64), numpy.asarray(ys, dtype=numpy.float64), bounds)
+    return _lttb_python(xs, ys, bounds)
+
+def _lttb_numpy(x, y, bounds):
+    bounds = numpy.asarray(bounds)
+    sizes = numpy.diff(bounds)
+    # Every bucket's centroid at once from prefix sums; the last bucket's neighbour is the final point
+    cx = numpy.concatenate(([0.0], numpy.cumsum(x)))
+    cy = numpy.concatenate(([0.0], numpy.cumsum(y)))
+    avg_x = numpy.append((cx[bounds[1:]] - cx[bounds[:-1]]) / sizes, x[-1])
+    avg_y = numpy.append((cy[bounds[1:]] - cy[bounds[:-1]]) / sizes, y[-1])
+    
+    kept = [0]
+    a = 0
+    for i in range(len(sizes)):
+        lo, hi = int(bounds[i]), int(bounds[i + 1])
+        nx, ny = avg_x[i + 1], avg_y[i + 1]
+        area = numpy.abs((x[a] - nx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (ny - y[a]))
+        a = lo + int(area.argmax())
+        kept.append(a)
+    kept.append(len(x) - 1)
+    return kept
+
+def _lttb_python(x, y, bounds):
+    n = len(x)
+    kept = [0]
+    a = 0
+    for i in range(len(bounds) - 1):
+        lo, hi = bounds[i], bounds[i + 1]
+        # Centroid of the next bucket, or the final point after the last bucket
+        nlo, nhi = (hi, bounds[i + 2]) if i + 2 < len(bounds) else (n - 1, n)
+        nx = sum(x[nlo:nhi]) / (nhi - nlo)
+        ny = sum(y[nlo:nhi]) / (nhi - nlo)
+        
+        xa, ya = x[a], y[a]
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((xa - nx) * (y[j] - ya) - (xa - x[j]) * (ny - ya))
+            if area > best_area:
+                best, best_area = j, area
+        a = best
+        kept.append(a)
+    kept.append(n - 1)
+    return kept
+
 class VisualizationService:
-    def prepare_chart_data(self, price_snapshots):
-        """Transform price snapshots into chart data structure"""
+    def prepare_chart_data(self, price_snapshots, max_points=None):
+        """Transform price snapshots into chart data structure, LTTB-downsampled to max_points"""
         try:
             if not price_snapshots:
                 return {
@@ -14,19 +79,18 @@ class VisualizationService:
                     'datasets': []
                 }
             
-            # Extract labels (timestamps) and data (prices)
-            labels = []
-            prices = []
+            # Columns of epoch seconds and float prices for the downsampler
+            epochs = array('d', (calendar.timegm(snapshot['timestamp'].timetuple()) for snapshot in price_snapshots))
+            prices = array('d', (float(snapshot['price_usd']) for snapshot in price_snapshots))
+            
+            if max_points and max_points < len(prices):
+                kept = lttb_indices(epochs, prices, max_points)
+            else:
+                kept = range(len(prices))
             
-            for snapshot in price_snapshots:
-                # Format timestamp for display
-                timestamp = snapshot['timestamp']
-                label = timestamp.strftime('%Y-%m-%d %H:%M')
-                labels.append(label)
-                
-                # Convert Decimal to float for JSON serialization
-                price = float(snapshot['price_usd'])
-                prices.append(price)
+            # Format timestamps only for the points that are drawn
+            labels = [price_snapshots[i]['timestamp'].strftime('%Y-%m-%d %H:%M') for i in kept]
+            prices = [prices[i] for i in kept]
             
             # Get crypto name from first snapshot
             crypto_name = price_snapshots[0]['crypto_id'].capitalize()
@@ -48,6 +112,17 @@ class VisualizationService:
             print(f"Error preparing chart data: {e}")
             return {'labels': [], 'datasets': []}
     
+    def prepare_comparison_data(self, timestamps, series):
+        """Chart data for several coins sharing one time axis; gaps stay null"""
+        return {
+            'labels': [datetime.utcfromtimestamp(epoch).strftime('%Y-%m-%d %H:%M') for epoch in timestamps],
+            'timestamps': timestamps,
+            'datasets': [
+                {'crypto_id': crypto_id, 'label': f'{crypto_id.capitalize()} Price (USD)', 'data': closes}
+                for crypto_id, closes in series.items()
+            ]
+        }
+    
     def calculate_axis_scaling(self, prices):
         """Calculate appropriate Y-axis min, max, and step values"""
         if not prices:
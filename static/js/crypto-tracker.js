@@ -12,6 +12,8 @@ class CryptoTracker {
         this.page = 1;
         this.perPage = 50;
         this.updateInterval = null;
+        this.priceStream = null;
+        this.watchedIds = '';
         this.init();
     }
 
@@ -24,7 +26,7 @@ class CryptoTracker {
 
     async fetchMarketStats() {
         try {
-            const response = await fetch('https://api.coingecko.com/api/v3/global', {
+            const response = await fetch('/api/market/global', {
                 method: 'GET',
                 headers: {
                     'Accept': 'application/json'
@@ -68,7 +70,7 @@ class CryptoTracker {
         try {
             this.showLoading();
             const response = await fetch(
-                `https://api.coingecko.com/api/v3/coins/markets?vs_currency=usd&order=market_cap_desc&per_page=${this.perPage}&page=${this.page}&sparkline=true&price_change_percentage=24h,7d`,
+                `/api/market/markets?per_page=${this.perPage}&page=${this.page}&sparkline=true&price_change_percentage=24h,7d`,
                 {
                     method: 'GET',
                     headers: {
@@ -83,6 +85,7 @@ class CryptoTracker {
 
             this.cryptoData = await response.json();
             this.renderCryptoList();
+            this.watchPrices();
         } catch (error) {
             console.error('Failed to fetch crypto data:', error);
             this.showError('Failed to load cryptocurrency data. Please check your internet connection and try again.');
@@ -299,12 +302,39 @@ class CryptoTracker {
         }
     }
 
-    startAutoUpdate() {
-        // Update every 60 seconds
+    startAutoUpdate(interval = 300000) {
+        // Live prices arrive over the price stream; market caps, volumes and sparklines refresh slowly
+        this.stopAutoUpdate();
         this.updateInterval = setInterval(() => {
             this.fetchMarketStats();
             this.fetchCryptoData();
-        }, 60000);
+        }, interval);
+    }
+
+    watchPrices() {
+        const ids = this.cryptoData.map(crypto => crypto.id);
+        if (ids.join(',') === this.watchedIds) return;
+
+        if (this.priceStream) this.priceStream.close();
+        this.watchedIds = ids.join(',');
+        // Without the stream (e.g. logged out) fall back to refreshing the whole table every 60 seconds
+        this.priceStream = subscribePrices(ids, prices => this.applyPrices(prices), () => this.startAutoUpdate(60000));
+    }
+
+    applyPrices(prices) {
+        let changed = false;
+        this.cryptoData.forEach(crypto => {
+            const quote = prices[crypto.id];
+            if (quote) {
+                crypto.current_price = parseFloat(quote.price_usd);
+                crypto.price_change_percentage_24h = parseFloat(quote.change_24h);
+                changed = true;
+            }
+        });
+
+        if (changed) {
+            this.renderCryptoList();
+        }
     }
 
     stopAutoUpdate() {
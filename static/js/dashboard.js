@@ -1,5 +1,5 @@
 // Dashboard functionality
-let priceRefreshInterval;
+let currentPrices = {};
 
 async function fetchPrices() {
     try {
@@ -7,6 +7,7 @@ async function fetchPrices() {
         const data = await response.json();
         
         if (data.success) {
+            currentPrices = data.data;
             displayPrices(data.data);
         } else {
             showError('Failed to fetch prices');
@@ -78,8 +79,8 @@ function refreshPrices() {
     fetchPrices();
 }
 
-// Initial load
-fetchPrices();
-
-// Auto-refresh every 60 seconds
-priceRefreshInterval = setInterval(fetchPrices, 60000);
+// Live prices: the server pushes only changed quotes
+subscribePrices(['bitcoin', 'ethereum'], (prices) => {
+    Object.assign(currentPrices, prices);
+    displayPrices(currentPrices);
+});
@@ -9,8 +9,8 @@ async function loadHistoricalData() {
     showLoading();
 
     try {
-        // Fetch data directly from CoinGecko API
-        const response = await fetch(`https://api.coingecko.com/api/v3/coins/${cryptoId}/market_chart?vs_currency=usd&days=${days}`);
+        // Fetch data through the server-side market gateway
+        const response = await fetch(`/api/market/coins/${cryptoId}/market_chart?days=${days}`);
         const data = await response.json();
 
         if (data.prices) {
@@ -0,0 +1,65 @@
+// Live price updates over Server-Sent Events
+// Calls onPrices(quotes, isSnapshot) with only the coins that changed.
+// EventSource reconnects on its own and resumes from the last event id;
+// onUnavailable runs if the stream cannot be used (defaults to polling /api/prices).
+
+function subscribePrices(cryptoIds, onPrices, onUnavailable) {
+    const ids = cryptoIds.join(',');
+
+    const fallback = onUnavailable || (() => {
+        const poll = async () => {
+            try {
+                const response = await fetch(`/api/prices?ids=${ids}`);
+                const data = await response.json();
+                if (data.success) {
+                    onPrices(data.data, true);
+                }
+            } catch (error) {
+                console.error('Failed to fetch prices:', error);
+            }
+        };
+        poll();
+        setInterval(poll, 60000);
+    });
+
+    if (!window.EventSource) {
+        fallback();
+        return null;
+    }
+
+    const source = new EventSource(`/api/prices/stream?ids=${ids}`);
+
+    source.addEventListener('snapshot', (event) => onPrices(JSON.parse(event.data), true));
+    source.addEventListener('prices', (event) => onPrices(JSON.parse(event.data), false));
+    source.onerror = () => {
+        // CLOSED means the server refused the stream (full, or not logged in); transient drops reconnect
+        if (source.readyState === EventSource.CLOSED) {
+            fallback();
+        }
+    };
+
+    window.addEventListener('beforeunload', () => source.close());
+    return source;
+}
+
+// Run fn at most once per intervalMs; calls in between collapse into one trailing call,
+// so a burst of price events costs a single refetch
+function throttle(fn, intervalMs) {
+    let last = 0;
+    let timer = null;
+
+    return () => {
+        if (timer) return;
+        const wait = last + intervalMs - Date.now();
+        if (wait <= 0) {
+            last = Date.now();
+            fn();
+            return;
+        }
+        timer = setTimeout(() => {
+            timer = null;
+            last = Date.now();
+            fn();
+        }, wait);
+    };
+}
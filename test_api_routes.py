@@ -0,0 +1,78 @@
+"""
+Test API Routes
+Request validation and conditional GETs on the shared historical routes
+"""
+import time
+
+from flask import Flask
+
+from services.api_routes import register_history_routes, MAX_HISTORY_DAYS
+from services.historical_service import HistoricalService
+from services.visualization_service import VisualizationService
+
+class StaticPriceService:
+    def get_price_version(self, crypto_ids=None):
+        return 'v1'
+
+def make_client(historical_service=None):
+    app = Flask(__name__)
+    historical_service = historical_service or HistoricalService(engine='memory')
+    register_history_routes(app, historical_service, StaticPriceService(), VisualizationService(), lambda f: f)
+    return app.test_client()
+
+def test_invalid_days_rejected():
+    client = make_client()
+    for days in ('abc', '0', '-3', '1.5', str(MAX_HISTORY_DAYS + 1), '99999999999'):
+        for path in ('/api/historical', '/api/historical/batch?ids=bitcoin&resolution=1d'):
+            response = client.get(f"{path}{'&' if '?' in path else '?'}days={days}")
+            assert response.status_code == 400, (path, days)
+            assert response.get_json()['error'] == 'INVALID_RANGE'
+
+def test_invalid_window_and_resolution_rejected():
+    client = make_client()
+    assert client.get('/api/historical?start=yesterday').get_json()['error'] == 'INVALID_RANGE'
+    assert client.get('/api/historical?start=2000&end=1000').status_code == 400
+    assert client.get('/api/historical?resolution=2h').get_json()['error'] == 'INVALID_RESOLUTION'
+    assert client.get('/api/historical/batch?ids=bitcoin&resolution=raw').get_json()['error'] == 'INVALID_RESOLUTION'
+
+def test_batch_limits():
+    client = make_client()
+    assert client.get('/api/historical/batch').get_json()['error'] == 'INVALID_COINS'
+    assert client.get('/api/historical/batch?ids=bit$coin').get_json()['error'] == 'INVALID_COIN_ID'
+    response = client.get('/api/historical/batch?ids=bitcoin&resolution=1m&days=90&max_points=100')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'TOO_MANY_POINTS'
+
+def test_valid_days_accepted():
+    client = make_client()
+    response = client.get(f'/api/historical?days={MAX_HISTORY_DAYS}&resolution=1d')
+    assert response.status_code == 200
+    assert response.get_json()['success']
+
+def test_historical_etag_answers_304_until_history_changes():
+    historical_service = HistoricalService(engine='memory')
+    historical_service.store_price_snapshots({'bitcoin': 100.0})
+    client = make_client(historical_service)
+    
+    first = client.get('/api/historical?crypto_id=bitcoin&days=1')
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and etag
+    
+    cached = client.get('/api/historical?crypto_id=bitcoin&days=1', headers={'If-None-Match': etag})
+    assert cached.status_code == 304 and cached.data == b''
+    
+    # A backfill changes the history without a new published price
+    historical_service.backfill('bitcoin', [(int(time.time()) - 3600, 90.0)])
+    fresh = client.get('/api/historical?crypto_id=bitcoin&days=1', headers={'If-None-Match': etag})
+    assert fresh.status_code == 200 and fresh.headers['ETag'] != etag
+
+def test_batch_etag_covers_every_coin():
+    historical_service = HistoricalService(engine='memory')
+    historical_service.store_price_snapshots({'bitcoin': 100.0, 'ethereum': 10.0})
+    client = make_client(historical_service)
+    url = '/api/historical/batch?ids=bitcoin,ethereum&days=1'
+    
+    etag = client.get(url).headers['ETag']
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+    historical_service.backfill('ethereum', [(int(time.time()) - 3600, 9.0)])
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 200
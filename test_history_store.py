@@ -0,0 +1,101 @@
+"""
+Test History Store
+The SQLite, memory and mmap engines must return the same points and candles
+"""
+import random
+
+import pytest
+
+from services.history_store import CANDLE_RESOLUTIONS, SQLiteHistoryStore, MemoryHistoryStore, MmapHistoryStore
+
+BASE = 1700000000 - 1700000000 % 86400
+
+def make_stores(tmp_path):
+    return {
+        'sqlite': SQLiteHistoryStore(str(tmp_path / 'history.db')),
+        'memory': MemoryHistoryStore(),
+        'mmap': MmapHistoryStore(str(tmp_path / 'mmap')),
+    }
+
+def snapshot(store, crypto_id='bitcoin', start=BASE - 86400, end=None):
+    rows = [(int(epoch), float(price)) for epoch, price, source in store.read(crypto_id, start, end)]
+    candles = {name: [tuple(row) for row in store.read_candles(crypto_id, resolution, start, end)]
+               for name, resolution in CANDLE_RESOLUTIONS.items()}
+    epochs, prices = store.read_columns(crypto_id, start, end)
+    return rows, candles, (list(epochs), list(prices))
+
+def assert_engines_agree(stores, **window):
+    expected = snapshot(stores['sqlite'], **window)
+    for name, store in stores.items():
+        assert snapshot(store, **window) == expected, name
+
+def test_engines_agree_on_appends_and_late_points(tmp_path):
+    stores = make_stores(tmp_path)
+    rng = random.Random(7)
+    batches = [[('bitcoin', BASE + rng.randrange(0, 3 * 86400), rng.uniform(20000, 40000), 'coingecko')
+                for _ in range(200)] for _ in range(5)]
+    for batch in batches:
+        for store in stores.values():
+            store.write(batch)
+    
+    assert_engines_agree(stores)
+    assert_engines_agree(stores, start=BASE + 3600, end=BASE + 86400 + 1800)
+
+def test_duplicate_epochs_within_a_batch(tmp_path):
+    stores = make_stores(tmp_path)
+    for store in stores.values():
+        store.write([('bitcoin', BASE, 1.0, 'coingecko'), ('bitcoin', BASE + 60, 2.0, 'coingecko'),
+                     ('bitcoin', BASE + 60, 3.0, 'coingecko')])
+        # write_missing keeps the stored point and the first of any duplicates
+        added = store.write_missing([('bitcoin', BASE + 60, 9.0, 'coingecko'), ('bitcoin', BASE - 60, 4.0, 'coingecko'),
+                                     ('bitcoin', BASE - 60, 5.0, 'coingecko')])
+        assert added == 1
+    
+    assert_engines_agree(stores)
+    rows, candles, columns = snapshot(stores['mmap'])
+    assert rows == [(BASE - 60, 4.0), (BASE, 1.0), (BASE + 60, 3.0)]
+
+def test_engines_agree_after_purge(tmp_path):
+    stores = make_stores(tmp_path)
+    rows = [('bitcoin', BASE + i * 300, 100.0 + i, 'coingecko') for i in range(576)]
+    # On a day boundary, so no candle straddles the cutoff (the SQLite and memory engines keep those whole)
+    for store in stores.values():
+        store.write(rows)
+        store.purge(['bitcoin'], BASE + 86400)
+    
+    assert_engines_agree(stores, start=BASE)
+
+@pytest.mark.parametrize('engine', ['sqlite', 'memory', 'mmap'])
+def test_unknown_coin_is_empty(tmp_path, engine):
+    store = make_stores(tmp_path)[engine]
+    epochs, prices = store.read_columns('nocoin', BASE)
+    assert store.read('nocoin', BASE) == [] and len(epochs) == 0 and len(prices) == 0
+    assert list(store.read_candles('nocoin', 60, BASE)) == []
+
+def test_memory_columns_survive_later_writes():
+    store = MemoryHistoryStore()
+    store.write([('bitcoin', BASE + i, float(i), 'coingecko') for i in range(100)])
+    epochs, prices = store.read_columns('bitcoin', BASE + 10, BASE + 20)
+    
+    # Appends, late inserts, replacements and compaction move the store to new buffers, not the views
+    store.write([('bitcoin', BASE + 100, 1.0, 'coingecko'), ('bitcoin', BASE + 15, 99.0, 'coingecko'),
+                 ('bitcoin', BASE - 5, 1.0, 'coingecko')])
+    store.purge(['bitcoin'], BASE + 80)
+    assert list(epochs) == list(range(BASE + 10, BASE + 20))
+    assert list(prices) == [float(i) for i in range(10, 20)]
+    assert [row[0] for row in store.read('bitcoin', BASE)] == list(range(BASE + 80, BASE + 101))
+
+def test_versions_change_on_every_write_and_purge(tmp_path):
+    for name, store in make_stores(tmp_path).items():
+        assert store.read_versions(['bitcoin']) == {}, name
+        seen = []
+        store.write([('bitcoin', BASE + i * 60, 1.0, 'coingecko') for i in range(10)])
+        seen.append(store.read_versions(['bitcoin'])['bitcoin'])
+        store.write([('bitcoin', BASE + 540, 2.0, 'coingecko')])  # same size, replaced in place
+        seen.append(store.read_versions(['bitcoin'])['bitcoin'])
+        store.write_missing([('bitcoin', BASE - 60, 3.0, 'coingecko')])
+        seen.append(store.read_versions(['bitcoin'])['bitcoin'])
+        store.purge(['bitcoin'], BASE + 120)
+        seen.append(store.read_versions(['bitcoin'])['bitcoin'])
+        assert len(set(seen)) == len(seen), name
+        assert 'ethereum' not in store.read_versions(['bitcoin', 'ethereum']), name
@@ -0,0 +1,49 @@
+"""
+Test Market Service
+In daemon mode the gateway never calls CoinGecko; it serves what the ingester stored
+"""
+from services.market_service import MarketService
+from services.price_service import PriceService
+from services.shared_price_store import SharedPriceStore
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+    
+    def url(self, path):
+        return f'https://api.example/{path}'
+    
+    def get_json(self, url, params=None):
+        self.calls.append(url)
+        return {'url': url, 'params': params}
+
+def make_service(store, upstream_enabled):
+    price_service = PriceService()
+    price_service.use_shared_store(store)
+    price_service.upstream_enabled = upstream_enabled
+    service = MarketService(price_service)
+    service.client = FakeClient()
+    return service
+
+def test_reader_never_calls_upstream(tmp_path):
+    reader = make_service(SharedPriceStore(str(tmp_path / 'prices.db')), upstream_enabled=False)
+    
+    result = reader.get_coin('bitcoin')
+    assert not result['success'] and result['error'] == 'UPSTREAM_UNAVAILABLE'
+    assert reader.client.calls == []
+
+def test_daemon_fills_what_readers_asked_for(tmp_path):
+    store = SharedPriceStore(str(tmp_path / 'prices.db'))
+    reader = make_service(store, upstream_enabled=False)
+    daemon = make_service(store, upstream_enabled=True)
+    
+    assert not reader.get_market_chart('bitcoin', 30)['success']
+    assert not reader.get_global()['success']
+    assert daemon.refresh_demanded() == 2
+    assert daemon.refresh_demanded() == 0  # still fresh, no second upstream call
+    assert len(daemon.client.calls) == 2
+    
+    result = reader.get_market_chart('bitcoin', 30)
+    assert result['success'] and result['data']['params'] == {'vs_currency': 'usd', 'days': '30'}
+    assert reader.get_global()['success']
+    assert reader.client.calls == []
@@ -0,0 +1,53 @@
+"""
+Test Rate Limiter
+Token bucket bursts, refill and the shared SQLite budget
+"""
+from services import rate_limiter, shared_price_store
+from services.rate_limiter import TokenBucket
+from services.shared_price_store import SharedPriceStore, SharedTokenBucket
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+    
+    def __call__(self):
+        return self.now
+
+def test_burst_then_refill(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', clock)
+    bucket = TokenBucket(capacity=5, refill_rate=2)
+    
+    assert all(bucket.try_acquire() for _ in range(5))
+    assert not bucket.try_acquire()
+    
+    clock.now += 0.5  # one token at 2 per second
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    
+    clock.now += 60  # refill stops at capacity
+    assert bucket.available() == 5
+    assert bucket.get_metrics()['acquired'] == 6 and bucket.get_metrics()['rejected'] == 2
+
+def test_acquire_gives_up_when_the_refill_is_past_the_timeout(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', clock)
+    bucket = TokenBucket(capacity=1, refill_rate=0.1)
+    
+    assert bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=5)  # the next token is 10 seconds away
+    clock.now += 10
+    assert bucket.acquire(timeout=0)
+
+def test_shared_bucket_is_one_budget_across_instances(tmp_path, monkeypatch):
+    clock = FakeClock(1700000000.0)
+    monkeypatch.setattr(shared_price_store.time, 'time', clock)
+    store = SharedPriceStore(str(tmp_path / 'prices.db'))
+    first = SharedTokenBucket(store, 'coingecko', capacity=3, refill_rate=1)
+    second = SharedTokenBucket(store, 'coingecko', capacity=3, refill_rate=1)
+    
+    assert first.try_acquire() and second.try_acquire() and first.try_acquire()
+    assert not second.try_acquire()
+    clock.now += 1
+    assert second.try_acquire()
+    assert not first.try_acquire()
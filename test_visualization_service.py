@@ -0,0 +1,58 @@
+"""
+Test Visualization Service
+LTTB downsampling keeps the endpoints and exactly max_points points
+"""
+import math
+from array import array
+from datetime import datetime, timedelta
+
+import pytest
+
+from services import visualization_service
+from services.historical_service import HistoricalService, to_epoch
+from services.visualization_service import lttb_indices
+
+def wave(n):
+    xs = array('d', range(n))
+    ys = array('d', (math.sin(i / 7.0) * 100 + i % 13 for i in range(n)))
+    return xs, ys
+
+@pytest.mark.parametrize('n,max_points', [(1000, 100), (1000, 3), (101, 100), (5000, 999)])
+def test_lttb_keeps_endpoints_and_count(n, max_points):
+    xs, ys = wave(n)
+    kept = lttb_indices(xs, ys, max_points)
+    assert len(kept) == max_points
+    assert kept[0] == 0 and kept[-1] == n - 1
+    assert all(a < b for a, b in zip(kept, kept[1:]))
+
+def test_lttb_small_inputs():
+    xs, ys = wave(10)
+    assert lttb_indices(xs, ys, 10) == list(range(10))
+    assert lttb_indices(xs, ys, 50) == list(range(10))
+    assert lttb_indices(xs, ys, 2) == [0, 9]
+    assert lttb_indices(xs, ys, 1) == [0]
+
+def test_lttb_keeps_the_spike():
+    xs, ys = wave(1000)
+    ys[500] = 10000.0
+    assert 500 in lttb_indices(xs, ys, 50)
+
+def test_lttb_numpy_matches_python(monkeypatch):
+    if visualization_service.numpy is None:
+        pytest.skip('numpy not installed')
+    xs, ys = wave(3000)
+    with_numpy = lttb_indices(xs, ys, 300)
+    monkeypatch.setattr(visualization_service, 'numpy', None)
+    assert lttb_indices(xs, ys, 300) == with_numpy
+
+def test_raw_history_is_downsampled_before_rows_are_built():
+    service = HistoricalService(engine='memory')
+    start = datetime.utcnow() - timedelta(days=1)
+    epoch = to_epoch(start)
+    service.store.write([('bitcoin', epoch + i * 10, 100.0 + math.sin(i), 'coingecko') for i in range(5000)])
+    
+    result = service.get_historical_data('bitcoin', start=start, resolution='raw', max_points=200)
+    assert result['success'] and result['resolution'] == 'raw'
+    assert len(result['data']) == 200
+    assert result['data'][0]['timestamp'] == datetime.utcfromtimestamp(epoch)
+    assert result['data'][-1]['timestamp'] == datetime.utcfromtimestamp(epoch + 49990)